@@ -1,9 +1,8 @@
+import contextlib
 import datetime
-import json
-import logging
 import os
-import sys
-from typing import Dict, Generator, Iterable, List
+import time
+from typing import Callable, Dict, Generator, Iterable, List, Optional
 
 import pytz
 import structlog
@@ -17,40 +16,41 @@ from act.action_stop_forcing_hot_water import StopForcingHotWater
 from act.action_turn_off_power import TurnOffPower
 from act.action_turn_on_power import TurnOnPower
 from act.alter_setting import AlterSetting
-from act.device_infos import DeviceInfo, DeviceInfos
+from act.deadlines import Deadlines
+from act.command_queue import CommandQueue
+from act.decision_latency import DecisionLatency
+from act.device_info_loader import DeviceInfoLoader
+from act.device_info_window import DeviceInfoWindow
+from act.device_infos import DeviceInfos
 from act.effective_temperature import EffectiveTemperature
+from act.installation import Installation
 from act.last_time_stamp import LastTimeStamp
+from act.logging_profile import LoggingProfile
+from act.next_evaluation import EvaluationSchedule, NextEvaluation
 from act.predicate import Predicate
+from act.profiling import Profiling
+from act.redundant_actions import RedundantActions
+from act.run_lock import RunLock
+from act.run_metrics import RunMetrics
+from act.schedule import Schedule
+from act.tracing import Tracer
 from act.simple_checks import SimpleChecks
 
 
 class Act:
-    def __init__(self) -> None:
+    def __init__(self, drain_commands: bool = True) -> None:
+        """Without draining the commands are left queued for a CommandSender"""
+        self.drain_commands = drain_commands
         Act.__configure_logging()
         self.__logger = structlog.get_logger(self.__class__.__name__)
 
     @staticmethod
     def __configure_logging():
-        logging.basicConfig(format="%(message)s", stream=sys.stdout, level=logging.INFO)
-        logging.getLogger("act").setLevel(logging.DEBUG)
-        structlog.configure(
-            processors=[
-                structlog.processors.add_log_level,
-                structlog.processors.StackInfoRenderer(),
-                structlog.dev.set_exc_info,
-                structlog.processors.CallsiteParameterAdder([structlog.processors.CallsiteParameter.MODULE, structlog.processors.CallsiteParameter.FUNC_NAME]),
-                structlog.contextvars.merge_contextvars,
-                structlog.processors.TimeStamper("iso"),
-                structlog.dev.ConsoleRenderer(),
-            ],
-            wrapper_class=structlog.make_filtering_bound_logger(logging.NOTSET),
-            context_class=dict,
-            logger_factory=structlog.PrintLoggerFactory(),
-            cache_logger_on_first_use=False,
-        )
+        LoggingProfile.configure(os.environ.get("ACT_LOG_PROFILE", "console"))
 
     def act(
         self,
+        *,
         calculation_moment: str = typer.Option(
             default="now",
             help="Run as though it is this UTC moment in ISO8601 format.",
@@ -59,6 +59,25 @@ class Act:
             default=False,
             help="Run without sending commands.",
         ),
+        metrics_file: Optional[str] = typer.Option(
+            default=None,
+            envvar="ACT_METRICS_FILE",
+            help="Also write the run's timings to this Prometheus textfile collector file.",
+        ),
+        trace_file: Optional[str] = typer.Option(
+            default=None,
+            envvar="ACT_TRACE_FILE",
+            help="Write nested spans for the run to this Chrome trace event file.",
+        ),
+        profile: Optional[str] = typer.Option(
+            default=None,
+            help="Profile the run, writing pstats and allocations named after the calculation moment into this folder.",
+        ),
+        adaptive: bool = typer.Option(
+            default=False,
+            envvar="ACT_ADAPTIVE",
+            help="Skip runs until the next moment anything could change, unless the device info changes first.",
+        ),
     ):
         """
         Instruct the heatpump to perform actions.
@@ -71,34 +90,115 @@ class Act:
         local_time_zone = pytz.timezone("UTC")
         local_dt = local_time_zone.localize(calculation_moment_datetime)
 
+        metrics = RunMetrics()
+        tracer = Tracer()
+        try:
+            with metrics.collect(), contextlib.ExitStack() as tracing:
+                if trace_file:
+                    tracing.enter_context(tracer.collect())
+                with RunLock.for_state_root().hold() as acquired:
+                    if acquired:
+                        self.__adaptively(local_dt, dry_run, profile, adaptive)
+        finally:
+            metrics.emit()
+            if metrics_file:
+                metrics.write_prometheus(metrics_file)
+            if trace_file:
+                tracer.write(trace_file)
+
+    def __adaptively(self, local_dt: datetime.datetime, dry_run: bool, profile: Optional[str], adaptive: bool) -> None:
+        schedule = EvaluationSchedule.for_state_root() if adaptive else None
+        if schedule is not None:
+            with RunMetrics.measure("next_evaluation"):
+                skip = schedule.should_skip(local_dt)
+            if skip:
+                return
+
+        next_evaluation = NextEvaluation(local_dt)
+        with next_evaluation.collect() if schedule is not None else contextlib.nullcontext(), Deadlines.for_run().collect():
+            with Profiling.profile(profile, "act_{:%Y-%m-%dT%H%M%S}".format(local_dt)), Tracer.span("run", calculation_moment=local_dt.isoformat()):
+                self.__act(local_dt, dry_run)
+
+        if schedule is not None:
+            schedule.save(next_evaluation)
+
+    def __act(self, local_dt: datetime.datetime, dry_run: bool) -> None:
+        started = time.perf_counter()
+        latency = DecisionLatency(local_dt.isoformat())
+
         self.__logger.info("Calculation moment", calculation_moment=local_dt.isoformat())
         self.__logger.info("Units", time="Seconds", temperature="Celsius", power="Watts")
         if dry_run:
             self.__logger.debug("Using dry run so will not send commands to heat pump")
 
-        device_infos = list(self.__get_latest_device_infos(local_dt))
-        device_infos.reverse()
-        if len(device_infos) == 0:
-            self.__logger.exception("No device information files were found")
+        device_infos = self.__load_device_infos(local_dt)
+        self.describe_device_infos_being_operated_on(device_infos)
+        if device_infos:
+            latency.device_age_seconds = (local_dt - LastTimeStamp.last_time_stamp_in_utc(device_infos[-1])).total_seconds()
+
+        self.__log_effective_temperature(local_dt)
 
+        if not self.actions_should_be_blocked(device_infos):
+            self.__logger.info("Actions were not blocked")
+            non_conflicting_actions = self.decide(local_dt, device_infos)
+            latency.evaluation_seconds = time.perf_counter() - started
+            self.__send(dry_run, device_infos, non_conflicting_actions, latency)
+        else:
+            latency.evaluation_seconds = time.perf_counter() - started
+
+        self.__record_latency(dry_run, latency)
+
+    def __load_device_infos(self, local_dt: datetime.datetime) -> DeviceInfoWindow:
         now = datetime.datetime.utcnow()
         utc = pytz.timezone("UTC")
         utc_now = utc.localize(now)
 
-        if (utc_now - local_dt).total_seconds() > 59:
-            structlog.get_logger().debug("Older runs would not have had access to the very latest device info when they ran")
-            device_infos = device_infos[:-1]
+        without_newest = (utc_now - local_dt).total_seconds() > 59
+        if without_newest:
+            self.__logger.debug("Older runs would not have had access to the very latest device info when they ran")
 
-        self.describe_device_infos_being_operated_on(device_infos)
-
-        self.__log_effective_temperature(local_dt)
+        with RunMetrics.measure("load"):
+            device_infos = DeviceInfoLoader().window(local_dt, without_newest=without_newest)
+        if len(device_infos) == 0:
+            self.__logger.exception("No device information files were found")
+        return device_infos
 
-        if not self.actions_should_be_blocked(device_infos):
-            self.__logger.info("Actions were not blocked")
+    def decide(self, local_dt: datetime.datetime, device_infos: DeviceInfoWindow) -> List[Action]:
+        """The actions worth sending once the blockers have had their say, which is also what the simulator applies"""
+        with Tracer.span("gather"):
             non_conflicting_actions = list(self.get_non_conflicting_actions(local_dt, device_infos))
-            self.__logger.debug("Non-conflicting actions", size=len(non_conflicting_actions))
+        self.__logger.debug("Non-conflicting actions", size=len(non_conflicting_actions))
+        with RunMetrics.measure("dedup"):
+            non_conflicting_actions = RedundantActions.remove(non_conflicting_actions, device_infos[-1])
 
-            self.perform_actions(dry_run, device_infos, non_conflicting_actions)
+        if non_conflicting_actions:
+            NextEvaluation.hint(local_dt, "Commands were sent so see what they did")
+        else:
+            self.__hint_schedule_transitions(local_dt)
+        return non_conflicting_actions
+
+    def __send(self, dry_run: bool, device_infos: DeviceInfoWindow, non_conflicting_actions: List[Action], latency: DecisionLatency) -> None:
+        started = time.perf_counter()
+        self.perform_actions(dry_run, device_infos, non_conflicting_actions)
+        if dry_run:
+            return
+
+        latency.actions = len(non_conflicting_actions)
+        if self.drain_commands:
+            sent = CommandQueue.for_state_root().drain(deadline_seconds=float(Installation.setting("ACT_COMMAND_DRAIN_SECONDS", "60")))
+            # Queued commands are acknowledged by a CommandSender later, so only a run which sent them itself knows how long that took
+            if sent:
+                latency.send_seconds = time.perf_counter() - started
+
+    def __record_latency(self, dry_run: bool, latency: DecisionLatency) -> None:
+        deadlines = Deadlines.current()
+        if deadlines is not None and deadlines.degraded:
+            latency.degraded = sorted(deadlines.degraded)
+            self.__logger.warning("Decided without some of the inputs", degraded=deadlines.degraded)
+
+        self.__logger.info("Decision latency", **latency.as_dict())
+        if not dry_run:
+            latency.record()
 
     def change(self, dry_run: bool, action: Action):
         prefix = ""
@@ -108,7 +208,7 @@ class Act:
         self.__logger.info(f"{prefix}{action.message}")
 
         if not dry_run:
-            AlterSetting().send_update_to_melcloud(action.name, str(action.value), action.message, action.source, shoosh=True)
+            CommandQueue.for_state_root().enqueue(action)
 
     def perform_actions(
         self,
@@ -117,8 +217,9 @@ class Act:
         gathered_actions: List[Action],
     ) -> None:
         if gathered_actions:
-            for action in gathered_actions:
-                self.__logger.debug(f"{action.message} ({action.name} -> {action.value} from {action.source})")
+            # Safety actions are sent first in case MELCloud's rate limit means the rest have to wait
+            for action in sorted(gathered_actions, key=lambda action: not AlterSetting.is_safety_critical(action.name, action.value)):
+                self.__logger.debug(action.message, name=action.name, value=action.value, source=action.source)
                 self.change(dry_run, action)
         else:
             self.__logger.debug("No actions desired by any of the providers")
@@ -132,7 +233,9 @@ class Act:
         ]
 
         for predicate in blockers:
-            if predicate(device_infos):
+            with RunMetrics.measure(f"blocker.{predicate.__name__}"):
+                blocked = predicate(device_infos)
+            if blocked:
                 self.__logger.info("Predicate blocked actions", predicate=predicate.__name__)
                 return True
 
@@ -141,8 +244,10 @@ class Act:
         return False
 
     def get_non_conflicting_actions(self, calculation_moment: datetime.datetime, device_infos: DeviceInfos) -> Generator[Action, None, None]:
-        gathered_actions = self.gather_actions(calculation_moment, device_infos)
+        return Act.resolve_conflicts(self.gather_actions(calculation_moment, device_infos))
 
+    @staticmethod
+    def resolve_conflicts(gathered_actions: Iterable[Action]) -> Generator[Action, None, None]:
         actions_by_setting_name: Dict = {}
 
         for action in gathered_actions:
@@ -159,8 +264,9 @@ class Act:
                 actions_by_setting_name[action.name] = action
                 yield action
 
-    def gather_actions(self, calculation_moment: datetime.datetime, device_infos: DeviceInfos) -> Generator[Action, None, None]:
-        action_providers = [
+    @staticmethod
+    def action_providers() -> List[Callable[[datetime.datetime, DeviceInfos], Optional[Iterable[Action]]]]:
+        return [
             TurnOffPower.turn_off_power,
             TurnOnPower.turn_on_power,
             StopForcingHotWater.stop_forcing_hot_water,
@@ -169,17 +275,17 @@ class Act:
             EnsureZone1FlowTemperatureIsCorrect.ensure_target_flow_temp_at_maximum,
         ]
 
-        for action_provider in action_providers:
+    def gather_actions(self, calculation_moment: datetime.datetime, device_infos: DeviceInfos) -> Generator[Action, None, None]:
+        for action_provider in Act.action_providers():
             try:
-                generator = action_provider(calculation_moment, device_infos)
-                if not generator is None:
-                    actions = list(generator)
-                    if actions:
-                        for action in actions:
-                            action.source = action_provider.__qualname__
-                            yield action
-                    else:
-                        self.__logger.debug("No actions desired", action=action_provider.__qualname__)
+                # Providers are often generators so the time is only spent once they're listed
+                with RunMetrics.measure(f"provider.{action_provider.__qualname__}"):
+                    generator = action_provider(calculation_moment, device_infos)
+                    actions = None if generator is None else list(generator)
+                if actions:
+                    for action in actions:
+                        action.source = action_provider.__qualname__
+                        yield action
                 else:
                     self.__logger.debug("No actions desired", action=action_provider.__qualname__)
             except Exception as err:
@@ -187,6 +293,13 @@ class Act:
                 # logging.error("Problem getting actions from " + actionProvider.__qualname__, err)
                 raise
 
+    @staticmethod
+    def __hint_schedule_transitions(calculation_moment: datetime.datetime) -> None:
+        if NextEvaluation.current() is None:
+            return
+        for job_name in [Schedule.on_job_name(), Schedule.off_job_name()]:
+            NextEvaluation.hint(Schedule.next_job_moment(calculation_moment, job_name), f"The schedule has a {job_name} job")
+
     def __log_effective_temperature(self, calculation_moment: datetime.datetime):
         try:
             effective_outdoor_temperature = EffectiveTemperature.apparent_temp(calculation_moment)
@@ -197,37 +310,6 @@ class Act:
     def describe_device_infos_being_operated_on(self, device_infos):
         self.__logger.debug("Device infos being used", size=len(device_infos), newest=LastTimeStamp.last_time_stamp_in_utc(device_infos[-1]).isoformat())
 
-    def __get_latest_device_infos(self, calculation_moment: datetime.datetime) -> Generator[DeviceInfo, None, None]:
-        yield_counter = 600
-
-        devices_folder = os.path.join("/state", "downloads", "raw")
-        self.__logger.debug("Loading device info", source=devices_folder)
-
-        for root, dirs, files in os.walk(devices_folder, topdown=True):
-            dirs.sort(reverse=True)
-            files.sort(reverse=True)
-            device_files = [fileName for fileName in files if fileName.startswith("devices_")]
-            for file in device_files:
-                file_path = os.path.join(root, file)
-                with open(file_path, encoding="utf-8") as devices:
-                    try:
-                        device_info: DeviceInfo = json.load(devices)[0]["Structure"]["Devices"][0]["Device"]
-                    except:
-                        continue
-
-                    last_time_stamp = LastTimeStamp.last_time_stamp_in_utc(device_info)
-
-                    if last_time_stamp <= calculation_moment:
-                        try:
-                            del device_info["ListHistory24Formatters"]
-                        except:
-                            pass
-
-                        yield device_info
-                        yield_counter += -1
-                        if yield_counter <= 0:
-                            return
-
 
 if __name__ == "__main__":
     typer.run(Act().act)
@@ -5,8 +5,11 @@ import structlog
 
 from .action import Action
 from .device_infos import DeviceInfos
+from .next_evaluation import NextEvaluation
 from .target_water_temperature import TargetWaterTemperature
 
+logger = structlog.get_logger()
+
 
 # --------------------------------------------------------------------------------
 class Covid:
@@ -24,14 +27,14 @@ class Covid:
         desired = TargetWaterTemperature.target_tank_temperature(calculation_moment, device_infos)
         tolerable = desired - 8
         if current_tank_temperature > tolerable:
-            structlog.get_logger().debug(
+            logger.debug(
                 "The tank temperature is higher than the tolerable temperature so we're going to leave it alone",
                 current_tank_temperature=current_tank_temperature,
                 tolerable=tolerable,
             )
             return
 
-        structlog.get_logger().debug("We need to do something to heat the tank up")
+        logger.debug("We need to do something to heat the tank up")
         set_temperature = float(latest_device_info["SetTankWaterTemperature"])
         if desired > set_temperature:
             yield Action(
@@ -67,6 +70,7 @@ class Covid:
         calculation_moment: datetime.datetime,
         device_infos: DeviceInfos,
     ):
+        NextEvaluation.hint_time_of_day(calculation_moment, [datetime.time(2), datetime.time(7)], "The peaceful overnight hours start or end")
         if calculation_moment.hour > 1 and calculation_moment.hour < 7:
             # Allow things to be more peaceful overnight
             return True
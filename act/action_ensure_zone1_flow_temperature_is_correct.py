@@ -6,9 +6,12 @@ import structlog
 
 from .action import Action
 from .action_manage_power_state_for_space_heating import ManageSpaceHeatingPower
+from .device_info_window import DeviceInfoWindow
 from .device_infos import DeviceInfos
 from .temperature_thresholds import TemperatureThresholds
 
+logger = structlog.get_logger()
+
 
 # --------------------------------------------------------------------------------
 class EnsureZone1FlowTemperatureIsCorrect:
@@ -29,12 +32,11 @@ class EnsureZone1FlowTemperatureIsCorrect:
 
         reason = "to create an appropriate level of demand on the heat pump"
 
-        recent_infos = device_infos[-5:]
-        recent_average_temp = statistics.mean([float(device_info["OutdoorTemperature"]) for device_info in recent_infos])
+        recent_average_temp = DeviceInfoWindow.of(device_infos).rolling("OutdoorTemperature", 5).mean
 
         max_flow_temp = TemperatureThresholds.max_flow_temp(calculation_moment, device_infos)
 
-        structlog.get_logger().debug("Recent outdoor temp", recent_average_temp=recent_average_temp)
+        logger.debug("Recent outdoor temp", recent_average_temp=recent_average_temp)
         if recent_average_temp > 9:
             # The pump switches itself off too soon to be gently managed
             # We're certainly going to be in an on-off cycle. The off cycles might be an hour or more
@@ -76,12 +78,12 @@ class EnsureZone1FlowTemperatureIsCorrect:
         max_flow_temp = TemperatureThresholds.max_flow_temp(calculation_moment, device_infos)
         if (flow_temperature - 10) >= max_flow_temp:
             suggestion = max_flow_temp - 2
-            structlog.get_logger().debug("Suggesting a new flow target temperature because the flow is really hot", suggestion=suggestion, flow_temperature=flow_temperature)
+            logger.debug("Suggesting a new flow target temperature because the flow is really hot", suggestion=suggestion, flow_temperature=flow_temperature)
             return suggestion
 
         if flow_temperature >= current_target_temperature:
             suggestion = min(max_flow_temp, flow_temperature + 2)
-            structlog.get_logger().debug(
+            logger.debug(
                 "Suggesting a new flow target temperature because the flow is already higher than the current target temperature",
                 suggestion=suggestion,
                 flow_temperature=flow_temperature,
@@ -91,7 +93,7 @@ class EnsureZone1FlowTemperatureIsCorrect:
 
         if flow_temperature < current_target_temperature - 10:
             suggestion = max(25, min(max_flow_temp, flow_temperature + 2))
-            structlog.get_logger().debug(
+            logger.debug(
                 "Suggesting a new flow target temperature because the flow is much lower than the current target temperature",
                 suggestion=suggestion,
                 flow_temperature=flow_temperature,
@@ -118,32 +120,27 @@ class EnsureZone1FlowTemperatureIsCorrect:
 
         if current_frequency < 40:
             if current_frequency < previous_frequency:
-                structlog.get_logger().debug("The power level has dropped", previous_frequency=previous_frequency, current_frequency=current_frequency)
+                logger.debug("The power level has dropped", previous_frequency=previous_frequency, current_frequency=current_frequency)
 
                 if float(latest_device_info["FlowTemperature"]) >= current_target_temperature:
                     new_target_temperature = float(latest_device_info["FlowTemperature"]) + 2
-                    structlog.get_logger().debug(
-                        "Pushing the target temp to "
-                        + str(new_target_temperature)
-                        + " because the flow of "
-                        + str(float(latest_device_info["FlowTemperature"]))
-                        + " °C is already at least as warm as the current target temperature of "
-                        + str(current_target_temperature)
-                        + " °C"
+                    logger.debug(
+                        "Pushing the target temp because the flow is already at least as warm as the current target temperature",
+                        new_target_temperature=new_target_temperature,
+                        flow_temperature=float(latest_device_info["FlowTemperature"]),
+                        current_target_temperature=current_target_temperature,
                     )
                 else:
                     # It's winding down because the flow is warm enough
                     # If we've bumped up the target recently then give it another iteration to catch up
                     if current_target_temperature > device_infos[-2]["TargetHCTemperatureZone1"] or current_target_temperature > device_infos[-3]["TargetHCTemperatureZone1"]:
-                        structlog.get_logger().debug("Leaving target alone because it was only recently increased", currentTargetTemperature=current_target_temperature)
+                        logger.debug("Leaving target alone because it was only recently increased", currentTargetTemperature=current_target_temperature)
                     else:
                         new_target_temperature = current_target_temperature + 2
                         if current_frequency < 28:
                             # It's very close to being gone so give it a bigger nudge
                             new_target_temperature = current_target_temperature + 3
-                            structlog.get_logger().debug(
-                                "Pushing the target temperature because it looks like the pump is about to stop", newTargetTemperature=new_target_temperature
-                            )
+                            logger.debug("Pushing the target temperature because it looks like the pump is about to stop", newTargetTemperature=new_target_temperature)
             else:
                 batch = device_infos[-4:-2]
 
@@ -172,10 +169,10 @@ class EnsureZone1FlowTemperatureIsCorrect:
             new_target_temperature = max_temp
             if current_target_temperature != new_target_temperature:
                 # Only debug when it's interesting
-                structlog.get_logger().debug("Although the heat pump is winding down, we're limiting the target temp to the max", newTargetTemperature=new_target_temperature)
+                logger.debug("Although the heat pump is winding down, we're limiting the target temp to the max", newTargetTemperature=new_target_temperature)
         else:
             pass
-            # structlog.get_logger().debug(
+            # logger.debug(
             #     "The heat pump is starting to wind down so increase the desired target temperature to create some demand", newTargetTemperature=new_target_temperature
             # )
 
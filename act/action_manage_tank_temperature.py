@@ -1,15 +1,18 @@
 import datetime
-import statistics
 from typing import Generator
 
 import structlog
 
 from .action import Action
+from .device_info_window import DeviceInfoWindow
 from .device_infos import DeviceInfos
 from .last_time_stamp import LastTimeStamp
+from .next_evaluation import NextEvaluation
 from .target_water_temperature import TargetWaterTemperature
 from .temperature_thresholds import TemperatureThresholds
 
+logger = structlog.get_logger()
+
 
 # --------------------------------------------------------------------------------
 class ManageTankTemperature:
@@ -26,9 +29,9 @@ class ManageTankTemperature:
         return LastTimeStamp.last_time_stamp_in_utc(latest_device_info)
 
     @staticmethod
-    def __was_recently_heating_water(device_infos: DeviceInfos) -> bool:
+    def __was_recently_heating_water(device_infos: DeviceInfos, batch_size: int) -> bool:
         # Even if not forced, we are willing to let it carry on if it's getting hotter
-        hot_water_energy_used = sum([device_info["HotWaterEnergyConsumedRate1"] for device_info in device_infos])
+        hot_water_energy_used = DeviceInfoWindow.of(device_infos).rolling("HotWaterEnergyConsumedRate1", batch_size).total
 
         return hot_water_energy_used > 0
 
@@ -40,32 +43,40 @@ class ManageTankTemperature:
         latest_device_info = device_infos[-1]
 
         current_target = float(latest_device_info["SetTankWaterTemperature"])
+        if latest_device_info["ForcedHotWaterMode"]:
+            NextEvaluation.hint(calculation_moment, "Hot water is being forced")
+        else:
+            NextEvaluation.hint_near(
+                calculation_moment,
+                latest_device_info,
+                "TankWaterTemperature",
+                [current_target, TemperatureThresholds.shutdown_water_at_this_temperature()],
+                "The tank is close to its target or shutdown temperature",
+            )
         if current_target >= TemperatureThresholds.shutdown_water_at_this_temperature():
             # Let's see if we should override this high temp
             batch_size = 10
-            last_batch_targets = [float(device_info["SetTankWaterTemperature"]) for device_info in device_infos[-batch_size:]]
+            last_batch_targets = DeviceInfoWindow.of(device_infos).rolling("SetTankWaterTemperature", batch_size)
 
             # We use the mean because it can wobble about a bit and we don't want to be too reactive
-            mean_tank_temperature = statistics.mean(last_batch_targets)
+            mean_tank_temperature = last_batch_targets.mean
             when_was_target_set = ManageTankTemperature.__when_was_target_set_above_threshold(device_infos, TemperatureThresholds.legionella_tank_set_temp())
 
             if mean_tank_temperature >= TemperatureThresholds.shutdown_water_at_this_temperature():
-                if ManageTankTemperature.__was_recently_heating_water(device_infos[-batch_size:]):
-                    structlog.get_logger().debug("Water has been heated in the last batch of cycles so leaving it alone", batch_size=batch_size)
+                if ManageTankTemperature.__was_recently_heating_water(device_infos, batch_size):
+                    logger.debug("Water has been heated in the last batch of cycles so leaving it alone", batch_size=batch_size)
                     return
 
                 # It's been running this way for a while and has had chance to respond
                 if latest_device_info["ForcedHotWaterMode"]:
-                    structlog.get_logger().debug(
-                        "Hot water is being forced so leaving it alone", current_target=current_target, when_was_target_set=when_was_target_set.isoformat()
-                    )
+                    logger.debug("Hot water is being forced so leaving it alone", current_target=current_target, when_was_target_set=when_was_target_set.isoformat())
                     return
 
                 # It's not heating the water now so we are free to take back control
 
             else:
                 # It's only been there for a short time, the system maybe be getting going
-                structlog.get_logger().debug(
+                logger.debug(
                     "Hot water was recently pushed to the current target so leaving it alone whilst it gets on with that",
                     current_target=current_target,
                     when_was_target_set=when_was_target_set.isoformat(),
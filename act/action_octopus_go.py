@@ -1,6 +1,7 @@
 import datetime
 
 from .device_infos import DeviceInfos
+from .next_evaluation import NextEvaluation
 
 
 # --------------------------------------------------------------------------------
@@ -11,6 +12,7 @@ class OctopusGo:
         device_infos: DeviceInfos,
     ) -> bool:
         # Yep, just a boolean on the simple tarriff
+        NextEvaluation.hint_time_of_day(calculation_moment, [datetime.time(0, 31), datetime.time(4, 15)], "The cheap Octopus Go window starts or ends")
 
         if calculation_moment.hour == 0 and calculation_moment.minute > 30:
             return True
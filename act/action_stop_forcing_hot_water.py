@@ -3,6 +3,7 @@ from typing import Generator
 
 from .action import Action
 from .device_infos import DeviceInfos
+from .next_evaluation import NextEvaluation
 from .schedule import Schedule
 from .temperature_thresholds import TemperatureThresholds
 
@@ -19,6 +20,9 @@ class StopForcingHotWater:
         if not device_info["ForcedHotWaterMode"]:
             return
 
+        # The tank warms by less than the noticed change between runs, so forcing must be stopped the run it gets hot enough
+        NextEvaluation.hint(calculation_moment, "Forced hot water stops as soon as the tank is hot enough")
+
         tank_temp = float(device_info["TankWaterTemperature"])
         current_target = float(device_info["SetTankWaterTemperature"])
 
@@ -5,9 +5,13 @@ import structlog
 
 from .action import Action
 from .action_turn_on_power import TurnOnPower
+from .device_info_window import DeviceInfoWindow
 from .device_infos import DeviceInfos
+from .rolling_aggregate import RollingAggregate
 from .temperature_thresholds import TemperatureThresholds
 
+logger = structlog.get_logger()
+
 
 # --------------------------------------------------------------------------------
 class TurnOffPower:
@@ -32,7 +36,7 @@ class TurnOffPower:
                 current_tank_temperature = float(latest_device_info["TankWaterTemperature"])
                 if current_tank_temperature:
                     if current_tank_temperature < (target_temperature - 2):
-                        structlog.get_logger().debug(
+                        logger.debug(
                             "Not looking to turn off because the water was recently forced on but hasn't got near to the target temperature of "
                             + str(target_temperature)
                             + " °C yet. It's at "
@@ -41,8 +45,9 @@ class TurnOffPower:
                         )
                         return
 
-        was_recent_demand = TurnOffPower.was_demand(device_infos[-3:])
-        was_demand_a_while_back = TurnOffPower.was_demand(device_infos[-6:-3])
+        window = DeviceInfoWindow.of(device_infos)
+        was_recent_demand = TurnOffPower.was_demand_in(window.rolling("HeatPumpFrequency", 3))
+        was_demand_a_while_back = TurnOffPower.was_demand_in(window.rolling("HeatPumpFrequency", 3, lag=3))
 
         min_temp = TemperatureThresholds.min_flow_temp(calculation_moment, device_infos)
         current_flow = float(latest_device_info["FlowTemperature"])
@@ -55,7 +60,7 @@ class TurnOffPower:
                     "The heat pump doesn't think it's worth continuing to generate heat so turning it off",
                 )
             else:
-                structlog.get_logger().debug(
+                logger.debug(
                     "Even though the heatpump doesn't seem to want to do work at the moment, the flow is only "
                     + str(current_flow)
                     + " °C so not turning off because the min flow temp is "
@@ -65,16 +70,21 @@ class TurnOffPower:
 
     @staticmethod
     def was_stable_flow_temperature(device_infos: DeviceInfos) -> bool:
-        recent_flow_temps = [float(deviceInfo["FlowTemperature"]) for deviceInfo in device_infos[-10:]]
-        delta = max(recent_flow_temps) - min(recent_flow_temps)
-        structlog.get_logger().debug("The flow temperature delta over the last readings in °C", size=len(recent_flow_temps), delta=delta)
-        if max(recent_flow_temps) - min(recent_flow_temps) <= 1:
+        recent_flow_temps = DeviceInfoWindow.of(device_infos).rolling("FlowTemperature", 10)
+        delta = recent_flow_temps.maximum - recent_flow_temps.minimum
+        logger.debug("The flow temperature delta over the last readings in °C", size=recent_flow_temps.count, delta=delta)
+        if delta <= 1:
             return True
         return False
 
     @staticmethod
     def was_demand(device_infos: DeviceInfos) -> bool:
-        return sum([float(device_info["HeatPumpFrequency"]) for device_info in device_infos]) != 0
+        return sum(float(device_info["HeatPumpFrequency"]) for device_info in device_infos) != 0
+
+    @staticmethod
+    def was_demand_in(recent_frequencies: RollingAggregate) -> bool:
+        """The same as was_demand, from an aggregate the window keeps up to date"""
+        return recent_frequencies.total != 0
 
     @staticmethod
     def was_forced_hot_water(device_infos: DeviceInfos) -> bool:
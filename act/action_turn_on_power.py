@@ -8,8 +8,12 @@ from .action import Action
 from .action_covid import Covid
 from .device_infos import DeviceInfos
 from .effective_temperature import EffectiveTemperature
+from .next_evaluation import NextEvaluation
 from .schedule import Schedule
 from .state_change import StateChange
+from .tracing import Tracer
+
+logger = structlog.get_logger()
 
 
 # --------------------------------------------------------------------------------
@@ -18,7 +22,7 @@ class TurnOnPower:
     def turn_on_power(calculation_moment: datetime.datetime, device_infos: DeviceInfos) -> Generator[Action, None, None]:
         current_power = device_infos[-1]["Power"]
 
-        structlog.get_logger().debug("Current power state", current_power=current_power)
+        logger.debug("Current power state", current_power=current_power)
 
         if not current_power:
             reason = TurnOnPower.should_turn_on_power(calculation_moment, device_infos)
@@ -26,6 +30,7 @@ class TurnOnPower:
                 yield Action("Power", "true", reason)
 
     @staticmethod
+    @Tracer.traced
     def should_turn_on_power(calculation_moment: datetime.datetime, device_infos: DeviceInfos) -> Optional[str]:
         if not Covid.can_be_powered_off(calculation_moment, device_infos):
             return "COVID mode indicates we need the heating on"
@@ -53,7 +58,7 @@ class TurnOnPower:
             # Let's find out when the next planned on time is
             next_allowed_on_time = Schedule.next_job_moment(calculation_moment, Schedule.on_job_name())
             if next_allowed_on_time:
-                structlog.get_logger().debug("The next time heating is allowed", next_allowed_on_time=next_allowed_on_time.isoformat())
+                logger.debug("The next time heating is allowed", next_allowed_on_time=next_allowed_on_time.isoformat())
 
         return None
 
@@ -64,16 +69,18 @@ class TurnOnPower:
         if last_heating:
             time_since_last_heating = calculation_moment - last_heating
             threshold = 900
+            NextEvaluation.hint_time_of_day(calculation_moment, [datetime.time(1), datetime.time(5)], "The night's longer dwell starts or ends")
             if calculation_moment.hour > 0 and calculation_moment.hour < 5:
                 # Be less reactive during the night
                 threshold = threshold * 2
 
             if time_since_last_heating.total_seconds() < threshold:
-                structlog.get_logger().debug(
+                logger.debug(
                     "Should dwell since the heating was last on recntly (less than the threshold)",
                     threshold=threshold,
                     time_since_last_heating=time_since_last_heating.total_seconds(),
                 )
+                NextEvaluation.hint(last_heating + datetime.timedelta(seconds=threshold), "Dwelling since the heating was last on")
                 return True
 
         return False
@@ -88,14 +95,14 @@ class TurnOnPower:
         # Can we get a better temperature?
         try:
             effective_temperature = EffectiveTemperature.apparent_temp(calculation_moment)
-            structlog.get_logger().debug(
+            logger.debug(
                 "Effective temperature comparison",
                 effective_temperature=effective_temperature,
                 outdoor_temperature=outdoor_temperature,
                 delta=round(effective_temperature - outdoor_temperature, 2),
             )
         except:
-            structlog.get_logger().warning("Unable to get effective temperature", exception_type=sys.exc_info()[0], exception=sys.exc_info()[1])
+            logger.warning("Unable to get effective temperature", exception_type=sys.exc_info()[0], exception=sys.exc_info()[1])
 
         # The efficiency is very low when it's cold so don't be too trigger happy
         too_cold = -4
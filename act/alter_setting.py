@@ -1,13 +1,19 @@
 import json
 import os
 from datetime import datetime
-from typing import Any, Union
+from typing import Any, Optional, Union
 
 import structlog
 import typer
 import urllib3
 from dotenv import load_dotenv
 
+from act.installation import Installation
+from act.profiling import Profiling
+from act.rate_limiter import TokenBucket
+from act.run_metrics import RunMetrics
+from act.state_paths import StatePaths
+
 load_dotenv()
 
 
@@ -17,12 +23,13 @@ class AlterSetting:
         self.__logger = structlog.get_logger(self.__class__.__name__)
 
     def record_action(self, name: str, value: Any, message: str, source: str) -> None:
-        if not os.path.exists("/state"):
+        state_root = StatePaths.state_root()
+        if not os.path.exists(state_root):
             return
 
         effective_moment = datetime.utcnow()
         actions_folder = os.path.join(
-            "/state",
+            state_root,
             "actions",
             "raw",
             "{:%Y}".format(effective_moment),
@@ -39,7 +46,7 @@ class AlterSetting:
             f"{ effective_moment.isoformat() }_{ name }_{ value }.json",
         )
         with open(path, "w+t", encoding="utf-8") as action_file:
-            self.__logger.debug(f"Saving '{name}' action to {path}")
+            self.__logger.debug("Saving action", name=name, path=path)
             json.dump(
                 {
                     "name": name,
@@ -56,6 +63,7 @@ class AlterSetting:
     # --------------------------------------------------------------------------------
     def alter_setting(
         self,
+        *,
         name: str = typer.Option(
             default="SetTankWaterTemperature",
             help="Setting name",
@@ -67,24 +75,37 @@ class AlterSetting:
         message: str = typer.Option(default="Specified on command line"),
         source: str = typer.Option(default="AlterSetting.main"),
         shoosh: bool = False,
+        profile: Optional[str] = typer.Option(
+            default=None,
+            help="Profile the update, writing pstats and allocations named after the moment into this folder.",
+        ),
     ) -> None:
         """
         Instruct the heatpump to alter a setting.
         """
 
-        self.send_update_to_melcloud(name, value, message, source, shoosh)
+        with Profiling.profile(profile, "alter_setting_{:%Y-%m-%dT%H%M%S}_{}".format(datetime.utcnow(), name)):
+            self.send_update_to_melcloud(name, value, message, source, shoosh)
 
     # --------------------------------------------------------------------------------
     def send_update_to_melcloud(self, name: str, value: Union[str, int], message: str, source: str, shoosh: bool = False) -> None:
+        """The action is only journalled once MELCloud has accepted it, because the journal is taken as what the heat pump was told"""
+        self.post_update(name, value, shoosh)
         self.record_action(name, value, message, source)
 
-        http = urllib3.PoolManager()
+    # --------------------------------------------------------------------------------
+    def post_update(self, name: str, value: Union[str, int], shoosh: bool = False) -> None:
+        """Only the requests to MELCloud, each given up on after ACT_MELCLOUD_TIMEOUT_SECONDS so a stalled one can be retried later"""
+        timeout = float(Installation.setting("ACT_MELCLOUD_TIMEOUT_SECONDS", "30"))
+        http = urllib3.PoolManager(timeout=urllib3.Timeout(connect=timeout, read=timeout))
+        rate_limiter = TokenBucket.for_melcloud()
+        priority = AlterSetting.is_safety_critical(name, value)
 
-        base_url = "https://app.melcloud.com/Mitsubishi.Wifi.Client/"
+        base_url = Installation.setting("MELCLOUD_URL", "https://app.melcloud.com/Mitsubishi.Wifi.Client/")
 
         headers = {
             "Content-Type": "application/json; charset=utf-8",
-            "X-MitsContextKey": os.environ["MITS_CONTEXT_KEY"],
+            "X-MitsContextKey": Installation.setting("MITS_CONTEXT_KEY"),
         }
 
         # EffectiveFlags - setting name
@@ -119,13 +140,15 @@ class AlterSetting:
         }
 
         # Read the current values because some of the updategrams require multiple settings and we don't know the current value for the other settings
-        fake = {"EffectiveFlags": 0, "DeviceID": os.environ["DEVICE_ID"], "DeviceType": 1}
-        request = http.request(
-            "POST",
-            f"{base_url}Device/SetAtw",
-            headers=headers,
-            body=json.dumps(fake).encode("utf-8"),
-        )
+        fake = {"EffectiveFlags": 0, "DeviceID": Installation.setting("DEVICE_ID"), "DeviceType": 1}
+        rate_limiter.acquire(priority)
+        with RunMetrics.measure("melcloud"):
+            request = http.request(
+                "POST",
+                f"{base_url}Device/SetAtw",
+                headers=headers,
+                body=json.dumps(fake).encode("utf-8"),
+            )
 
         update_gram = json.loads(request.data.decode("utf-8"))
 
@@ -144,11 +167,21 @@ class AlterSetting:
 
         if not shoosh:
             self.__logger.info("Sending update...")
-        request = http.request("POST", f"{base_url}Device/SetAtw", headers=headers, body=body)
+        rate_limiter.acquire(priority)
+        with RunMetrics.measure("melcloud"):
+            request = http.request("POST", f"{base_url}Device/SetAtw", headers=headers, body=body)
+        if request.status >= 400:
+            raise Exception(f"MELCloud refused the update of {name} to {value} with status {request.status}")
 
         if not shoosh:
             self.__logger.info(request.data)
 
+    # --------------------------------------------------------------------------------
+    @staticmethod
+    def is_safety_critical(name: str, value: Any) -> bool:
+        """Stopping forced hot water is what keeps the tank from overheating so it jumps the queue for MELCloud"""
+        return name == "ForcedHotWaterMode" and str(value).lower() == "false"
+
     # --------------------------------------------------------------------------------
     @staticmethod
     def validate_settings(update_gram):
@@ -0,0 +1,281 @@
+import contextlib
+import datetime
+import functools
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import pytz
+import structlog
+import typer
+
+from act.act import Act
+from act.action import Action
+from act.alter_setting import AlterSetting
+from act.device_info_loader import DeviceInfoLoader
+from act.device_info_window import DeviceInfoWindow
+from act.device_infos import DeviceInfos
+from act.effective_temperature import EffectiveTemperature
+from act.generate_state import StateTreeGenerator
+from act.logging_profile import LoggingProfile
+from act.schedule import Schedule
+
+
+# --------------------------------------------------------------------------------
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers the few EmonCMS and MELCloud requests Act makes"""
+
+    # What MELCloud sends back from SetAtw, which AlterSetting then validates
+    settings = {
+        "EffectiveFlags": 0,
+        "DeviceType": 1,
+        "Power": True,
+        "ForcedHotWaterMode": False,
+        "SetHeatFlowTemperatureZone1": 40.0,
+        "SetTankWaterTemperature": 48.0,
+        "TargetHCTemperatureZone1": 40.0,
+    }
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        url = urlparse(self.path)
+        if not url.path.endswith("feed/data.json"):
+            self.send_error(404)
+            return
+
+        query = parse_qs(url.query)
+        start = float(query["start"][0])
+        end = float(query["end"][0])
+        interval = int(query["interval"][0]) * 1000
+        self.__reply([[moment, 1500.0] for moment in range(int(start), int(end), interval)])
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        if not self.path.endswith("Device/SetAtw"):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        update_gram = dict(StandInHandler.settings)
+        update_gram.update(json.loads(self.rfile.read(length) or b"{}"))
+        self.__reply(update_gram)
+
+    def __reply(self, body: Any) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        pass
+
+
+# --------------------------------------------------------------------------------
+@contextlib.contextmanager
+def stand_in_services() -> Iterator[str]:
+    """Serves EmonCMS under /emoncms/ and MELCloud under /melcloud/ on a local port"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# --------------------------------------------------------------------------------
+class Benchmark:
+    """Times Act end to end, and each of its stages, against generated state trees of increasing size"""
+
+    def __init__(self, root: str, sizes: List[int], repeats: int = 5, start: Optional[datetime.datetime] = None) -> None:
+        self.__root = root
+        self.__sizes = sizes
+        self.__repeats = repeats
+        self.__start = start or pytz.utc.localize(datetime.datetime(2021, 1, 4))
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    def run(self) -> Dict:
+        results = []
+        with stand_in_services() as base_url:
+            environment = {
+                "EMONCMS_URL": f"{base_url}emoncms/",
+                "EMONCMS_API_KEY": "benchmark",
+                "EMONCMS_SOLAR_FEED_ID": "1",
+                "MELCLOUD_URL": f"{base_url}melcloud/",
+                "MITS_CONTEXT_KEY": "benchmark",
+                "DEVICE_ID": "1",
+                # The stand-in doesn't throttle so only the cost of taking a token is measured
+                "ACT_MELCLOUD_RATE_FILE": os.path.join(self.__root, "melcloud-rate.json"),
+                "ACT_MELCLOUD_REQUESTS_PER_MINUTE": "1000000",
+            }
+            with Benchmark.__environment(environment):
+                for days in self.__sizes:
+                    results.append(self.__run_size(days))
+                logging_results = self.__compare_logging(self.__sizes[-1])
+
+        return {
+            "started": datetime.datetime.utcnow().isoformat()[:19],
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "repeats": self.__repeats,
+            "sizes": results,
+            "logging": logging_results,
+        }
+
+    def __run_size(self, days: int) -> Dict:
+        generator = StateTreeGenerator(os.path.join(self.__root, f"{days}d"), self.__start, days)
+        started = time.perf_counter()
+        counts = generator.generate(observations=False)
+        generation_seconds = time.perf_counter() - started
+
+        moment = self.__moment(days)
+        stages: Dict[str, Dict] = {}
+
+        with Benchmark.__environment({"ACT_STATE_ROOT": generator.state_root, "ACT_WEATHER_ROOT": generator.weather_root}):
+            act = Act()
+
+            with Benchmark.__quiet():
+                stages["load"] = self.__time(lambda: Benchmark.__load(moment))
+                device_infos = Benchmark.__load(moment)
+
+                # A run builds the window once and every blocker and provider shares it, so it's timed on its own
+                stages["window"] = self.__time(lambda: DeviceInfoWindow(device_infos))
+                window = DeviceInfoWindow(device_infos)
+
+                stages["actions_should_be_blocked"] = self.__time(lambda: act.actions_should_be_blocked(window))
+
+                gathered: List[Action] = []
+                for provider in Act.action_providers():
+                    stages[f"provider.{provider.__qualname__}"] = self.__time(functools.partial(Benchmark.__provide, provider, moment, window))
+                    gathered.extend(Benchmark.__provide(provider, moment, window))
+
+                stages["resolve_conflicts"] = self.__time(lambda: list(Act.resolve_conflicts(gathered)))
+                stages["weather"] = self.__time(lambda: EffectiveTemperature.apparent_temp(moment))
+                stages["schedule"] = self.__time(lambda: (Schedule.previous_job(moment), Schedule.next_job_moment(moment, Schedule.on_job_name())))
+                stages["send"] = self.__time(lambda: AlterSetting().send_update_to_melcloud("SetTankWaterTemperature", "48", "Benchmark", "Benchmark", shoosh=True))
+                stages["act"] = self.__time(
+                    lambda: act.act(calculation_moment=moment.isoformat()[:19], dry_run=True, metrics_file=None, trace_file=None, profile=None, adaptive=False)
+                )
+
+        self.__logger.info("Benchmarked", days=days, act_median=stages["act"]["median"])
+        return {
+            "days": days,
+            "device_files": counts["devices"],
+            "weather_readings": counts["weather"],
+            "generation_seconds": round(generation_seconds, 3),
+            "gathered_actions": len(gathered),
+            "stages": stages,
+        }
+
+    def __compare_logging(self, days: int) -> Dict:
+        """The cost of a whole dry run, and of the debug lines alone, under each logging profile, with the console one first"""
+        generator = StateTreeGenerator(os.path.join(self.__root, f"{days}d"), self.__start, days)
+        moment = self.__moment(days)
+        results: Dict[str, Any] = {"days": days}
+
+        with Benchmark.__environment({"ACT_STATE_ROOT": generator.state_root, "ACT_WEATHER_ROOT": generator.weather_root}):
+            act = Act()
+            logger = structlog.get_logger("Benchmark")
+            for profile in LoggingProfile.names():
+                LoggingProfile.configure(profile)
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    results[profile] = self.__time(
+                        lambda: act.act(calculation_moment=moment.isoformat()[:19], dry_run=True, metrics_file=None, trace_file=None, profile=None, adaptive=False)
+                    )
+                results[profile]["bytes_per_run"] = len(output.getvalue()) // self.__repeats
+
+                # A run only writes a few dozen lines so the difference per line is where the profiles differ
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results[profile]["thousand_debug_lines"] = self.__time(lambda: [logger.debug("Benchmark", stage="logging", value=1.5) for _ in range(1000)])
+
+        return results
+
+    def __moment(self, days: int) -> datetime.datetime:
+        return self.__start + datetime.timedelta(days=days, minutes=-1)
+
+    def __time(self, stage: Callable[[], Any]) -> Dict:
+        """Seconds taken by the stage, keeping the first separately because that's when the caches are cold"""
+        durations = []
+        for _ in range(self.__repeats):
+            started = time.perf_counter()
+            stage()
+            durations.append(time.perf_counter() - started)
+
+        return {
+            "first": round(durations[0], 6),
+            "min": round(min(durations), 6),
+            "median": round(statistics.median(durations), 6),
+            "mean": round(statistics.mean(durations), 6),
+            "max": round(max(durations), 6),
+        }
+
+    @staticmethod
+    def __provide(provider: Callable[[datetime.datetime, DeviceInfos], Optional[Iterable[Action]]], moment: datetime.datetime, window: DeviceInfoWindow) -> List[Action]:
+        return list(provider(moment, window) or [])
+
+    @staticmethod
+    def __load(moment: datetime.datetime) -> DeviceInfos:
+        device_infos = list(DeviceInfoLoader().latest_device_infos(moment))
+        device_infos.reverse()
+        return device_infos
+
+    @staticmethod
+    @contextlib.contextmanager
+    def __environment(values: Dict[str, str]) -> Iterator[None]:
+        previous = {name: os.environ.get(name) for name in values}
+        os.environ.update(values)
+        try:
+            yield
+        finally:
+            for name, value in previous.items():
+                if value is None:
+                    del os.environ[name]
+                else:
+                    os.environ[name] = value
+
+    @staticmethod
+    @contextlib.contextmanager
+    def __quiet() -> Iterator[None]:
+        """The log lines are still rendered, as they would be in a real run, but not shown"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+
+
+# --------------------------------------------------------------------------------
+def benchmark(
+    sizes: str = typer.Option(default="1,7,28", help="Comma-separated days of history to generate for each run."),
+    repeats: int = typer.Option(default=5, help="How many times each stage is timed."),
+    root: Optional[str] = typer.Option(default=None, help="Folder for the generated trees, otherwise a temporary folder."),
+    output: Optional[str] = typer.Option(default=None, help="Write the JSON results to this file instead of showing them."),
+) -> None:
+    """
+    Time the Act pipeline against generated state trees and local stand-ins for MELCloud and EmonCMS.
+    """
+    days = [int(size) for size in sizes.split(",")]
+
+    with contextlib.ExitStack() as stack:
+        folder = root or stack.enter_context(tempfile.TemporaryDirectory())
+        results = Benchmark(folder, days, repeats).run()
+
+    text = json.dumps(results, indent=4)
+    if output:
+        with open(output, "w", encoding="utf-8") as output_file:
+            output_file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    typer.run(benchmark)
@@ -0,0 +1,208 @@
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional
+
+import structlog
+
+from .action import Action
+from .alter_setting import AlterSetting
+from .installation import Installation
+from .run_metrics import RunMetrics
+from .state_paths import StatePaths
+
+Command = Dict
+
+
+# --------------------------------------------------------------------------------
+class CommandQueue:
+    """Commands waiting to be sent to MELCloud, kept in a locked file so they survive a failed send or the process ending.
+
+    There is at most one command per setting: a newer command supersedes one still waiting, so a stale value is never replayed after an outage.
+    A command which fails is retried with exponential backoff, and one which has waited too long is dropped because the decision is out of date.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        base_backoff_seconds: float = 15.0,
+        max_backoff_seconds: float = 600.0,
+        max_age_seconds: float = 1800.0,
+        lease_seconds: float = 120.0,
+    ) -> None:
+        self.path = path
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_age_seconds = max_age_seconds
+        # A sender which vanished mid-send gives its command back after this long
+        self.lease_seconds = lease_seconds
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    @staticmethod
+    def for_state_root() -> "CommandQueue":
+        state_root = StatePaths.state_root()
+        default_path = os.path.join(state_root, "commands.json") if os.path.exists(state_root) else os.path.join(tempfile.gettempdir(), "act-commands.json")
+        return CommandQueue(
+            Installation.setting("ACT_COMMAND_QUEUE_FILE", default_path),
+            float(Installation.setting("ACT_COMMAND_BACKOFF_SECONDS", "15")),
+            float(Installation.setting("ACT_COMMAND_MAX_BACKOFF_SECONDS", "600")),
+            float(Installation.setting("ACT_COMMAND_MAX_AGE_SECONDS", "1800")),
+        )
+
+    @contextlib.contextmanager
+    def __locked_commands(self, changing: bool = True) -> Iterator[Dict[str, Command]]:
+        """The lock is kept on a file beside the queue, so the queue itself can be replaced whole and is never seen half written"""
+        with open(f"{self.path}.lock", "a", encoding="utf-8") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                commands = self.__load()
+
+                yield commands
+
+                if changing:
+                    partial_path = f"{self.path}.{os.getpid()}.tmp"
+                    with open(partial_path, "w", encoding="utf-8") as queue_file:
+                        queue_file.write(json.dumps(commands, sort_keys=True))
+                        queue_file.flush()
+                        os.fsync(queue_file.fileno())
+                    os.replace(partial_path, self.path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __load(self) -> Dict[str, Command]:
+        try:
+            with open(self.path, encoding="utf-8") as queue_file:
+                text = queue_file.read()
+        except FileNotFoundError:
+            return {}
+        try:
+            return json.loads(text) if text else {}
+        except ValueError as err:
+            self.__logger.error("Starting with an empty command queue because it can't be read", path=self.path, error=str(err))
+            return {}
+
+    def enqueue(self, action: Action) -> None:
+        command = {
+            "id": uuid.uuid4().hex,
+            "name": action.name,
+            "value": str(action.value),
+            "message": action.message,
+            "source": action.source,
+            "enqueued": time.time(),
+            "attempts": 0,
+            "next_attempt": 0.0,
+            "leased_until": 0.0,
+        }
+        with self.__locked_commands() as commands:
+            superseded = commands.get(action.name)
+            commands[action.name] = command
+        if superseded is not None:
+            self.__logger.info("Superseded a waiting command", name=action.name, value=superseded["value"], new_value=command["value"], attempts=superseded["attempts"])
+
+    def pending(self) -> List[Command]:
+        if not os.path.exists(self.path):
+            return []
+        with self.__locked_commands(changing=False) as commands:
+            return list(commands.values())
+
+    def drain(self, send: Optional[Callable[[Command], None]] = None, deadline_seconds: Optional[float] = None) -> int:
+        """Send every command which is due, safety first, and return how many went. Failures stay queued for later.
+
+        Only a command which was sent is journalled, once, however many attempts it took.
+        """
+        send = send or CommandQueue.send_to_melcloud
+        started = time.monotonic()
+        sent = 0
+        with RunMetrics.measure("drain"):
+            while deadline_seconds is None or time.monotonic() - started < deadline_seconds:
+                command = self.__claim()
+                if command is None:
+                    break
+                try:
+                    send(command)
+                except Exception as err:
+                    self.__settle(command, str(err) or err.__class__.__name__)
+                    continue
+                self.__settle(command, None)
+                AlterSetting().record_action(command["name"], command["value"], command["message"], command["source"])
+                sent += 1
+        return sent
+
+    @staticmethod
+    def send_to_melcloud(command: Command) -> None:
+        AlterSetting().post_update(command["name"], command["value"], shoosh=True)
+
+    def __claim(self) -> Optional[Command]:
+        now = time.time()
+        with self.__locked_commands() as commands:
+            for name, command in list(commands.items()):
+                if now - command["enqueued"] > self.max_age_seconds:
+                    self.__logger.warning("Dropping a command which waited too long", name=name, value=command["value"], attempts=command["attempts"])
+                    del commands[name]
+
+            due = [command for command in commands.values() if command["next_attempt"] <= now and command["leased_until"] <= now]
+            if not due:
+                return None
+            command = min(due, key=lambda command: (not AlterSetting.is_safety_critical(command["name"], command["value"]), command["enqueued"]))
+            command["leased_until"] = now + self.lease_seconds
+            return dict(command)
+
+    def __settle(self, command: Command, error: Optional[str]) -> None:
+        with self.__locked_commands() as commands:
+            current = commands.get(command["name"])
+            if current is None or current["id"] != command["id"]:
+                # A newer command arrived while this one was being sent, and it still needs sending
+                return
+            if error is None:
+                del commands[command["name"]]
+                return
+
+            current["attempts"] += 1
+            backoff = min(self.max_backoff_seconds, self.base_backoff_seconds * 2 ** (current["attempts"] - 1))
+            current["next_attempt"] = time.time() + backoff
+            current["leased_until"] = 0.0
+            current["last_error"] = error
+        self.__logger.warning(
+            "Sending a command failed so it will be retried", name=command["name"], value=command["value"], attempts=current["attempts"], backoff=backoff, error=error
+        )
+
+
+# --------------------------------------------------------------------------------
+class CommandSender:
+    """Keeps draining the command queue on its own thread so a resident process never waits on MELCloud to decide"""
+
+    def __init__(self, interval_seconds: float = 1.0) -> None:
+        self.interval_seconds = interval_seconds
+        self.__stopping = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    def start(self) -> "CommandSender":
+        self.__stopping.clear()
+        self.__thread = threading.Thread(target=self.__drain_until_stopped, name="CommandSender", daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__stopping.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def __enter__(self) -> "CommandSender":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def __drain_until_stopped(self) -> None:
+        while not self.__stopping.wait(self.interval_seconds):
+            try:
+                CommandQueue.for_state_root().drain()
+            except Exception:
+                self.__logger.exception("Unable to drain the command queue")
@@ -0,0 +1,126 @@
+import bisect
+import datetime
+from typing import List, Optional
+
+from .device_infos import DeviceInfo
+
+
+# --------------------------------------------------------------------------------
+class ThresholdTimer:
+    """Answers "when did a reading last breach this threshold" for any threshold without rescanning the readings.
+
+    Only readings which could still be the most recent breach of some threshold are kept.
+    A newer reading which is at least as extreme makes older ones irrelevant, so the kept keys are always sorted.
+    """
+
+    def __init__(self, below: bool) -> None:
+        # When timing how long readings have been below a threshold, a breach is a reading at or above it
+        self.__sign = -1.0 if below else 1.0
+        self.__keys: List[float] = []
+        self.__moments: List[datetime.datetime] = []
+        self.__followers: List[Optional[datetime.datetime]] = []
+        self.__start = 0
+        self.__first: Optional[datetime.datetime] = None
+
+    def update(self, moment: datetime.datetime, value: float) -> None:
+        if self.__first is None:
+            self.__first = moment
+
+        if len(self.__keys) > self.__start:
+            # The newest kept entry is always the previous reading
+            self.__followers[-1] = moment
+
+        key = self.__sign * value
+        while len(self.__keys) > self.__start and self.__keys[-1] >= key:
+            self.__keys.pop()
+            self.__moments.pop()
+            self.__followers.pop()
+
+        self.__keys.append(key)
+        self.__moments.append(moment)
+        self.__followers.append(None)
+
+    def forget_before(self, moment: datetime.datetime) -> None:
+        self.__first = moment
+        while self.__start < len(self.__moments) and self.__moments[self.__start] < moment:
+            self.__start += 1
+
+        if self.__start > 64 and self.__start * 2 > len(self.__keys):
+            del self.__keys[: self.__start]
+            del self.__moments[: self.__start]
+            del self.__followers[: self.__start]
+            self.__start = 0
+
+    def __last_breach_index(self, threshold: float) -> int:
+        return bisect.bisect_right(self.__keys, self.__sign * threshold, lo=self.__start) - 1
+
+    def last_breach(self, threshold: float) -> Optional[datetime.datetime]:
+        index = self.__last_breach_index(threshold)
+        if index < self.__start:
+            return None
+        return self.__moments[index]
+
+    def since(self, threshold: float) -> Optional[datetime.datetime]:
+        """The moment of the first reading after the most recent breach, or None if the latest reading is a breach"""
+        index = self.__last_breach_index(threshold)
+        if index < self.__start:
+            return self.__first
+        return self.__followers[index]
+
+
+# --------------------------------------------------------------------------------
+class ControllerState:
+    """Hysteresis timers maintained as each reading arrives so the providers don't have to re-derive them by scanning the window"""
+
+    def __init__(self) -> None:
+        self.last_heating: Optional[datetime.datetime] = None
+        self.last_defrost: Optional[datetime.datetime] = None
+        self.last_operation: Optional[datetime.datetime] = None
+        self.return_temperature_at_last_operation: Optional[float] = None
+        self.__return_temperatures = ThresholdTimer(below=True)
+        self.__flow_temperatures = ThresholdTimer(below=False)
+
+    def update(self, moment: datetime.datetime, device_info: DeviceInfo) -> None:
+        if device_info.get("HeatPumpFrequency"):
+            self.last_heating = moment
+
+        if device_info.get("DefrostMode"):
+            self.last_defrost = moment
+
+        if device_info.get("OperationMode"):
+            self.last_operation = moment
+            self.return_temperature_at_last_operation = float(device_info["ReturnTemperature"]) if "ReturnTemperature" in device_info else None
+
+        if "ReturnTemperature" in device_info:
+            self.__return_temperatures.update(moment, float(device_info["ReturnTemperature"]))
+
+        if "FlowTemperature" in device_info:
+            self.__flow_temperatures.update(moment, float(device_info["FlowTemperature"]))
+
+    def forget_before(self, moment: datetime.datetime) -> None:
+        """The readings before the moment have left the window, so nothing they said is kept"""
+        if self.last_heating is not None and self.last_heating < moment:
+            self.last_heating = None
+        if self.last_defrost is not None and self.last_defrost < moment:
+            self.last_defrost = None
+        if self.last_operation is not None and self.last_operation < moment:
+            self.last_operation = None
+            self.return_temperature_at_last_operation = None
+        self.__return_temperatures.forget_before(moment)
+        self.__flow_temperatures.forget_before(moment)
+
+    def has_been_cold_since(self, moment: datetime.datetime, threshold: float) -> bool:
+        """Every return temperature from the moment onwards has been below the threshold"""
+        last_warm = self.__return_temperatures.last_breach(threshold)
+        return last_warm is None or last_warm < moment
+
+    def cold_since(self, threshold: float) -> Optional[datetime.datetime]:
+        return self.__return_temperatures.since(threshold)
+
+    def has_been_hot_since(self, moment: datetime.datetime, threshold: float) -> bool:
+        """Every flow temperature from the moment onwards has been above the threshold"""
+        last_cool = self.__flow_temperatures.last_breach(threshold)
+        return last_cool is None or last_cool < moment
+
+    def hot_since(self, threshold: float) -> Optional[datetime.datetime]:
+        return self.__flow_temperatures.since(threshold)
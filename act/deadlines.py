@@ -0,0 +1,99 @@
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, Set, TypeVar
+
+import structlog
+
+from .installation import Installation
+
+T = TypeVar("T")
+
+
+# --------------------------------------------------------------------------------
+class Deadlines:
+    """A run's time budget and how long each slow dependency may take out of it.
+
+    A dependency which fails gets its fallback instead, and one which misses its deadline is given up on for the rest of the run,
+    so a hung EmonCMS or weather folder can't hold up the commands.
+    """
+
+    __current: "contextvars.ContextVar[Optional[Deadlines]]" = contextvars.ContextVar("deadlines", default=None)
+
+    def __init__(self, run_seconds: float = 20.0, dependency_seconds: Optional[Dict[str, float]] = None) -> None:
+        self.run_seconds = run_seconds
+        self.dependency_seconds = dependency_seconds or {}
+        self.degraded: Dict[str, str] = {}
+        self.given_up: Set[str] = set()
+        self.__started = time.monotonic()
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    @staticmethod
+    def for_run() -> "Deadlines":
+        return Deadlines(
+            float(Installation.setting("ACT_RUN_BUDGET_SECONDS", "20")),
+            {
+                "emoncms": float(Installation.setting("ACT_EMONCMS_DEADLINE_SECONDS", "3")),
+                "weather": float(Installation.setting("ACT_WEATHER_DEADLINE_SECONDS", "2")),
+            },
+        )
+
+    @staticmethod
+    def current() -> Optional["Deadlines"]:
+        return Deadlines.__current.get()
+
+    @contextlib.contextmanager
+    def collect(self) -> Iterator["Deadlines"]:
+        """Make this the budget which dependencies are called within"""
+        token = Deadlines.__current.set(self)
+        try:
+            yield self
+        finally:
+            Deadlines.__current.reset(token)
+
+    def remaining(self) -> float:
+        return max(0.0, self.run_seconds - (time.monotonic() - self.__started))
+
+    def degrade(self, dependency: str, reason: str) -> None:
+        self.degraded[dependency] = reason
+        self.__logger.warning("Using a fallback", dependency=dependency, reason=reason)
+
+    @staticmethod
+    def call(dependency: str, function: Callable[[], T], fallback: Callable[[], T]) -> T:
+        """The function's answer if it arrives in time, otherwise the fallback's. Without a budget the function is simply called."""
+        deadlines = Deadlines.__current.get()
+        if deadlines is None:
+            return function()
+        if dependency in deadlines.given_up:
+            return fallback()
+
+        timeout = min(deadlines.dependency_seconds.get(dependency, deadlines.run_seconds), deadlines.remaining())
+        if timeout <= 0:
+            deadlines.given_up.add(dependency)
+            deadlines.degrade(dependency, "The run's budget was spent")
+            return fallback()
+
+        outcome: Dict = {}
+        finished = threading.Event()
+
+        def attempt() -> None:
+            try:
+                outcome["value"] = function()
+            except Exception as err:
+                outcome["error"] = err
+            finally:
+                finished.set()
+
+        # A daemon thread can be abandoned if it hangs without holding up the process exiting
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(attempt,), name=f"Deadline-{dependency}", daemon=True).start()
+
+        if not finished.wait(timeout):
+            deadlines.given_up.add(dependency)
+            deadlines.degrade(dependency, f"No answer within {round(timeout, 2)} seconds")
+            return fallback()
+        if "error" in outcome:
+            deadlines.degrade(dependency, str(outcome["error"]))
+            return fallback()
+        return outcome["value"]
@@ -0,0 +1,112 @@
+import datetime
+import json
+import os
+import statistics
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+import pytz
+import typer
+
+from act.state_paths import StatePaths
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class DecisionLatency:
+    """How long after the heat pump reported its state the run's commands were acknowledged.
+
+    The device age runs from the newest reading to the start of the run, evaluating runs from then until the actions are decided and sending until the last response.
+    Sending is only known when the run sent the commands itself, so a run whose commands were left queued has no send or total.
+    """
+
+    moment: str
+    device_age_seconds: Optional[float] = None
+    evaluation_seconds: float = 0.0
+    send_seconds: Optional[float] = None
+    actions: int = 0
+    # The inputs which fell back rather than hold up the run
+    degraded: List[str] = field(default_factory=list)
+
+    @property
+    def total_seconds(self) -> Optional[float]:
+        if self.device_age_seconds is None:
+            return None
+        if self.send_seconds is None:
+            return None if self.actions else self.device_age_seconds + self.evaluation_seconds
+        return self.device_age_seconds + self.evaluation_seconds + self.send_seconds
+
+    def as_dict(self) -> Dict:
+        result = {name: round(value, 3) if isinstance(value, float) else value for name, value in asdict(self).items()}
+        total_seconds = self.total_seconds
+        result["total_seconds"] = None if total_seconds is None else round(total_seconds, 3)
+        return result
+
+    def record(self) -> None:
+        """Kept next to the action journal as a line per run in a file per day"""
+        state_root = StatePaths.state_root()
+        if not os.path.exists(state_root):
+            return
+
+        path = DecisionLatency.path(state_root, datetime.datetime.fromisoformat(self.moment))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as latency_file:
+            latency_file.write(json.dumps(self.as_dict(), sort_keys=True) + "\n")
+
+    @staticmethod
+    def path(state_root: str, moment: datetime.datetime) -> str:
+        return os.path.join(state_root, "actions", "latency", "{:%Y}".format(moment), "{:%m}".format(moment), "{:%d}.jsonl".format(moment))
+
+    @staticmethod
+    def load(state_root: str, since: datetime.datetime, until: datetime.datetime) -> List[Dict]:
+        records = []
+        day = since.date()
+        while day <= until.date():
+            path = DecisionLatency.path(state_root, datetime.datetime.combine(day, datetime.time()))
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as latency_file:
+                    for line in latency_file:
+                        record = json.loads(line)
+                        if since.isoformat() <= record["moment"] <= until.isoformat():
+                            records.append(record)
+            day += datetime.timedelta(days=1)
+        return records
+
+    @staticmethod
+    def summarise(records: List[Dict], percentiles: List[int]) -> Dict:
+        summary: Dict = {"runs": len(records), "degraded_runs": sum(1 for record in records if record.get("degraded"))}
+        for measure in ["device_age_seconds", "evaluation_seconds", "send_seconds", "total_seconds"]:
+            values = sorted(record[measure] for record in records if record.get(measure) is not None)
+            if not values:
+                summary[measure] = None
+                continue
+            # quantiles needs at least two values to interpolate between
+            cut_points = statistics.quantiles(values, n=100, method="inclusive") if len(values) > 1 else values * 99
+            summary[measure] = {f"p{percentile}": round(cut_points[percentile - 1], 3) for percentile in percentiles}
+            summary[measure]["max"] = values[-1]
+        return summary
+
+
+# --------------------------------------------------------------------------------
+def decision_latency(
+    days: int = typer.Option(default=7, help="How many days back from now to summarise."),
+    all_runs: bool = typer.Option(default=False, help="Include runs which didn't send any commands."),
+    percentiles: str = typer.Option(default="50,90,99", help="Comma-separated percentiles to report."),
+) -> None:
+    """
+    Summarise how long it has taken for commands to land after the heat pump reported its state.
+    """
+    until = datetime.datetime.utcnow().replace(tzinfo=pytz.utc, microsecond=0)
+    since = until - datetime.timedelta(days=days)
+
+    records = DecisionLatency.load(StatePaths.state_root(), since, until)
+    if not all_runs:
+        records = [record for record in records if record["actions"]]
+
+    summary = DecisionLatency.summarise(records, [int(percentile) for percentile in percentiles.split(",")])
+    summary["since"] = since.isoformat()
+    print(json.dumps(summary, indent=4))
+
+
+if __name__ == "__main__":
+    typer.run(decision_latency)
@@ -0,0 +1,299 @@
+import datetime
+import gzip
+import json
+import os
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import structlog
+import typer
+
+from .device_json import DeviceJson
+from .state_paths import StatePaths
+
+Snapshot = Tuple[str, List[Dict]]
+
+
+# --------------------------------------------------------------------------------
+class DeviceArchive:
+    """A completed day of device downloads packed into one gzipped file beside the day's folder, for example raw/2021/01/04.pack.
+
+    Each download is kept as its file name and its devices without ListHistory24Formatters, written as a length-prefixed JSON record,
+    so a day is read back with one sequential read instead of walking a folder of a thousand or more files.
+
+    Consecutive downloads hardly differ, so most records are deltas holding just the fields which changed since the download before.
+    Every so often there is a keyframe holding all of them, which is where reconstructing any download starts from.
+    The top bit of a record's length marks it as a delta, so archives packed before there were deltas read as all keyframes.
+    """
+
+    suffix = ".pack"
+    keyframe_interval = 60
+
+    __length = struct.Struct(">I")
+    __delta_flag = 0x80000000
+
+    def __init__(self, devices_folder: Optional[str] = None) -> None:
+        self.devices_folder = devices_folder or os.path.join(StatePaths.state_root(), "downloads", "raw")
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    @staticmethod
+    def is_archive(path: str) -> bool:
+        return path.endswith(DeviceArchive.suffix)
+
+    @staticmethod
+    def snapshots(archive_path: str) -> Iterator[Snapshot]:
+        """The downloads in the archive, newest first like the loose files. Only one keyframe's worth are reconstructed at a time."""
+        packed, spans = DeviceArchive.__read(archive_path)
+        bounds = DeviceArchive.__keyframes(spans) + [len(spans)]
+        for first, last in reversed(list(zip(bounds, bounds[1:]))):
+            yield from reversed(list(DeviceArchive.__replay(packed, spans[first:last])))
+
+    @staticmethod
+    def read_buildings(archive_path: str, file_name: str) -> List[Dict]:
+        """One download, replayed from the keyframe before it"""
+        packed, spans = DeviceArchive.__read(archive_path)
+        for name, buildings in DeviceArchive.__replay(packed, spans[DeviceArchive.__keyframe_before(packed, spans, file_name) :]):
+            if name == file_name:
+                return buildings
+            if name > file_name:
+                break
+        raise Exception(f"There is no {file_name} in {archive_path}")
+
+    @staticmethod
+    def columns(
+        archive_path: str, names: List[str], device_id: str = "", start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None
+    ) -> List[Tuple[str, Dict]]:
+        """Some fields of one device for each download between the UTC moments, oldest first, without building the rest of each download"""
+        start_name = DeviceArchive.file_name(start) if start else ""
+        end_name = DeviceArchive.file_name(end) if end else None
+        packed, spans = DeviceArchive.__read(archive_path)
+
+        rows = []
+        key = None
+        values: Dict = {}
+        for position, end_position, is_delta in spans[DeviceArchive.__keyframe_before(packed, spans, start_name) :]:
+            record = json.loads(packed[position:end_position])
+            if end_name is not None and record["file"] > end_name:
+                break
+            if is_delta:
+                changes = record.get("changes", {}).get(key, {})
+                values.update((name, changes[name]) for name in names if name in changes)
+                for name in record.get("removed", {}).get(key, []):
+                    values.pop(name, None)
+            else:
+                key, device = DeviceArchive.__select(record["buildings"], device_id)
+                values = {name: device[name] for name in names if name in device}
+            if record["file"] >= start_name:
+                rows.append((record["file"], dict(values)))
+        return rows
+
+    @staticmethod
+    def file_name(moment: datetime.datetime) -> str:
+        """What the download at the UTC moment is called, which sorts in time order"""
+        return "devices_{:%Y-%m-%dT%H%M%S}Z.json".format(moment)
+
+    @staticmethod
+    def __read(archive_path: str) -> Tuple[bytes, List[Tuple[int, int, bool]]]:
+        with gzip.open(archive_path, "rb") as archive:
+            packed = archive.read()
+
+        spans = []
+        position = 0
+        while position < len(packed):
+            (length,) = DeviceArchive.__length.unpack_from(packed, position)
+            position += DeviceArchive.__length.size
+            is_delta = bool(length & DeviceArchive.__delta_flag)
+            length &= ~DeviceArchive.__delta_flag
+            spans.append((position, position + length, is_delta))
+            position += length
+        if spans and spans[0][2]:
+            raise Exception(f"{archive_path} doesn't start with a keyframe")
+        return packed, spans
+
+    @staticmethod
+    def __keyframes(spans: List[Tuple[int, int, bool]]) -> List[int]:
+        return [index for index, (_, _, is_delta) in enumerate(spans) if not is_delta]
+
+    @staticmethod
+    def __keyframe_before(packed: bytes, spans: List[Tuple[int, int, bool]], file_name: str) -> int:
+        """Only the keyframes are decoded to find where to start"""
+        chosen = 0
+        for index in DeviceArchive.__keyframes(spans):
+            position, end, _ = spans[index]
+            if json.loads(packed[position:end])["file"] > file_name:
+                break
+            chosen = index
+        return chosen
+
+    @staticmethod
+    def __replay(packed: bytes, spans: List[Tuple[int, int, bool]]) -> Iterator[Snapshot]:
+        """The downloads in order, starting from a keyframe. Devices which didn't change are shared with the download before."""
+        buildings: List[Dict] = []
+        for position, end, is_delta in spans:
+            record = json.loads(packed[position:end])
+            buildings = DeviceArchive.__apply(buildings, record) if is_delta else record["buildings"]
+            yield record["file"], buildings
+
+    @staticmethod
+    def __apply(buildings: List[Dict], record: Dict) -> List[Dict]:
+        changes = record.get("changes", {})
+        removed = record.get("removed", {})
+        applied = []
+        for building in buildings:
+            devices = []
+            for device in building["Structure"]["Devices"]:
+                key = str(device["DeviceID"])
+                if key in changes or key in removed:
+                    fields = dict(device["Device"])
+                    fields.update(changes.get(key, {}))
+                    for name in removed.get(key, []):
+                        fields.pop(name, None)
+                    device = {"DeviceID": device["DeviceID"], "Device": fields}
+                devices.append(device)
+            applied.append({"Structure": {"Devices": devices}})
+        return applied
+
+    @staticmethod
+    def __delta(previous: List[Dict], buildings: List[Dict]) -> Optional[Dict]:
+        """The fields of each device which changed, or nothing when the devices themselves changed and it needs a keyframe"""
+        if DeviceArchive.__device_keys(previous) != DeviceArchive.__device_keys(buildings):
+            return None
+        before = {str(device["DeviceID"]): device["Device"] for building in previous for device in building["Structure"]["Devices"]}
+        changes: Dict[str, Dict] = {}
+        removed: Dict[str, List[str]] = {}
+        for building in buildings:
+            for device in building["Structure"]["Devices"]:
+                key = str(device["DeviceID"])
+                changed = {name: value for name, value in device["Device"].items() if name not in before[key] or before[key][name] != value}
+                gone = [name for name in before[key] if name not in device["Device"]]
+                if changed:
+                    changes[key] = changed
+                if gone:
+                    removed[key] = gone
+        delta: Dict = {"changes": changes}
+        if removed:
+            delta["removed"] = removed
+        return delta
+
+    @staticmethod
+    def __device_keys(buildings: List[Dict]) -> List[List[str]]:
+        return [[str(device["DeviceID"]) for device in building["Structure"]["Devices"]] for building in buildings]
+
+    @staticmethod
+    def __select(buildings: List[Dict], device_id: str) -> Tuple[str, Dict]:
+        """Picks the device the way the loader does, by its id or as the only one"""
+        devices = [device for building in buildings for device in building["Structure"]["Devices"]]
+        for device in devices:
+            if str(device["DeviceID"]) == device_id:
+                return device_id, device["Device"]
+        if len(devices) == 1:
+            return str(devices[0]["DeviceID"]), devices[0]["Device"]
+        raise Exception(f"There is no device {device_id} among the {len(devices)} devices")
+
+    @staticmethod
+    def project(buildings: List[Dict]) -> List[Dict]:
+        """Just the devices from each building, without their history"""
+        return [
+            {
+                "Structure": {
+                    "Devices": [
+                        {
+                            "DeviceID": device["DeviceID"],
+                            "Device": {name: value for name, value in device["Device"].items() if name != "ListHistory24Formatters"},
+                        }
+                        for device in building["Structure"]["Devices"]
+                    ]
+                }
+            }
+            for building in buildings
+        ]
+
+    def compact(self, before: datetime.date, keep_files: bool = False) -> int:
+        """Pack every day before this one which hasn't been packed yet, returning how many days were packed"""
+        packed_days = 0
+        for day, day_folder in self.__day_folders():
+            if day >= before:
+                continue
+            archive_path = day_folder + DeviceArchive.suffix
+            if os.path.exists(archive_path):
+                continue
+            self.pack(day_folder, archive_path, keep_files)
+            packed_days += 1
+        return packed_days
+
+    def pack(self, day_folder: str, archive_path: str, keep_files: bool = False) -> int:
+        """Write the day's downloads to the archive, then remove the files which were packed. Files which can't be read are left where they are."""
+        file_names = sorted(name for name in os.listdir(day_folder) if name.startswith("devices_"))
+        packed_names = []
+        previous: Optional[List[Dict]] = None
+        since_keyframe = 0
+        partial_path = f"{archive_path}.{os.getpid()}.tmp"
+        with gzip.open(partial_path, "wb") as archive:
+            for file_name in file_names:
+                try:
+                    with open(os.path.join(day_folder, file_name), "rb") as devices:
+                        buildings = DeviceArchive.project(DeviceJson.loads(devices.read()))
+                except Exception as err:
+                    self.__logger.warning("Leaving a download which can't be read", file=file_name, error=str(err))
+                    continue
+
+                delta = None
+                if previous is not None and since_keyframe < DeviceArchive.keyframe_interval:
+                    delta = DeviceArchive.__delta(previous, buildings)
+                if delta is None:
+                    record, flag, since_keyframe = {"file": file_name, "buildings": buildings}, 0, 0
+                else:
+                    record, flag = {"file": file_name, **delta}, DeviceArchive.__delta_flag
+                since_keyframe += 1
+
+                encoded = json.dumps(record, separators=(",", ":")).encode("utf-8")
+                archive.write(DeviceArchive.__length.pack(len(encoded) | flag))
+                archive.write(encoded)
+                packed_names.append(file_name)
+                previous = buildings
+
+        # The files only go once the archive is known to hold all of them, and to replay the newest as it was
+        replayed = list(DeviceArchive.snapshots(partial_path))
+        if len(replayed) != len(packed_names) or (previous is not None and replayed[0][1] != previous):
+            os.remove(partial_path)
+            raise Exception(f"The archive for {day_folder} doesn't hold the {len(packed_names)} downloads written to it")
+        os.replace(partial_path, archive_path)
+
+        if not keep_files:
+            for file_name in packed_names:
+                os.remove(os.path.join(day_folder, file_name))
+            if not os.listdir(day_folder):
+                os.rmdir(day_folder)
+
+        self.__logger.info("Packed a day of downloads", day_folder=day_folder, downloads=len(packed_names), size=os.path.getsize(archive_path))
+        return len(packed_names)
+
+    def __day_folders(self) -> Iterator[Tuple[datetime.date, str]]:
+        for year in DeviceArchive.__numbered(self.devices_folder):
+            for month in DeviceArchive.__numbered(os.path.join(self.devices_folder, year)):
+                for day in DeviceArchive.__numbered(os.path.join(self.devices_folder, year, month)):
+                    yield datetime.date(int(year), int(month), int(day)), os.path.join(self.devices_folder, year, month, day)
+
+    @staticmethod
+    def __numbered(folder: str) -> List[str]:
+        if not os.path.isdir(folder):
+            return []
+        return sorted(entry.name for entry in os.scandir(folder) if entry.is_dir() and entry.name.isdigit())
+
+
+# --------------------------------------------------------------------------------
+def compact_downloads(
+    devices_folder: Optional[str] = typer.Option(default=None, help="Folder of raw device downloads, which defaults to the one in the state root."),
+    before: Optional[str] = typer.Option(default=None, help="Pack the days before this UTC date in ISO8601 format, which defaults to today."),
+    keep_files: bool = typer.Option(default=False, help="Leave the packed downloads in place."),
+) -> None:
+    """
+    Pack each completed day of device downloads into a single archive.
+    """
+    before_date = datetime.date.fromisoformat(before) if before else datetime.datetime.utcnow().date()
+    packed_days = DeviceArchive(devices_folder).compact(before_date, keep_files)
+    print(f"Packed {packed_days} days")
+
+
+if __name__ == "__main__":
+    typer.run(compact_downloads)
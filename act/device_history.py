@@ -0,0 +1,112 @@
+import datetime
+import sqlite3
+from typing import Any, Dict, List, Tuple
+
+import pytz
+
+from .device_record import DeviceRecord
+from .installation import Installation
+from .last_time_stamp import LastTimeStamp
+
+
+# --------------------------------------------------------------------------------
+class DeviceHistory:
+    """The device downloads as rows of the fields a DeviceRecord keeps, in a SQLite database keyed by device and UTC moment.
+
+    Any stretch of readings is one indexed query, and the table suits ad-hoc analysis with nothing but sqlite3.
+    The database is in WAL mode so it can be read while downloads are being added.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.__connection = sqlite3.connect(path, timeout=30)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        columns = (
+            [f"{name} REAL" for name in DeviceRecord.temperatures + DeviceRecord.rates]
+            + [f"{name} INTEGER" for name in DeviceRecord.switches]
+            + [f"{name}" for name in DeviceRecord.others]
+        )
+        with self.__connection:
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS readings (device_id TEXT NOT NULL, moment TEXT NOT NULL, file TEXT NOT NULL, "
+                + f"{', '.join(columns)}, PRIMARY KEY (device_id, moment)) WITHOUT ROWID"
+            )
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS ingested (source TEXT PRIMARY KEY)")
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS unreadable (source TEXT PRIMARY KEY, attempts INTEGER NOT NULL)")
+            self.__add_missing_columns(columns)
+
+    def __add_missing_columns(self, columns: List[str]) -> None:
+        """A history made before a DeviceRecord kept some of its fields gets their columns, and every download is added again to fill them in"""
+        existing = {row[1] for row in self.__connection.execute("PRAGMA table_info(readings)")}
+        missing = [column for column in columns if column.split()[0] not in existing]
+        for column in missing:
+            self.__connection.execute(f"ALTER TABLE readings ADD COLUMN {column}")
+        if missing:
+            self.__connection.execute("DELETE FROM ingested")
+
+    @staticmethod
+    def setting() -> str:
+        """Where the history is kept, or nothing when the downloads are read from their files"""
+        return Installation.setting("ACT_HISTORY_DATABASE", "")
+
+    def close(self) -> None:
+        self.__connection.close()
+
+    def __enter__(self) -> "DeviceHistory":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @staticmethod
+    def moment(calculation_moment: datetime.datetime) -> str:
+        """How a UTC moment is kept, which sorts in time order"""
+        return calculation_moment.astimezone(pytz.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+    def is_ingested(self, source: str) -> bool:
+        return self.__connection.execute("SELECT 1 FROM ingested WHERE source = ?", (source,)).fetchone() is not None
+
+    def add(self, source: str, devices: List[Tuple[str, Dict]]) -> int:
+        """The devices read from one source, given with the name of the download each came from, along with a note that the source is done"""
+        rows = [
+            [str(device.get("DeviceID", "")), DeviceHistory.moment(LastTimeStamp.last_time_stamp_in_utc(device)), file_name] + [device.get(name) for name in DeviceRecord.fields]
+            for file_name, device in devices
+        ]
+        placeholders = ", ".join("?" * (3 + len(DeviceRecord.fields)))
+        with self.__connection:
+            self.__connection.executemany(f"INSERT OR REPLACE INTO readings (device_id, moment, file, {', '.join(DeviceRecord.fields)}) VALUES ({placeholders})", rows)
+            self.__connection.execute("INSERT OR IGNORE INTO ingested (source) VALUES (?)", (source,))
+            self.__connection.execute("DELETE FROM unreadable WHERE source = ?", (source,))
+        return len(rows)
+
+    def add_unreadable(self, source: str) -> int:
+        """Notes another failed attempt at reading a source and returns how many there have been"""
+        with self.__connection:
+            self.__connection.execute("INSERT INTO unreadable (source, attempts) VALUES (?, 1) ON CONFLICT (source) DO UPDATE SET attempts = attempts + 1", (source,))
+        return self.__connection.execute("SELECT attempts FROM unreadable WHERE source = ?", (source,)).fetchone()[0]
+
+    def unreadable(self) -> List[str]:
+        """The sources which couldn't be read so far, newest first"""
+        return [row[0] for row in self.__connection.execute("SELECT source FROM unreadable ORDER BY source DESC")]
+
+    def latest(self, device_id: str, calculation_moment: datetime.datetime, count: int = 600) -> List[Tuple[str, Dict]]:
+        """The readings at or before the moment, newest first, each with the name of the download it came from"""
+        cursor = self.__connection.execute(
+            f"SELECT file, {', '.join(DeviceRecord.fields)} FROM readings WHERE device_id = ? AND moment <= ? ORDER BY moment DESC LIMIT ?",
+            (self.__device_key(device_id), DeviceHistory.moment(calculation_moment), count),
+        )
+        return [(row[0], DeviceHistory.__fields(row[1:])) for row in cursor]
+
+    def __device_key(self, device_id: str) -> str:
+        """Without an id the history has to be for a single heat pump, like a download"""
+        if device_id:
+            return device_id
+        device_ids = [row[0] for row in self.__connection.execute("SELECT DISTINCT device_id FROM readings LIMIT 2")]
+        if len(device_ids) > 1:
+            raise Exception(f"There are several devices in {self.path} so DEVICE_ID is needed")
+        return device_ids[0] if device_ids else ""
+
+    @staticmethod
+    def __fields(values: Tuple[Any, ...]) -> Dict:
+        return {name: value for name, value in zip(DeviceRecord.fields, values) if value is not None}
@@ -0,0 +1,282 @@
+import datetime
+import functools
+import heapq
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Deque, Dict, Generator, Iterator, List, Optional, Tuple
+
+import structlog
+
+from .device_archive import DeviceArchive
+from .device_history import DeviceHistory
+from .device_info_window import DeviceInfoWindow
+from .device_infos import DeviceInfo
+from .device_json import DeviceJson
+from .device_record import DeviceRecord
+from .installation import Installation
+from .last_time_stamp import LastTimeStamp
+from .state_paths import StatePaths
+from .tracing import Tracer
+
+
+# --------------------------------------------------------------------------------
+class DeviceInfoLoader:
+    """Reads the device downloads, newest first, from loose files and from days which have been packed.
+
+    With a history database the readings come from it instead, after adding any downloads it doesn't have yet, as long as there aren't too many for a run.
+    With workers the files are parsed in a pool of processes, a few at a time ahead of the one being yielded, which pays off for cold loads and backtests.
+    """
+
+    batch_size = 64
+    # A download which still can't be read after this many runs is taken to be broken rather than still being written
+    unreadable_attempts = 5
+
+    def __init__(self, devices_folder: Optional[str] = None, device_id: Optional[str] = None, workers: Optional[int] = None, history_database: Optional[str] = None) -> None:
+        self.devices_folder = devices_folder or os.path.join(StatePaths.state_root(), "downloads", "raw")
+        self.device_id = device_id if device_id is not None else Installation.setting("DEVICE_ID", "")
+        self.workers = workers if workers is not None else int(Installation.setting("ACT_LOADER_WORKERS", "0"))
+        self.history_database = history_database if history_database is not None else DeviceHistory.setting()
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    def latest_device_infos(self, calculation_moment: datetime.datetime, count: int = 600) -> Generator[DeviceInfo, None, None]:
+        yield_counter = count
+
+        self.__logger.debug("Loading device info", source=self.history_database or self.devices_folder, workers=self.workers)
+
+        if self.history_database:
+            readings = self.__from_history(calculation_moment, count)
+            if readings is not None:
+                yield from readings
+                return
+
+        parsed = self.__parse_in_pool(self.sources()) if self.workers > 0 else self.__parse(self.sources())
+        for device_info in parsed:
+            last_time_stamp = LastTimeStamp.last_time_stamp_in_utc(device_info)
+
+            if last_time_stamp <= calculation_moment:
+                yield device_info
+                yield_counter += -1
+                if yield_counter <= 0:
+                    return
+
+    def window(self, calculation_moment: datetime.datetime, count: int = 600, without_newest: bool = False) -> DeviceInfoWindow:
+        """The latest device infos oldest first, with the state every blocker and provider shares built once as they're added"""
+        device_infos = list(self.latest_device_infos(calculation_moment, count))
+        if without_newest:
+            device_infos = device_infos[1:]
+        device_infos.reverse()
+        return DeviceInfoWindow(device_infos)
+
+    def __from_history(self, calculation_moment: datetime.datetime, count: int) -> Optional[Iterator[DeviceRecord]]:
+        """The readings from the history, or nothing when it's too far behind the downloads to catch up within a run.
+
+        It then catches up a bit at a time, oldest first, while each run reads the files.
+        """
+        limit = int(Installation.setting("ACT_HISTORY_INGEST_LIMIT", "120"))
+        with DeviceHistory(self.history_database) as history:
+            with Tracer.span("ingest"):
+                pending = self.pending(history)
+                self.__add(history, pending[:limit])
+            if len(pending) > limit:
+                self.__logger.warning("Reading the files while the history catches up", behind=len(pending) - limit, limit=limit)
+                return None
+            with Tracer.span("query"):
+                readings = history.latest(self.device_id, calculation_moment, count)
+        return (DeviceRecord(fields, functools.partial(DeviceInfoLoader.read_download, self.devices_folder, file_name, self.device_id)) for file_name, fields in readings)
+
+    def ingest(self, history: DeviceHistory) -> int:
+        """Add the downloads the history doesn't have yet and return how many readings were added"""
+        return self.__add(history, self.pending(history))
+
+    def pending(self, history: DeviceHistory) -> List[Tuple[str, str]]:
+        """The sources the history doesn't have yet, oldest first, each with its path and its path relative to the downloads.
+
+        The newest are found first, stopping at one which is already in, so adding them oldest first lets an ingest which is interrupted carry on where it stopped.
+        Sources which couldn't be read before are included again, as a scan stopping at a newer one wouldn't find them.
+        """
+        sources = []
+        for source in self.sources():
+            # A download which arrived after its day was packed is added on its own, as the pack may have been added already
+            if DeviceArchive.is_archive(source):
+                for late_download in DeviceInfoLoader.late_downloads(source):
+                    relative_late_download = os.path.relpath(late_download, self.devices_folder)
+                    if not history.is_ingested(relative_late_download):
+                        sources.append((late_download, relative_late_download))
+            relative_source = os.path.relpath(source, self.devices_folder)
+            if history.is_ingested(relative_source):
+                break
+            sources.append((source, relative_source))
+
+        found = {relative_source for _, relative_source in sources}
+        sources.extend((os.path.join(self.devices_folder, relative_source), relative_source) for relative_source in history.unreadable() if relative_source not in found)
+        sources.reverse()
+        return sources
+
+    def __add(self, history: DeviceHistory, sources: List[Tuple[str, str]]) -> int:
+        added = 0
+        for source, relative_source in sources:
+            devices = list(DeviceInfoLoader.read_devices(source, self.device_id))
+            if devices:
+                added += history.add(relative_source, devices)
+                continue
+            # It may still be being written so it's tried again next time, until it's clearly broken
+            attempts = history.add_unreadable(relative_source)
+            if attempts >= DeviceInfoLoader.unreadable_attempts:
+                self.__logger.warning("Giving up on a download which can't be read", source=relative_source, attempts=attempts)
+                history.add(relative_source, [])
+        return added
+
+    def sources(self, folder: Optional[str] = None) -> Iterator[str]:
+        """Loose downloads and packed days interleaved newest first.
+
+        A day which has been packed has its folder skipped, and any downloads left in it are read along with the archive.
+        """
+        folder = folder or self.devices_folder
+        try:
+            entries = list(os.scandir(folder))
+        except FileNotFoundError:
+            return
+        names = {entry.name for entry in entries}
+        for entry in sorted(entries, key=lambda entry: entry.name[: -len(DeviceArchive.suffix)] if DeviceArchive.is_archive(entry.name) else entry.name, reverse=True):
+            if entry.is_dir():
+                if entry.name + DeviceArchive.suffix not in names:
+                    yield from self.sources(entry.path)
+            elif entry.name.startswith("devices_") or DeviceArchive.is_archive(entry.name):
+                yield entry.path
+
+    def __parse(self, sources: Iterator[str]) -> Iterator[DeviceRecord]:
+        for source in sources:
+            with Tracer.span("parse", file=os.path.basename(source)):
+                devices = list(DeviceInfoLoader.read_devices(source, self.device_id))
+            for file_name, device in devices:
+                yield DeviceRecord(device, self.__fetch_original(source, file_name))
+
+    def __parse_in_pool(self, sources: Iterator[str]) -> Iterator[DeviceRecord]:
+        """Keeps the order of the files however quickly each is parsed. Files go to the workers in batches so the hand-over doesn't cost more than the parsing."""
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        in_flight: Deque[Tuple[List[str], Future]] = deque()
+        try:
+            for batch in DeviceInfoLoader.__batches(sources):
+                in_flight.append((batch, executor.submit(DeviceInfoLoader.read_fields, batch, self.device_id)))
+                if len(in_flight) > self.workers * 2:
+                    yield from self.__collect(*in_flight.popleft())
+            while in_flight:
+                yield from self.__collect(*in_flight.popleft())
+        finally:
+            # Whatever is still in flight isn't wanted when the caller has had enough. Cancelled one by one as cancel_futures needs Python 3.9.
+            for _, future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def __batches(sources: Iterator[str]) -> Iterator[List[str]]:
+        """Loose files a batch at a time, but a packed day on its own as it's already a day's worth"""
+        batch: List[str] = []
+        for source in sources:
+            if DeviceArchive.is_archive(source):
+                if batch:
+                    yield batch
+                    batch = []
+                yield [source]
+            else:
+                batch.append(source)
+                if len(batch) >= DeviceInfoLoader.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def __collect(self, batch: List[str], future: Future) -> Iterator[DeviceRecord]:
+        with Tracer.span("parse", files=len(batch)):
+            batch_fields = future.result()
+        for source, file_name, fields in batch_fields:
+            yield DeviceRecord(fields, self.__fetch_original(source, file_name))
+
+    def __fetch_original(self, source: str, file_name: str) -> Callable[[], Dict]:
+        if DeviceArchive.is_archive(source):
+            return functools.partial(DeviceInfoLoader.read_packed_device, source, file_name, self.device_id)
+        return functools.partial(DeviceInfoLoader.read_device, source, self.device_id)
+
+    @staticmethod
+    def read_fields(sources: List[str], device_id: str) -> List[Tuple[str, str, Dict]]:
+        """Only the fields a DeviceRecord keeps, which is all that needs to come back from a worker, along with where each device came from"""
+        batch_fields = []
+        for source in sources:
+            for file_name, device in DeviceInfoLoader.read_devices(source, device_id):
+                batch_fields.append((source, file_name, {name: device[name] for name in DeviceRecord.fields if name in device}))
+        return batch_fields
+
+    @staticmethod
+    def read_devices(source: str, device_id: str) -> Iterator[Tuple[str, Dict]]:
+        """The device from a loose download, or from each download in a packed day, newest first. Downloads which can't be read are skipped.
+
+        A packed day includes the downloads left in its folder which the archive doesn't hold, such as ones which arrived after it was packed.
+        """
+        if not DeviceArchive.is_archive(source):
+            try:
+                yield os.path.basename(source), DeviceInfoLoader.read_device(source, device_id)
+            except:
+                pass
+            return
+
+        try:
+            snapshots = list(DeviceArchive.snapshots(source))
+        except:
+            snapshots = []
+        packed: List[Tuple[str, Callable[[], Dict]]] = [(file_name, functools.partial(DeviceInfoLoader.select_device, buildings, device_id)) for file_name, buildings in snapshots]
+        packed_names = {file_name for file_name, _ in snapshots}
+        late: List[Tuple[str, Callable[[], Dict]]] = [
+            (os.path.basename(path), functools.partial(DeviceInfoLoader.read_device, path, device_id))
+            for path in DeviceInfoLoader.late_downloads(source)
+            if os.path.basename(path) not in packed_names
+        ]
+        for file_name, read in heapq.merge(packed, late, key=lambda download: download[0], reverse=True):
+            try:
+                yield file_name, read()
+            except:
+                continue
+
+    @staticmethod
+    def late_downloads(archive_path: str) -> List[str]:
+        """The downloads still in the folder of a packed day, newest first"""
+        day_folder = archive_path[: -len(DeviceArchive.suffix)]
+        try:
+            return sorted((entry.path for entry in os.scandir(day_folder) if entry.name.startswith("devices_")), reverse=True)
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def read_download(devices_folder: str, file_name: str, device_id: str) -> Dict:
+        """The device from the download with this name, wherever it is now that its day may have been packed"""
+        day_folder = os.path.join(devices_folder, file_name[8:12], file_name[13:15], file_name[16:18])
+        if os.path.exists(os.path.join(day_folder, file_name)):
+            return DeviceInfoLoader.read_device(os.path.join(day_folder, file_name), device_id)
+        return DeviceInfoLoader.read_packed_device(day_folder + DeviceArchive.suffix, file_name, device_id)
+
+    @staticmethod
+    def read_packed_device(archive_path: str, file_name: str, device_id: str) -> Dict:
+        """The device from a packed day, which may be a download left in the day's folder"""
+        late_download = os.path.join(archive_path[: -len(DeviceArchive.suffix)], file_name)
+        if os.path.exists(late_download):
+            return DeviceInfoLoader.read_device(late_download, device_id)
+        return DeviceInfoLoader.select_device(DeviceArchive.read_buildings(archive_path, file_name), device_id)
+
+    @staticmethod
+    def read_device(file_path: str, device_id: str) -> Dict:
+        """The device without its ListHistory24Formatters"""
+        with open(file_path, "rb") as devices:
+            return DeviceInfoLoader.select_device(DeviceJson.loads(devices.read()), device_id)
+
+    @staticmethod
+    def select_device(buildings: List[Dict], device_id: str) -> Dict:
+        """The device with the id from any building, or the only device when the download is for a single heat pump"""
+        devices = [device for building in buildings for device in building["Structure"]["Devices"]]
+        for device in devices:
+            if str(device["DeviceID"]) == device_id:
+                return device["Device"]
+
+        if len(devices) == 1:
+            return devices[0]["Device"]
+
+        raise Exception(f"There is no device {device_id} among the {len(devices)} devices")
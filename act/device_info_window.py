@@ -0,0 +1,80 @@
+import bisect
+import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .controller_state import ControllerState
+from .device_infos import DeviceInfo, DeviceInfos
+from .last_time_stamp import LastTimeStamp
+from .rolling_aggregate import RollingAggregate
+
+
+# --------------------------------------------------------------------------------
+class DeviceInfoWindow(list):
+    """The time-ordered device infos being operated on, along with state which is kept up to date as readings are appended.
+
+    Only append and extend maintain the state. Slicing gives an ordinary list.
+    """
+
+    def __init__(self, device_infos: Iterable[DeviceInfo] = (), maxlen: Optional[int] = None) -> None:
+        super().__init__()
+        self.maxlen = maxlen
+        self.state = ControllerState()
+        self.__moments: List[datetime.datetime] = []
+        self.__aggregates: Dict[Tuple[str, int, int], RollingAggregate] = {}
+        self.extend(device_infos)
+
+    @staticmethod
+    def of(device_infos: DeviceInfos) -> "DeviceInfoWindow":
+        """The window a run built, or a new one for a plain list which is then built afresh on every call. Runs get theirs from DeviceInfoLoader.window."""
+        if isinstance(device_infos, DeviceInfoWindow):
+            return device_infos
+        return DeviceInfoWindow(device_infos)
+
+    def append(self, device_info: DeviceInfo) -> None:
+        super().append(device_info)
+
+        # Readings without a time stamp can't contribute to any timers
+        if "LastTimeStamp" in device_info:
+            moment = LastTimeStamp.last_time_stamp_in_utc(device_info)
+            self.__moments.append(moment)
+            self.state.update(moment, device_info)
+
+        for (field, _, _), aggregate in self.__aggregates.items():
+            DeviceInfoWindow.__append_number(aggregate, device_info, field)
+
+        if self.maxlen is not None and len(self) > self.maxlen:
+            oldest = self[0]
+            del self[0]
+            if "LastTimeStamp" in oldest:
+                del self.__moments[0]
+                if self.__moments:
+                    self.state.forget_before(self.__moments[0])
+                else:
+                    self.state = ControllerState()
+
+    def extend(self, device_infos: Iterable[DeviceInfo]) -> None:
+        for device_info in device_infos:
+            self.append(device_info)
+
+    def count_since(self, moment: datetime.datetime) -> int:
+        """How many readings are at or after the moment"""
+        return len(self.__moments) - bisect.bisect_left(self.__moments, moment)
+
+    def rolling(self, field: str, size: int, lag: int = 0) -> RollingAggregate:
+        """Aggregates of a field over the most recent readings, which are then kept up to date as readings are appended"""
+        key = (field, size, lag)
+        aggregate = self.__aggregates.get(key)
+        if aggregate is None:
+            aggregate = RollingAggregate(size, lag)
+            for device_info in self[-(size + lag) :]:
+                DeviceInfoWindow.__append_number(aggregate, device_info, field)
+            self.__aggregates[key] = aggregate
+        return aggregate
+
+    @staticmethod
+    def __append_number(aggregate: RollingAggregate, device_info: DeviceInfo, field: str) -> None:
+        """A reading without a number for the field is left out rather than stop the run"""
+        try:
+            aggregate.append(float(device_info[field]))
+        except (KeyError, TypeError, ValueError):
+            pass
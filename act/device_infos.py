@@ -1,6 +1,6 @@
-from typing import Dict
-from typing import List
+from typing import Any, List, Mapping
 
-DeviceInfo = Dict
+# A plain dict, or a DeviceRecord once it has been through the loader
+DeviceInfo = Mapping[str, Any]
 
 DeviceInfos = List[DeviceInfo]
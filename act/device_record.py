@@ -0,0 +1,87 @@
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional
+
+_MISSING = object()
+
+
+# --------------------------------------------------------------------------------
+class DeviceRecord(Mapping[str, Any]):
+    """One device info holding just the fields the providers use, each converted once when it's parsed.
+
+    It reads like the dict it came from. Any other field comes from the original, which is fetched again when first asked for rather than kept.
+    """
+
+    temperatures = [
+        "FlowTemperature",
+        "ReturnTemperature",
+        "TankWaterTemperature",
+        "SetTankWaterTemperature",
+        "OutdoorTemperature",
+        "RoomTemperatureZone1",
+        "TargetHCTemperatureZone1",
+        "SetHeatFlowTemperatureZone1",
+        "HeatPumpFrequency",
+    ]
+    # Energy used since the last reading, in kWh
+    rates = ["HeatingEnergyConsumedRate1", "HotWaterEnergyConsumedRate1"]
+    switches = ["Power", "ForcedHotWaterMode", "HolidayMode", "Offline", "IdleZone1"]
+    others = ["LastTimeStamp", "DefrostMode", "OperationMode", "DeviceID"]
+    fields = temperatures + rates + switches + others
+    __fields = frozenset(fields)
+
+    __slots__ = fields + ["_original", "_fetch_original"]
+
+    def __init__(self, device: Mapping[str, Any], fetch_original: Optional[Callable[[], Dict]] = None) -> None:
+        """Without a way to fetch the original again it is kept instead"""
+        for name in DeviceRecord.temperatures + DeviceRecord.rates:
+            value = device.get(name)
+            setattr(self, name, _MISSING if value is None else float(value))
+        for name in DeviceRecord.switches:
+            value = device.get(name, _MISSING)
+            setattr(self, name, value if value is _MISSING else bool(value))
+        for name in DeviceRecord.others:
+            setattr(self, name, device.get(name, _MISSING))
+        self._fetch_original = fetch_original
+        self._original: Optional[Dict] = None if fetch_original else dict(device)
+
+    def original(self) -> Dict:
+        if self._original is None and self._fetch_original is not None:
+            self._original = self._fetch_original()
+        return self._original or {}
+
+    def __getitem__(self, name: str) -> Any:
+        if name in DeviceRecord.__fields:
+            value = getattr(self, name)
+            if value is _MISSING:
+                raise KeyError(f"The device info from {self.get('LastTimeStamp', 'an unknown time')} has no {name}")
+            return value
+        return self.original()[name]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in DeviceRecord.__fields:
+            value = getattr(self, key)
+            return default if value is _MISSING else value
+        return self.original().get(key, default)
+
+    def __contains__(self, name: object) -> bool:
+        # The downloads only have names as keys, so anything else can't be in the original either
+        if not isinstance(name, str):
+            return False
+        if name in DeviceRecord.__fields:
+            return getattr(self, name) is not _MISSING
+        return name in self.original()
+
+    def __iter__(self) -> Iterator[str]:
+        yielded = set()
+        for name in DeviceRecord.fields:
+            if getattr(self, name) is not _MISSING:
+                yielded.add(name)
+                yield name
+        for name in self.original():
+            if name not in yielded:
+                yield name
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"DeviceRecord({ {name: getattr(self, name) for name in DeviceRecord.fields if getattr(self, name) is not _MISSING} })"
@@ -3,6 +3,7 @@ import math
 
 from .device_infos import DeviceInfos
 from .effective_temperature import EffectiveTemperature
+from .next_evaluation import NextEvaluation
 
 
 # --------------------------------------------------------------------------------
@@ -41,6 +42,7 @@ class Dwell:
             pass
 
         dwell_time = 360.0
+        NextEvaluation.hint_time_of_day(calculation_moment, [datetime.time(0), datetime.time(6)], "The night's longer dwell starts or ends")
         hour = calculation_moment.hour
         if hour < 6:
             dwell_time = dwell_time * 2
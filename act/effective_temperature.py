@@ -1,15 +1,25 @@
 import datetime
+import functools
 import math
 import os
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
 
 import structlog
 import typer
 
+from .deadlines import Deadlines
+from .mapped_lines import MappedLines
+from .run_metrics import RunMetrics
+from .state_paths import StatePaths
+
 app = typer.Typer()
+logger = structlog.get_logger()
 
 
 class EffectiveTemperature:
+    # Used instead of the weather folder when set, for example by the simulator
+    statistics_source: Optional[Callable[[datetime.datetime], Dict]] = None
+
     @app.command()
     @staticmethod
     def apparent_temp(
@@ -60,6 +70,9 @@ class EffectiveTemperature:
     def interesting_statistics(calculation_moment: datetime.datetime) -> Dict:
         """Go backwards from calc time in case there is no data at that specific time (there won't be)"""
 
+        if EffectiveTemperature.statistics_source is not None:
+            return EffectiveTemperature.statistics_source(calculation_moment)
+
         default_weather = {
             "wind": 0,
             "outdoorTemperature": 10,
@@ -67,21 +80,29 @@ class EffectiveTemperature:
             "moment": calculation_moment,
         }
 
-        weather_data_root_folder = "/weather"
+        weather_data_root_folder = StatePaths.weather_root()
         if not os.path.exists(weather_data_root_folder):
-            structlog.get_logger().debug(f"Unable to find weather folder {weather_data_root_folder}")
+            logger.debug("Unable to find weather folder", folder=weather_data_root_folder)
             return default_weather
 
         time_filter = calculation_moment.isoformat()[:19].replace("T", " ")
         tolerance = calculation_moment - datetime.timedelta(minutes=60)
         tolerance_filter = tolerance.isoformat()[:19].replace("T", " ")
 
-        weather_info = EffectiveTemperature.walk_files(weather_data_root_folder, time_filter, tolerance_filter)
+        with RunMetrics.measure("weather"):
+            # Without the weather the callers use the OutdoorTemperature in the device info
+            weather_info = Deadlines.call("weather", lambda: EffectiveTemperature.shared_walk_files(weather_data_root_folder, time_filter, tolerance_filter), lambda: None)
         if weather_info:
-            return weather_info
+            return dict(weather_info)
 
         raise Exception(f"Unable to find weather data for {calculation_moment.isoformat()}")
 
+    @staticmethod
+    @functools.lru_cache(maxsize=16)
+    def shared_walk_files(weather_data_root_folder, time_filter, tolerance_filter) -> Optional[Dict]:
+        """The providers, and every installation in a fleet, ask about the same moment many times in a run so share the answer, which must not be altered"""
+        return EffectiveTemperature.walk_files(weather_data_root_folder, time_filter, tolerance_filter)
+
     @staticmethod
     def walk_files(weather_data_root_folder, time_filter, tolerance_filter) -> Optional[Dict]:
         for root, dirs, files in os.walk(weather_data_root_folder, topdown=True):
@@ -90,27 +111,35 @@ class EffectiveTemperature:
 
             for file_name in files:
                 full_path = os.path.join(root, file_name)
-                with open(full_path, encoding="utf-8") as weather_file:
-                    for line in reversed(weather_file.readlines()):
-                        parts = line.split(",")
-                        moment = parts[0]
-                        if moment < tolerance_filter:
-                            raise Exception(f"Unable to find weather data beyond tolerance of {tolerance_filter}")
-
-                        if moment < time_filter:
-                            if parts[7] and parts[4] and parts[5]:
-                                wind = float(parts[7])  # average
-                                relative_humidity = float(parts[4])
-                                outdoor_temperature = float(parts[5])
-                                if wind is not None:
-                                    if relative_humidity is not None:
-                                        # logging.debug("Getting weather stats from " + fullPath + " and moment " + str(moment))
-                                        return {
-                                            "wind": wind,
-                                            "outdoorTemperature": outdoor_temperature,
-                                            "outdoorRelativeHumidity": relative_humidity,
-                                            "moment": datetime.datetime.strptime(moment, "%Y-%m-%d %H:%M:%S"),
-                                        }
+                # Only the lines from the end back to the moment are read out of the file
+                for line in MappedLines.backwards(full_path):
+                    weather = EffectiveTemperature.__weather_before(line, time_filter, tolerance_filter)
+                    if weather is not None:
+                        return weather
+
+        return None
+
+    @staticmethod
+    def __weather_before(line: str, time_filter: str, tolerance_filter: str) -> Optional[Dict]:
+        parts = line.split(",")
+        moment = parts[0]
+        if moment < tolerance_filter:
+            raise Exception(f"Unable to find weather data beyond tolerance of {tolerance_filter}")
+
+        if moment < time_filter:
+            if parts[7] and parts[4] and parts[5]:
+                wind = float(parts[7])  # average
+                relative_humidity = float(parts[4])
+                outdoor_temperature = float(parts[5])
+                if wind is not None:
+                    if relative_humidity is not None:
+                        # logging.debug("Getting weather stats from " + fullPath + " and moment " + str(moment))
+                        return {
+                            "wind": wind,
+                            "outdoorTemperature": outdoor_temperature,
+                            "outdoorRelativeHumidity": relative_humidity,
+                            "moment": datetime.datetime.strptime(moment, "%Y-%m-%d %H:%M:%S"),
+                        }
 
         return None
 
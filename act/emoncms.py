@@ -2,15 +2,24 @@ import datetime
 import json
 import os
 import pprint
+from typing import Callable, Dict, Optional
 
 import urllib3
 from dotenv import load_dotenv
 
+from act.deadlines import Deadlines
+from act.installation import Installation
+from act.run_metrics import RunMetrics
+from act.state_paths import StatePaths
+
 load_dotenv()
 
 
 # --------------------------------------------------------------------------------
 class EmonCMS:
+    # Used instead of asking EmonCMS when set, for example by the simulator
+    feed_value_source: Optional[Callable[[int, datetime.datetime], Dict]] = None
+
     @staticmethod
     def get_feed_values(feed_id: int, moment: datetime.datetime = datetime.datetime.utcnow(), duration: int = 300, interval: int = 10):
         http = urllib3.PoolManager()
@@ -19,11 +28,11 @@ class EmonCMS:
         end = moment.timestamp() * 1000
 
         url = (
-            os.environ["EMONCMS_URL"]
+            Installation.setting("EMONCMS_URL")
             + "feed/data.json?id="
             + str(feed_id)
             + "&apikey="
-            + os.environ["EMONCMS_API_KEY"]
+            + Installation.setting("EMONCMS_API_KEY")
             + "&start="
             + str(start)
             + "&end="
@@ -49,9 +58,48 @@ class EmonCMS:
 
     @staticmethod
     def get_feed_value(feed_id: int, moment: datetime.datetime = datetime.datetime.utcnow()):
-        values = EmonCMS.get_feed_values(feed_id, moment, 300, 10)
+        if EmonCMS.feed_value_source is not None:
+            return EmonCMS.feed_value_source(feed_id, moment)
+
+        with RunMetrics.measure("emoncms"):
+            values = Deadlines.call("emoncms", lambda: EmonCMS.get_feed_values(feed_id, moment, 300, 10), lambda: None)
+        if values is None:
+            return EmonCMS.last_known_feed_value(feed_id, moment)
+
+        EmonCMS.__remember_feed_value(feed_id, values[-1])
         return values[-1]
 
+    @staticmethod
+    def last_known_feed_value(feed_id: int, moment: datetime.datetime) -> Dict:
+        """The last value EmonCMS gave for the feed, or nothing at all when it has never answered or the value is too old to say much about the moment"""
+        nothing = {"time": None, "value": 0.0}
+        try:
+            with open(EmonCMS.__cache_path(feed_id), encoding="utf-8") as cache_file:
+                remembered = json.load(cache_file)
+        except (OSError, ValueError):
+            return nothing
+
+        # EmonCMS times its readings in milliseconds
+        max_age_seconds = float(Installation.setting("ACT_EMONCMS_MAX_AGE_SECONDS", "600"))
+        if remembered.get("time") is None or moment.timestamp() - remembered["time"] / 1000 > max_age_seconds:
+            return nothing
+        return remembered
+
+    @staticmethod
+    def __remember_feed_value(feed_id: int, value: Dict) -> None:
+        path = EmonCMS.__cache_path(feed_id)
+        if not os.path.exists(StatePaths.state_root()):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial_path = f"{path}.{os.getpid()}.tmp"
+        with open(partial_path, "w", encoding="utf-8") as cache_file:
+            json.dump(value, cache_file)
+        os.replace(partial_path, path)
+
+    @staticmethod
+    def __cache_path(feed_id: int) -> str:
+        return os.path.join(StatePaths.state_root(), "cache", "emoncms", f"{feed_id}.json")
+
 
 # --------------------------------------------------------------------------------
 def main():
@@ -0,0 +1,95 @@
+import datetime
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import structlog
+import typer
+
+from act.act import Act
+from act.installation import Installation
+
+
+# --------------------------------------------------------------------------------
+class Fleet:
+    """Evaluates many installations each tick with a bounded pool of workers.
+
+    Each worker activates its installation so the state root, credentials and device id come from the fleet configuration.
+    The weather and schedule lookups are cached per process so installations sharing a weather station share the work.
+    """
+
+    def __init__(self, installations: List[Installation], workers: int = 4, dry_run: bool = False, adaptive: bool = False) -> None:
+        self.installations = installations
+        self.workers = workers
+        self.dry_run = dry_run
+        self.adaptive = adaptive
+        self.__act = Act()
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    @staticmethod
+    def load(path: str) -> List[Installation]:
+        """A JSON file like {"installations": [{"name": "home", "environment": {"DEVICE_ID": "1", "ACT_STATE_ROOT": "/state/home"}}]}"""
+        with open(path, encoding="utf-8") as configuration_file:
+            configuration = json.load(configuration_file)
+
+        installations = [Installation(entry["name"], entry.get("environment", {})) for entry in configuration["installations"]]
+        names = [installation.name for installation in installations]
+        if len(set(names)) != len(names):
+            raise Exception("Each installation in the fleet needs a different name")
+        return installations
+
+    def run_once(self, calculation_moment: Optional[str] = None) -> Dict[str, str]:
+        """Every installation is evaluated as of the same moment. One installation failing doesn't stop the others."""
+        moment = calculation_moment or datetime.datetime.utcnow().isoformat()[:19]
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="Fleet") as executor:
+            futures = {installation.name: executor.submit(self.__evaluate, installation, moment) for installation in self.installations}
+
+        outcomes = {name: future.result() for name, future in futures.items()}
+        failures = sum(1 for outcome in outcomes.values() if outcome != "ok")
+        self.__logger.info("Fleet evaluated", calculation_moment=moment, installations=len(outcomes), failures=failures, seconds=round(time.perf_counter() - started, 3))
+        return outcomes
+
+    def __evaluate(self, installation: Installation, moment: str) -> str:
+        with installation.activate():
+            try:
+                self.__act.act(calculation_moment=moment, dry_run=self.dry_run, metrics_file=None, trace_file=None, profile=None, adaptive=self.adaptive)
+            except Exception as err:
+                self.__logger.exception("Installation failed")
+                return f"failed: {err}"
+        return "ok"
+
+    def run(self, interval_seconds: int, iterations: Optional[int] = None) -> None:
+        runs = 0
+        while iterations is None or runs < iterations:
+            if runs:
+                time.sleep(interval_seconds - time.time() % interval_seconds)
+            self.run_once()
+            runs += 1
+
+
+# --------------------------------------------------------------------------------
+def fleet(
+    *,
+    configuration: str = typer.Option(..., help="JSON file listing the installations and their settings."),
+    workers: int = typer.Option(default=4, help="How many installations are evaluated at once."),
+    dry_run: bool = typer.Option(default=False, help="Run without sending commands."),
+    calculation_moment: Optional[str] = typer.Option(default=None, help="Evaluate once as though it is this UTC moment in ISO8601 format."),
+    interval_seconds: int = typer.Option(default=60, help="Seconds between ticks, aligned to the clock."),
+    iterations: Optional[int] = typer.Option(default=None, help="Stop after this many ticks."),
+    adaptive: bool = typer.Option(default=False, envvar="ACT_ADAPTIVE", help="Skip an installation's runs until the next moment anything could change for it."),
+) -> None:
+    """
+    Instruct every heatpump in the fleet to perform actions.
+    """
+    runner = Fleet(Fleet.load(configuration), workers, dry_run, adaptive)
+    if calculation_moment:
+        print(json.dumps(runner.run_once(calculation_moment), indent=4))
+    else:
+        runner.run(interval_seconds, iterations)
+
+
+if __name__ == "__main__":
+    typer.run(fleet)
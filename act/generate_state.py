@@ -0,0 +1,326 @@
+import contextlib
+import datetime
+import json
+import math
+import os
+import random
+from collections import deque
+from dataclasses import dataclass, field
+from typing import IO, Deque, Dict, List, Optional
+
+import pytz
+import structlog
+import typer
+
+from act.action import Action
+from act.device_infos import DeviceInfo
+from act.simulator import SimulatedHouse, SimulatedWeather
+
+# The fields which are recorded in the observations log
+OBSERVED_FIELDS = [
+    "Power",
+    "OperationMode",
+    "ForcedHotWaterMode",
+    "DefrostMode",
+    "HeatPumpFrequency",
+    "OutdoorTemperature",
+    "RoomTemperatureZone1",
+    "FlowTemperature",
+    "ReturnTemperature",
+    "TankWaterTemperature",
+    "SetTankWaterTemperature",
+    "TargetHCTemperatureZone1",
+]
+
+# The fields which MELCloud keeps a day of history for in ListHistory24Formatters
+HISTORY_FIELDS = [
+    "FlowTemperature",
+    "ReturnTemperature",
+    "TankWaterTemperature",
+    "OutdoorTemperature",
+    "RoomTemperatureZone1",
+    "HeatPumpFrequency",
+    "TargetHCTemperatureZone1",
+    "SetTankWaterTemperature",
+    "HeatingEnergyConsumedRate1",
+    "HotWaterEnergyConsumedRate1",
+]
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class GeneratedPeriod:
+    """The stretch of time written and how often each kind of reading is taken in it"""
+
+    start: datetime.datetime
+    days: int
+    interval_seconds: int = 60
+    weather_interval_seconds: int = 300
+
+    @property
+    def tick_seconds(self) -> int:
+        return math.gcd(math.gcd(self.interval_seconds, self.weather_interval_seconds), 60)
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class SyntheticDevice:
+    """The made up heat pump's id and the day of history MELCloud would keep for it"""
+
+    random: random.Random
+    history_points: int
+    device_id: int = 0
+    history: Dict[str, Deque[float]] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self.history = {name: deque(maxlen=self.history_points) for name in HISTORY_FIELDS}
+        self.device_id = 10000 + self.random.randint(0, 89999)
+
+
+# --------------------------------------------------------------------------------
+class StateTreeGenerator:
+    """Writes synthetic downloads, weather and observations laid out the way production keeps them.
+
+    The readings come from the simulated house under a plain thermostat, so they move together the way real ones do.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        start: datetime.datetime,
+        days: int,
+        *,
+        interval_seconds: int = 60,
+        weather_interval_seconds: int = 300,
+        history_points: int = 288,
+        seed: int = 1,
+    ) -> None:
+        self.root = root
+        self.__period = GeneratedPeriod(start, days, interval_seconds, weather_interval_seconds)
+        self.__device = SyntheticDevice(random.Random(seed), history_points)
+        self.__weather = SimulatedWeather(start, days, mean_outdoor_temperature=5.0, seed=seed)
+        self.__house = SimulatedHouse()
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    @property
+    def state_root(self) -> str:
+        return os.path.join(self.root, "state")
+
+    @property
+    def weather_root(self) -> str:
+        return os.path.join(self.root, "weather")
+
+    def generate(self, devices: bool = True, weather: bool = True, observations: bool = True) -> Dict[str, int]:
+        london = pytz.timezone("Europe/London")
+        counts = {"devices": 0, "weather": 0, "observations": 0}
+
+        with contextlib.ExitStack() as files:
+            observations_file: Optional[IO] = None
+            if observations:
+                observations_folder = os.path.join(self.state_root, "observations")
+                os.makedirs(observations_folder, exist_ok=True)
+                observations_file = files.enter_context(open(os.path.join(observations_folder, "values.txt"), "w", encoding="utf-8"))
+                observations_file.write("\t".join(["Moment"] + OBSERVED_FIELDS) + "\n")
+
+            # A day of weather is small so it's written in one go
+            weather_path = None
+            weather_lines: List[str] = []
+
+            period = self.__period
+            for tick in range(period.days * 86400 // period.tick_seconds):
+                elapsed = tick * period.tick_seconds
+                moment = period.start + datetime.timedelta(seconds=elapsed)
+                outdoor_temperature = self.__weather.outdoor_temperature(moment)
+
+                if elapsed % period.interval_seconds == 0:
+                    self.__thermostat(moment.astimezone(london))
+                    device_info = self.__house.device_info(moment, outdoor_temperature)
+                    for name, history in self.__device.history.items():
+                        history.append(device_info[name])
+
+                    if devices:
+                        self.__write_devices(moment, device_info)
+                        counts["devices"] += 1
+
+                    if observations_file:
+                        values = [str(device_info[field]) for field in OBSERVED_FIELDS]
+                        observations_file.write("\t".join([moment.isoformat()[:19]] + values) + "\n")
+                        counts["observations"] += 1
+
+                if weather and elapsed % period.weather_interval_seconds == 0:
+                    path = self.__weather_path(moment)
+                    if path != weather_path:
+                        StateTreeGenerator.__write_weather(weather_path, weather_lines)
+                        weather_path = path
+                        weather_lines = []
+                    weather_lines.append(self.__weather_line(moment))
+                    counts["weather"] += 1
+
+                if elapsed % 60 == 0:
+                    self.__house.draw_hot_water(moment.astimezone(london))
+                self.__house.step(period.tick_seconds, outdoor_temperature, self.__weather.solar_power(moment))
+
+            StateTreeGenerator.__write_weather(weather_path, weather_lines)
+
+        self.__logger.info("Generated state tree", root=self.root, **counts)
+        return counts
+
+    def __thermostat(self, local_moment: datetime.datetime) -> None:
+        house = self.__house
+        if house.temperatures.room < 19.5 and not house.settings.power:
+            house.apply(Action("SetHeatFlowTemperatureZone1", 40.0, "Thermostat"))
+            house.apply(Action("Power", "true", "Thermostat"))
+        elif house.temperatures.room > 21 and house.settings.power and not house.settings.forced_hot_water:
+            house.apply(Action("Power", "false", "Thermostat"))
+
+        if local_moment.hour == 5 and local_moment.minute == 0 and house.temperatures.tank < 45:
+            house.apply(Action("ForcedHotWaterMode", "true", "Thermostat"))
+            house.apply(Action("Power", "true", "Thermostat"))
+
+    def __write_devices(self, moment: datetime.datetime, device_info: DeviceInfo) -> None:
+        folder = os.path.join(self.state_root, "downloads", "raw", "{:%Y}".format(moment), "{:%m}".format(moment), "{:%d}".format(moment))
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, "devices_{:%Y-%m-%dT%H%M%S}Z.json".format(moment))
+        with open(path, "w", encoding="utf-8") as devices:
+            json.dump(self.__devices_document(device_info), devices)
+
+    def __devices_document(self, device_info: DeviceInfo) -> List[Dict]:
+        """Shaped like the MELCloud ListDevices response"""
+        device = dict(device_info)
+        device.update(
+            {
+                "DeviceID": self.__device.device_id,
+                "DeviceType": 1,
+                "EffectiveFlags": 0,
+                "UnitStatus": 0,
+                "HasZone2": False,
+                "Zone1Name": None,
+                "Zone2Name": None,
+                "IdleZone1": not device_info["Power"],
+                "IdleZone2": True,
+                "ProhibitZone1": False,
+                "ProhibitZone2": False,
+                "ProhibitHotWater": False,
+                "EcoHotWater": False,
+                "OperationModeZone1": 1,
+                "OperationModeZone2": 2,
+                "SetTemperatureZone1": 20.0,
+                "SetTemperatureZone2": 20.0,
+                "SetHeatFlowTemperatureZone2": 20.0,
+                "SetCoolFlowTemperatureZone1": 20.0,
+                "SetCoolFlowTemperatureZone2": 20.0,
+                "TargetHCTemperatureZone2": 20.0,
+                "RoomTemperatureZone2": -39.0,
+                "FlowTemperatureZone1": device_info["FlowTemperature"],
+                "ReturnTemperatureZone1": device_info["ReturnTemperature"],
+                "FlowTemperatureBoiler": 25.0,
+                "ReturnTemperatureBoiler": 25.0,
+                "MaxTankTemperature": 60.0,
+                "TemperatureIncrement": 0.5,
+                "CurrentEnergyConsumed": 0,
+                "CurrentEnergyProduced": 0,
+                "HeatingEnergyConsumedRate2": 0,
+                "HeatingEnergyProducedRate1": round(device_info["HeatingEnergyConsumedRate1"] * 3, 2),
+                "HotWaterEnergyProducedRate1": round(device_info["HotWaterEnergyConsumedRate1"] * 2.5, 2),
+                "WifiSignalStrength": -50 - self.__device.random.randint(0, 20),
+                "WifiAdapterStatus": "NORMAL",
+                "FirmwareAppVersion": 19000,
+                "HasEnergyConsumedMeter": True,
+                "Units": [
+                    {"ID": 1, "Device": 0, "SerialNumber": "81U00000", "ModelNumber": 0, "Model": "PUHZ-HW140VHA", "UnitType": 0, "IsIndoor": False},
+                    {"ID": 2, "Device": 0, "SerialNumber": "81U00001", "ModelNumber": 0, "Model": "EHST20C-VM6HB", "UnitType": 1, "IsIndoor": True},
+                ],
+                "ListHistory24Formatters": [{"Name": name, "Period": self.__period.interval_seconds, "Data": list(history)} for name, history in self.__device.history.items()],
+            }
+        )
+
+        return [
+            {
+                "ID": 1,
+                "Name": "Home",
+                "AddressLine1": "1 Synthetic Street",
+                "City": "Goole",
+                "TimeZone": 0,
+                "Structure": {
+                    "Floors": [],
+                    "Areas": [],
+                    "Devices": [
+                        {
+                            "DeviceID": self.__device.device_id,
+                            "DeviceName": "Ecodan",
+                            "BuildingID": 1,
+                            "Type": 1,
+                            "Device": device,
+                        }
+                    ],
+                    "Clients": [],
+                },
+            }
+        ]
+
+    @staticmethod
+    def __write_weather(path: Optional[str], lines: List[str]) -> None:
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as weather_file:
+            weather_file.writelines(lines)
+
+    def __weather_path(self, moment: datetime.datetime) -> str:
+        """Laid out like the pywws raw folder"""
+        return os.path.join(self.weather_root, "{:%Y}".format(moment), "{:%Y-%m}".format(moment), "{:%Y-%m-%d}.txt".format(moment))
+
+    def __weather_line(self, moment: datetime.datetime) -> str:
+        # idx, delay, hum_in, temp_in, hum_out, temp_out, abs_pressure, wind_ave, wind_gust, wind_dir, rain, status, illuminance, uv
+        wind = self.__weather.wind(moment)
+        parts = [
+            moment.isoformat()[:19].replace("T", " "),
+            str(self.__period.weather_interval_seconds // 60),
+            "45",
+            str(round(self.__house.temperatures.room, 1)),
+            str(round(self.__weather.relative_humidity(moment))),
+            str(round(self.__weather.outdoor_temperature(moment), 1)),
+            "1013.2",
+            str(round(wind, 1)),
+            str(round(wind * 1.6, 1)),
+            str(self.__device.random.randint(0, 15)),
+            "0.0",
+            "0",
+            "",
+            "",
+        ]
+        return ",".join(parts) + "\n"
+
+
+# --------------------------------------------------------------------------------
+def generate_state(
+    *,
+    root: str = typer.Option(..., help="Folder to write the state and weather trees into."),
+    start: str = typer.Option(
+        default="2021-01-01T00:00:00",
+        help="UTC moment of the first reading in ISO8601 format.",
+    ),
+    days: int = typer.Option(default=1, help="How many days of readings to write."),
+    interval_seconds: int = typer.Option(default=60, help="Seconds between device downloads."),
+    weather_interval_seconds: int = typer.Option(default=300, help="Seconds between weather readings."),
+    history_points: int = typer.Option(default=288, help="Length of each series in ListHistory24Formatters."),
+    seed: int = typer.Option(default=1, help="Seed for the synthetic readings."),
+    devices: bool = typer.Option(default=True, help="Write device downloads."),
+    weather: bool = typer.Option(default=True, help="Write weather readings."),
+    observations: bool = typer.Option(default=True, help="Write the observations log."),
+) -> None:
+    """
+    Write a synthetic state tree for measuring the loaders.
+    """
+    start_moment = pytz.utc.localize(datetime.datetime.strptime(start, "%Y-%m-%dT%H:%M:%S"))
+    generator = StateTreeGenerator(
+        root, start_moment, days, interval_seconds=interval_seconds, weather_interval_seconds=weather_interval_seconds, history_points=history_points, seed=seed
+    )
+    generator.generate(devices, weather, observations)
+
+    print(f"ACT_STATE_ROOT={generator.state_root}")
+    print(f"ACT_WEATHER_ROOT={generator.weather_root}")
+
+
+if __name__ == "__main__":
+    typer.run(generate_state)
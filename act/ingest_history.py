@@ -0,0 +1,23 @@
+from typing import Optional
+
+import typer
+
+from act.device_history import DeviceHistory
+from act.device_info_loader import DeviceInfoLoader
+
+
+# --------------------------------------------------------------------------------
+def ingest_history(
+    database: str = typer.Option(..., envvar="ACT_HISTORY_DATABASE", help="SQLite database to add the readings to, which is created if need be."),
+    devices_folder: Optional[str] = typer.Option(default=None, help="Folder of raw device downloads, which defaults to the one in the state root."),
+) -> None:
+    """
+    Add the device downloads which aren't in the history database yet.
+    """
+    with DeviceHistory(database) as history:
+        added = DeviceInfoLoader(devices_folder, history_database=database).ingest(history)
+    print(f"Added {added} readings")
+
+
+if __name__ == "__main__":
+    typer.run(ingest_history)
@@ -0,0 +1,43 @@
+import contextlib
+import contextvars
+import os
+from dataclasses import dataclass, field
+from typing import ClassVar, Dict, Iterator, Optional
+
+import structlog
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class Installation:
+    """One heat pump and the settings which differ from the process environment for it, such as DEVICE_ID, MITS_CONTEXT_KEY and ACT_STATE_ROOT"""
+
+    __current: "ClassVar[contextvars.ContextVar[Optional[Installation]]]" = contextvars.ContextVar("installation", default=None)
+
+    name: str
+    environment: Dict[str, str] = field(default_factory=dict)
+
+    @contextlib.contextmanager
+    def activate(self) -> Iterator["Installation"]:
+        """Make this the installation whose settings are used by the code running in this context"""
+        token = Installation.__current.set(self)
+        structlog.contextvars.bind_contextvars(installation=self.name)
+        try:
+            yield self
+        finally:
+            structlog.contextvars.unbind_contextvars("installation")
+            Installation.__current.reset(token)
+
+    @staticmethod
+    def current() -> Optional["Installation"]:
+        return Installation.__current.get()
+
+    @staticmethod
+    def setting(name: str, default: Optional[str] = None) -> str:
+        """The current installation's value, otherwise the environment's, otherwise the default"""
+        installation = Installation.__current.get()
+        if installation is not None and name in installation.environment:
+            return installation.environment[name]
+        if default is None:
+            return os.environ[name]
+        return os.environ.get(name, default)
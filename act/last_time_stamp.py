@@ -1,4 +1,5 @@
 import datetime
+import functools
 
 import pytz
 
@@ -9,7 +10,13 @@ from .device_infos import DeviceInfo
 class LastTimeStamp:
     @staticmethod
     def last_time_stamp_in_utc(device_info: DeviceInfo) -> datetime.datetime:
-        local_time_zone_moment = datetime.datetime.strptime(device_info["LastTimeStamp"], "%Y-%m-%dT%H:%M:%S")
+        return LastTimeStamp.local_time_stamp_in_utc(device_info["LastTimeStamp"])
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def local_time_stamp_in_utc(last_time_stamp: str) -> datetime.datetime:
+        """The same time stamps are looked at many times in a run, and a window's worth are remembered"""
+        local_time_zone_moment = datetime.datetime.strptime(last_time_stamp, "%Y-%m-%dT%H:%M:%S")
 
         local_time_zone = pytz.timezone("Europe/London")
         # Doesn't seem to alter the result whatever we pass for is_dst
@@ -0,0 +1,79 @@
+import logging
+import sys
+from typing import Any, Callable, List
+
+import structlog
+
+
+# --------------------------------------------------------------------------------
+class Lazy:
+    """A log value which is only worked out if the line is actually rendered"""
+
+    def __init__(self, describe: Callable[[], Any]) -> None:
+        self.__describe = describe
+
+    def __repr__(self) -> str:
+        return str(self.__describe())
+
+    __str__ = __repr__
+
+
+# --------------------------------------------------------------------------------
+class LoggingProfile:
+    """The ways logging can be set up, chosen with ACT_LOG_PROFILE.
+
+    console is for people watching a run. production drops debug lines before any work is done on them and writes compact JSON.
+    Neither caches loggers: the modules keep theirs from import, and a cached one would ignore any later configure, such as the simulator quietening a run.
+    A dropped debug line costs a few microseconds rather than around fifty, but a run only writes a few dozen lines and loading the device infos dominates,
+    so a whole run is only a few percent quicker. Most of the gain is in the bytes written.
+    """
+
+    @staticmethod
+    def names() -> List[str]:
+        return ["console", "production"]
+
+    @staticmethod
+    def configure(name: str = "console") -> None:
+        if name == "production":
+            LoggingProfile.__configure_production()
+        elif name == "console":
+            LoggingProfile.__configure_console()
+        else:
+            raise Exception(f"There is no logging profile called '{name}', try one of {', '.join(LoggingProfile.names())}")
+
+    @staticmethod
+    def __configure_console() -> None:
+        logging.basicConfig(format="%(message)s", stream=sys.stdout, level=logging.INFO)
+        logging.getLogger("act").setLevel(logging.DEBUG)
+        structlog.configure(
+            processors=[
+                structlog.processors.add_log_level,
+                structlog.processors.StackInfoRenderer(),
+                structlog.dev.set_exc_info,
+                structlog.processors.CallsiteParameterAdder([structlog.processors.CallsiteParameter.MODULE, structlog.processors.CallsiteParameter.FUNC_NAME]),
+                structlog.contextvars.merge_contextvars,
+                structlog.processors.TimeStamper("iso"),
+                structlog.dev.ConsoleRenderer(),
+            ],
+            wrapper_class=structlog.make_filtering_bound_logger(logging.NOTSET),
+            context_class=dict,
+            logger_factory=structlog.PrintLoggerFactory(),
+            cache_logger_on_first_use=False,
+        )
+
+    @staticmethod
+    def __configure_production() -> None:
+        logging.basicConfig(format="%(message)s", stream=sys.stdout, level=logging.INFO)
+        structlog.configure(
+            processors=[
+                structlog.processors.add_log_level,
+                structlog.contextvars.merge_contextvars,
+                structlog.processors.TimeStamper("iso"),
+                structlog.processors.format_exc_info,
+                structlog.processors.JSONRenderer(),
+            ],
+            wrapper_class=structlog.make_filtering_bound_logger(logging.INFO),
+            context_class=dict,
+            logger_factory=structlog.PrintLoggerFactory(),
+            cache_logger_on_first_use=False,
+        )
@@ -0,0 +1,30 @@
+import mmap
+import os
+from typing import Iterator
+
+
+# --------------------------------------------------------------------------------
+class MappedLines:
+    """Reads the lines of a text file through a memory map, so only the lines looked at are copied out of the page cache however long the file grows"""
+
+    @staticmethod
+    def first(path: str) -> str:
+        with open(path, "rb") as text_file:
+            return text_file.readline().decode("utf-8").rstrip("\r\n")
+
+    @staticmethod
+    def backwards(path: str) -> Iterator[str]:
+        """The lines from the last to the first, without their line endings"""
+        with open(path, "rb") as text_file:
+            if os.fstat(text_file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(text_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                end = len(mapped)
+                if mapped[end - 1 : end] == b"\n":
+                    end -= 1
+                while True:
+                    start = mapped.rfind(b"\n", 0, end) + 1
+                    yield mapped[start:end].decode("utf-8").rstrip("\r")
+                    if start == 0:
+                        return
+                    end = start - 1
@@ -0,0 +1,161 @@
+import contextlib
+import contextvars
+import datetime
+import json
+import os
+from typing import Dict, Iterator, List, Optional
+
+import structlog
+
+from .device_info_loader import DeviceInfoLoader
+from .device_infos import DeviceInfo
+from .installation import Installation
+from .state_paths import StatePaths
+
+
+# --------------------------------------------------------------------------------
+class NextEvaluation:
+    """The earliest moment anything waiting on the clock could change its mind, as hinted by the providers during a run.
+
+    A run which sends commands, or in which nothing hinted, wants to be evaluated again straight away.
+    Anything whose answer depends on the time of day hints its next boundary, and anything depending on readings which aren't watched hints the run's own moment.
+    """
+
+    __current: "contextvars.ContextVar[Optional[NextEvaluation]]" = contextvars.ContextVar("next_evaluation", default=None)
+
+    def __init__(self, calculation_moment: datetime.datetime) -> None:
+        self.calculation_moment = calculation_moment
+        self.moment: Optional[datetime.datetime] = None
+        self.reason: Optional[str] = None
+
+    @staticmethod
+    def current() -> Optional["NextEvaluation"]:
+        return NextEvaluation.__current.get()
+
+    @contextlib.contextmanager
+    def collect(self) -> Iterator["NextEvaluation"]:
+        token = NextEvaluation.__current.set(self)
+        try:
+            yield self
+        finally:
+            NextEvaluation.__current.reset(token)
+
+    @staticmethod
+    def hint(moment: Optional[datetime.datetime], reason: str) -> None:
+        """Nothing this reason depends on changes before the moment, so the run needn't be repeated until then"""
+        next_evaluation = NextEvaluation.__current.get()
+        if next_evaluation is None or moment is None:
+            return
+        if next_evaluation.moment is None or moment < next_evaluation.moment:
+            next_evaluation.moment = moment
+            next_evaluation.reason = reason
+
+    @staticmethod
+    def hint_near(calculation_moment: datetime.datetime, device_info: DeviceInfo, name: str, limits: List[float], reason: str) -> None:
+        """A watched temperature closer to one of the limits than the change which gets noticed can cross it unseen, so it wants a look every run"""
+        drift = EvaluationSchedule.watched_temperatures[name]
+        if device_info.get(name) is not None and any(abs(limit - float(device_info[name])) < drift for limit in limits):
+            NextEvaluation.hint(calculation_moment, reason)
+
+    @staticmethod
+    def hint_time_of_day(calculation_moment: datetime.datetime, boundaries: List[datetime.time], reason: str) -> None:
+        """The answer can change whenever the calculation moment's clock reaches one of the boundaries.
+
+        The boundaries are in the calculation moment's own time zone, which is UTC for a run, the same clock the time windows themselves are checked against.
+        """
+        if NextEvaluation.__current.get() is None:
+            return
+        NextEvaluation.hint(min(NextEvaluation.next_time_of_day(calculation_moment, boundary) for boundary in boundaries), reason)
+
+    @staticmethod
+    def next_time_of_day(calculation_moment: datetime.datetime, boundary: datetime.time) -> datetime.datetime:
+        moment = calculation_moment.replace(hour=boundary.hour, minute=boundary.minute, second=0, microsecond=0)
+        if moment <= calculation_moment:
+            moment += datetime.timedelta(days=1)
+        return moment
+
+
+# --------------------------------------------------------------------------------
+class EvaluationSchedule:
+    """Skips runs until the next interesting moment, kept in a state file so it works for runs started by cron.
+
+    The skip is abandoned when the newest device info differs from the one the decision was made on by more than the thresholds, and never lasts longer than the cap.
+    """
+
+    # Changes to these always deserve a fresh look
+    watched_states = ["Power", "ForcedHotWaterMode", "HolidayMode", "DefrostMode", "Offline", "OperationMode", "IdleZone1"]
+    # Changes to these of at least this many degrees deserve a fresh look
+    watched_temperatures = {"OutdoorTemperature": 1.0, "RoomTemperatureZone1": 0.5, "TankWaterTemperature": 2.0, "FlowTemperature": 3.0, "ReturnTemperature": 3.0}
+
+    def __init__(self, path: str, max_skip_seconds: float = 900.0) -> None:
+        self.path = path
+        self.max_skip_seconds = max_skip_seconds
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    @staticmethod
+    def for_state_root() -> "EvaluationSchedule":
+        return EvaluationSchedule(
+            Installation.setting("ACT_NEXT_EVALUATION_FILE", os.path.join(StatePaths.state_root(), "next_evaluation.json")),
+            float(Installation.setting("ACT_NEXT_EVALUATION_MAX_SKIP_SECONDS", "900")),
+        )
+
+    def should_skip(self, calculation_moment: datetime.datetime) -> bool:
+        try:
+            with open(self.path, encoding="utf-8") as schedule_file:
+                scheduled = json.load(schedule_file)
+        except (OSError, ValueError):
+            return False
+
+        not_before = datetime.datetime.fromisoformat(scheduled["not_before"])
+        if calculation_moment >= not_before:
+            return False
+
+        latest = EvaluationSchedule.latest_device_info(calculation_moment)
+        changed = EvaluationSchedule.changed(scheduled["device_info"], latest)
+        if changed:
+            self.__logger.info("Evaluating early because the device info changed", changed=changed, not_before=scheduled["not_before"])
+            return False
+
+        self.__logger.info("Nothing to evaluate yet", not_before=scheduled["not_before"], reason=scheduled["reason"])
+        return True
+
+    def save(self, next_evaluation: NextEvaluation) -> None:
+        calculation_moment = next_evaluation.calculation_moment
+        if next_evaluation.moment is None or next_evaluation.moment <= calculation_moment:
+            not_before = calculation_moment
+        else:
+            not_before = min(next_evaluation.moment, calculation_moment + datetime.timedelta(seconds=self.max_skip_seconds))
+
+        scheduled = {
+            "not_before": not_before.isoformat(),
+            "reason": next_evaluation.reason,
+            "device_info": EvaluationSchedule.latest_device_info(calculation_moment),
+        }
+        partial_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(partial_path, "w", encoding="utf-8") as schedule_file:
+            json.dump(scheduled, schedule_file, sort_keys=True)
+        os.replace(partial_path, self.path)
+        self.__logger.debug("Next evaluation", not_before=scheduled["not_before"], reason=next_evaluation.reason)
+
+    @staticmethod
+    def latest_device_info(calculation_moment: datetime.datetime) -> Dict:
+        """Only the watched values of the newest device info, which is all the comparison needs"""
+        latest: Optional[DeviceInfo] = next(DeviceInfoLoader(workers=0).latest_device_infos(calculation_moment, count=1), None)
+        if latest is None:
+            return {}
+        return {name: latest.get(name) for name in EvaluationSchedule.watched_states + list(EvaluationSchedule.watched_temperatures)}
+
+    @staticmethod
+    def changed(before: Dict, after: Dict) -> Dict:
+        """The watched values which moved far enough to be worth another look"""
+        changes = {}
+        for name in EvaluationSchedule.watched_states:
+            if before.get(name) != after.get(name):
+                changes[name] = [before.get(name), after.get(name)]
+        for name, threshold in EvaluationSchedule.watched_temperatures.items():
+            if before.get(name) is None or after.get(name) is None:
+                if before.get(name) != after.get(name):
+                    changes[name] = [before.get(name), after.get(name)]
+            elif abs(float(after[name]) - float(before[name])) >= threshold:
+                changes[name] = [before[name], after[name]]
+        return changes
@@ -2,6 +2,7 @@ import datetime
 
 from .device_infos import DeviceInfos
 from .effective_temperature import EffectiveTemperature
+from .next_evaluation import NextEvaluation
 
 
 # --------------------------------------------------------------------------------
@@ -11,6 +12,7 @@ class OccupantComesHome:
         calculation_moment: datetime.datetime,
         device_infos: DeviceInfos,
     ) -> bool:
+        NextEvaluation.hint_time_of_day(calculation_moment, [datetime.time(16, 31), datetime.time(16, 59)], "The occupant comes home")
         device_info = device_infos[-1]
 
         outdoor_temperature = device_info["OutdoorTemperature"]
@@ -0,0 +1,44 @@
+import contextlib
+import cProfile
+import os
+import tracemalloc
+from typing import Iterator, Optional
+
+import structlog
+
+
+# --------------------------------------------------------------------------------
+class Profiling:
+    """Runs a block under cProfile and tracemalloc so a slow run can be examined afterwards"""
+
+    @staticmethod
+    @contextlib.contextmanager
+    def profile(folder: Optional[str], name: str, top: int = 30) -> Iterator[None]:
+        """Writes name.pstats and name.allocations.txt into the folder, or does nothing without a folder"""
+        if not folder:
+            yield
+            return
+
+        os.makedirs(folder, exist_ok=True)
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            stats_path = os.path.join(folder, f"{name}.pstats")
+            profiler.dump_stats(stats_path)
+
+            allocations_path = os.path.join(folder, f"{name}.allocations.txt")
+            with open(allocations_path, "w", encoding="utf-8") as allocations:
+                allocations.write(f"Still allocated: {current / 1024:.1f} KiB\n")
+                allocations.write(f"Peak: {peak / 1024:.1f} KiB\n\n")
+                for statistic in snapshot.statistics("lineno")[:top]:
+                    allocations.write(f"{statistic}\n")
+
+            structlog.get_logger("Profiling").info("Wrote profile", stats=stats_path, allocations=allocations_path)
@@ -0,0 +1,109 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, IO, Iterator, Optional
+
+import structlog
+
+from act.installation import Installation
+from act.run_metrics import RunMetrics
+
+
+# --------------------------------------------------------------------------------
+class TokenBucket:
+    """A token bucket shared by every process on the host through a locked file.
+
+    Some tokens are held back for priority requests, and while a priority request is waiting the others stand aside so it goes first.
+    """
+
+    # How long a waiting priority request keeps the others away if its sender vanished without saying so
+    priority_claim_seconds = 30.0
+
+    def __init__(self, path: str, rate_per_second: float, capacity: float, reserved: float = 0.0) -> None:
+        if reserved >= capacity:
+            raise Exception(f"The bucket can hold {capacity} tokens so it can't keep {reserved} of them for priority requests")
+        self.path = path
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.reserved = reserved
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    @staticmethod
+    def for_melcloud() -> "TokenBucket":
+        """MELCloud's limits are per account rather than per process, so every sender on the host using the current installation's account shares this bucket"""
+        account = hashlib.sha256(Installation.setting("MITS_CONTEXT_KEY", "").encode("utf-8")).hexdigest()[:16]
+        return TokenBucket(
+            Installation.setting("ACT_MELCLOUD_RATE_FILE", os.path.join(tempfile.gettempdir(), f"act-melcloud-rate-{account}.json")),
+            float(Installation.setting("ACT_MELCLOUD_REQUESTS_PER_MINUTE", "12")) / 60,
+            float(Installation.setting("ACT_MELCLOUD_BURST", "6")),
+            float(Installation.setting("ACT_MELCLOUD_RESERVED", "2")),
+        )
+
+    @contextlib.contextmanager
+    def __locked_state(self) -> Iterator[Dict]:
+        with open(self.path, "a+", encoding="utf-8") as state_file:
+            fcntl.flock(state_file, fcntl.LOCK_EX)
+            try:
+                state = self.__read(state_file)
+                now = time.time()
+                # Refill for the time since anyone last looked
+                tokens = state.get("tokens", self.capacity)
+                state["tokens"] = min(self.capacity, tokens + (now - state.get("updated", now)) * self.rate_per_second)
+                state["updated"] = now
+                state["priority_claims"] = {claimant: expiry for claimant, expiry in state.get("priority_claims", {}).items() if expiry > now}
+
+                yield state
+
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(json.dumps(state))
+            finally:
+                fcntl.flock(state_file, fcntl.LOCK_UN)
+
+    def __read(self, state_file: IO[str]) -> Dict:
+        """The file is written in place under the lock, so a write cut short leaves it unreadable. Starting from a full bucket is better than refusing every request."""
+        try:
+            state_file.seek(0)
+            text = state_file.read()
+            return json.loads(text) if text else {}
+        except (OSError, ValueError) as err:
+            self.__logger.warning("Starting the request tokens again because their state can't be read", path=self.path, error=str(err))
+            return {}
+
+    def try_acquire(self, priority: bool = False) -> float:
+        """Take a token and return 0, or return how long to wait before trying again"""
+        claimant = f"{os.getpid()}.{threading.get_ident()}"
+        with self.__locked_state() as state:
+            claims = state["priority_claims"]
+            if priority:
+                floor = 0.0
+            else:
+                if set(claims) - {claimant}:
+                    return 1.0 / self.rate_per_second
+                floor = self.reserved
+
+            if state["tokens"] - 1 >= floor:
+                state["tokens"] -= 1
+                claims.pop(claimant, None)
+                return 0.0
+
+            if priority:
+                claims[claimant] = time.time() + TokenBucket.priority_claim_seconds
+            return (floor + 1 - state["tokens"]) / self.rate_per_second
+
+    def acquire(self, priority: bool = False, timeout: Optional[float] = None) -> None:
+        started = time.monotonic()
+        with RunMetrics.measure("rate_limit"):
+            while True:
+                wait = self.try_acquire(priority)
+                if wait == 0:
+                    return
+                if timeout is not None and time.monotonic() - started + wait > timeout:
+                    raise TimeoutError(f"Gave up waiting {timeout} seconds for a request token")
+                self.__logger.debug("Waiting for a request token", wait=round(wait, 2), priority=priority)
+                time.sleep(wait)
@@ -0,0 +1,74 @@
+import datetime
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+
+from .action import Action
+from .command_queue import CommandQueue
+from .device_infos import DeviceInfo
+from .installation import Installation
+from .state_paths import StatePaths
+
+logger = structlog.get_logger()
+
+
+# --------------------------------------------------------------------------------
+class RedundantActions:
+    """Drops actions which would leave the heat pump as it is.
+
+    A command sent within the settle window won't show in the device info yet, so while there is one it is what the setting is taken to be.
+    A command still waiting in the queue is newer than any which was sent, so it comes first.
+    """
+
+    @staticmethod
+    def remove(actions: List[Action], device_info: DeviceInfo, now: Optional[datetime.datetime] = None) -> List[Action]:
+        recent = RedundantActions.recent_commands(float(Installation.setting("ACT_SETTLE_SECONDS", "180")), now or datetime.datetime.utcnow())
+        waiting = {command["name"]: command["value"] for command in CommandQueue.for_state_root().pending()}
+
+        needed = []
+        for action in actions:
+            expected: Any
+            if action.name in waiting:
+                expected, origin = waiting[action.name], "waiting to be sent"
+            elif action.name in recent:
+                expected, origin = recent[action.name], "recently sent"
+            else:
+                expected, origin = device_info.get(action.name), "device"
+            if RedundantActions.same_value(expected, action.value):
+                logger.debug("Not sending a command which changes nothing", name=action.name, value=action.value, source=action.source, origin=origin)
+            else:
+                needed.append(action)
+        return needed
+
+    @staticmethod
+    def recent_commands(settle_seconds: float, now: datetime.datetime) -> Dict[str, str]:
+        """The newest value sent for each setting within the settle window, from the names of the action journal's files"""
+        since = (now - datetime.timedelta(seconds=settle_seconds)).isoformat()
+        newest: Dict[str, Tuple[str, str]] = {}
+        for day in sorted({now.date(), (now - datetime.timedelta(seconds=settle_seconds)).date()}):
+            folder = os.path.join(StatePaths.state_root(), "actions", "raw", "{:%Y}".format(day), "{:%m}".format(day), "{:%d}".format(day))
+            if not os.path.isdir(folder):
+                continue
+            for file_name in os.listdir(folder):
+                parts = file_name[: -len(".json")].split("_", 2)
+                if len(parts) != 3 or parts[0] < since:
+                    continue
+                moment, name, value = parts
+                if name not in newest or newest[name][0] < moment:
+                    newest[name] = (moment, value)
+        return {name: value for name, (moment, value) in newest.items()}
+
+    @staticmethod
+    def same_value(current: Any, wanted: Any) -> bool:
+        return current is not None and RedundantActions.__normalise(current) == RedundantActions.__normalise(wanted)
+
+    @staticmethod
+    def __normalise(value: Any) -> Any:
+        if isinstance(value, bool):
+            return str(value).lower()
+        text = str(value).strip().lower()
+        try:
+            return float(text)
+        except ValueError:
+            return text
@@ -0,0 +1,100 @@
+import statistics
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Tuple
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class RunningTotal:
+    total: float = 0.0
+    # Running sums can leave a residue when values leave the window so remember when there's genuinely nothing there
+    non_zero: int = 0
+
+    def add(self, value: float) -> None:
+        self.total += value
+        if value:
+            self.non_zero += 1
+
+    def remove(self, value: float) -> None:
+        self.total -= value
+        if value:
+            self.non_zero -= 1
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class RunningExtremes:
+    """Monotonic deques of (index, value) so the extremes are always at the front"""
+
+    minima: Deque[Tuple[int, float]] = field(default_factory=deque)
+    maxima: Deque[Tuple[int, float]] = field(default_factory=deque)
+
+    def add(self, index: int, value: float, size: int) -> None:
+        while self.minima and self.minima[-1][1] >= value:
+            self.minima.pop()
+        self.minima.append((index, value))
+        while self.minima[0][0] <= index - size:
+            self.minima.popleft()
+
+        while self.maxima and self.maxima[-1][1] <= value:
+            self.maxima.pop()
+        self.maxima.append((index, value))
+        while self.maxima[0][0] <= index - size:
+            self.maxima.popleft()
+
+
+# --------------------------------------------------------------------------------
+class RollingAggregate:
+    """Sum, mean, minimum and maximum of the most recent values, each available in constant time.
+
+    With a lag, the most recent values are held back so the aggregate covers an earlier batch of readings.
+    """
+
+    def __init__(self, size: int, lag: int = 0) -> None:
+        self.size = size
+        self.lag = lag
+        self.__lagged: Deque[float] = deque()
+        self.__values: Deque[float] = deque()
+        self.__index = 0
+        self.__total = RunningTotal()
+        self.__extremes = RunningExtremes()
+
+    def append(self, value: float) -> None:
+        if self.lag:
+            self.__lagged.append(value)
+            if len(self.__lagged) <= self.lag:
+                return
+            value = self.__lagged.popleft()
+
+        self.__values.append(value)
+        self.__total.add(value)
+        if len(self.__values) > self.size:
+            self.__total.remove(self.__values.popleft())
+
+        self.__extremes.add(self.__index, value, self.size)
+        self.__index += 1
+
+    @property
+    def count(self) -> int:
+        return len(self.__values)
+
+    @property
+    def total(self) -> float:
+        if self.__total.non_zero == 0:
+            return 0.0
+        return self.__total.total
+
+    @property
+    def mean(self) -> float:
+        if not self.__values:
+            raise statistics.StatisticsError("mean requires at least one data point")
+        return self.total / len(self.__values)
+
+    @property
+    def minimum(self) -> float:
+        return self.__extremes.minima[0][1]
+
+    @property
+    def maximum(self) -> float:
+        return self.__extremes.maxima[0][1]
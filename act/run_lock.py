@@ -0,0 +1,139 @@
+import contextlib
+import fcntl
+import json
+import os
+import signal
+import socket
+import tempfile
+import time
+from typing import Dict, Iterator
+
+import structlog
+
+from act.installation import Installation
+from act.run_metrics import RunMetrics
+from act.state_paths import StatePaths
+
+
+# --------------------------------------------------------------------------------
+class RunLock:
+    """Makes sure only one run at a time works on a state root.
+
+    When another run holds the lock, the policy decides what happens:
+    skip gives up straight away, wait gives up after a deadline, and preempt stops the other run and takes over.
+    A run which has held the lock for longer than the stale limit is assumed to be hung and is stopped whatever the policy.
+    A run which died holding the lock releases it anyway because the operating system drops the flock.
+    """
+
+    policies = ["skip", "wait", "preempt", "none"]
+
+    def __init__(self, path: str, policy: str = "skip", wait_seconds: float = 30.0, stale_seconds: float = 600.0) -> None:
+        if policy not in RunLock.policies:
+            raise Exception(f"There is no run lock policy called '{policy}', try one of {', '.join(RunLock.policies)}")
+        self.path = path
+        self.policy = policy
+        self.wait_seconds = wait_seconds
+        self.stale_seconds = stale_seconds
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    @staticmethod
+    def for_state_root() -> "RunLock":
+        state_root = StatePaths.state_root()
+        default_path = os.path.join(state_root, "run.lock") if os.path.exists(state_root) else os.path.join(tempfile.gettempdir(), "act-run.lock")
+        return RunLock(
+            Installation.setting("ACT_RUN_LOCK_FILE", default_path),
+            Installation.setting("ACT_RUN_LOCK_POLICY", "skip"),
+            float(Installation.setting("ACT_RUN_LOCK_WAIT_SECONDS", "30")),
+            float(Installation.setting("ACT_RUN_LOCK_STALE_SECONDS", "600")),
+        )
+
+    @contextlib.contextmanager
+    def hold(self) -> Iterator[bool]:
+        """Yields whether this run got the lock and should go ahead"""
+        if self.policy == "none":
+            yield True
+            return
+
+        with open(self.path, "a+", encoding="utf-8") as lock_file:
+            with RunMetrics.measure("run_lock"):
+                outcome = self.__acquire(lock_file)
+            self.__count(outcome)
+            if outcome == "skipped":
+                yield False
+                return
+
+            RunLock.__rewrite(lock_file, json.dumps({"pid": os.getpid(), "host": socket.gethostname(), "started": time.time()}))
+            try:
+                yield True
+            finally:
+                RunLock.__rewrite(lock_file, "")
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __acquire(self, lock_file) -> str:
+        """Leaves the lock held unless the outcome is skipped"""
+        deadline = time.monotonic() + (self.wait_seconds if self.policy == "wait" else 0)
+        outcome = "acquired"
+        stopped = False
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return outcome
+            except OSError:
+                pass
+
+            holder = RunLock.__holder(lock_file)
+            held_for = time.time() - holder.get("started", time.time())
+            stale = held_for > self.stale_seconds
+            if (self.policy == "preempt" or stale) and not stopped and RunLock.__can_stop(holder):
+                self.__logger.warning("Stopping the run holding the lock", holder=holder, held_for=round(held_for), stale=stale)
+                os.kill(holder["pid"], signal.SIGTERM)
+                stopped = True
+                outcome = "preempted"
+                # Give it a moment to finish
+                deadline = time.monotonic() + self.wait_seconds
+            elif outcome == "acquired":
+                outcome = "waited"
+
+            if time.monotonic() >= deadline:
+                self.__logger.info("Another run holds the lock so not running", holder=holder, held_for=round(held_for), policy=self.policy)
+                return "skipped"
+            time.sleep(0.1)
+
+    @staticmethod
+    def __rewrite(lock_file, text: str) -> None:
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(text)
+        lock_file.flush()
+
+    @staticmethod
+    def __holder(lock_file) -> Dict:
+        lock_file.seek(0)
+        try:
+            return json.loads(lock_file.read() or "{}")
+        except ValueError:
+            return {}
+
+    @staticmethod
+    def __can_stop(holder: Dict) -> bool:
+        # Fleet workers share a process so they must never stop each other this way
+        return "pid" in holder and holder["pid"] != os.getpid() and holder.get("host") == socket.gethostname()
+
+    def __count(self, outcome: str) -> None:
+        """Running totals of each outcome kept beside the lock"""
+        with open(f"{self.path}.totals", "a+", encoding="utf-8") as totals_file:
+            fcntl.flock(totals_file, fcntl.LOCK_EX)
+            try:
+                totals_file.seek(0)
+                totals = json.loads(totals_file.read() or "{}")
+                totals[outcome] = totals.get(outcome, 0) + 1
+                totals_file.seek(0)
+                totals_file.truncate()
+                totals_file.write(json.dumps(totals, sort_keys=True))
+            finally:
+                fcntl.flock(totals_file, fcntl.LOCK_UN)
+
+        metrics = RunMetrics.current()
+        if metrics is not None:
+            for name, total in totals.items():
+                metrics.counters[f"run_lock_{name}"] = total
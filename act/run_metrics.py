@@ -0,0 +1,106 @@
+import contextlib
+import contextvars
+import os
+import time
+from collections import defaultdict
+from typing import DefaultDict, Dict, Iterator, Optional
+
+import structlog
+
+from .tracing import Tracer
+
+
+# --------------------------------------------------------------------------------
+class RunMetrics:
+    """Wall time spent in each stage of a run, recorded wherever the stage happens.
+
+    Stages nest, so a provider's time includes the weather and EmonCMS lookups it made.
+    """
+
+    __current: "contextvars.ContextVar[Optional[RunMetrics]]" = contextvars.ContextVar("run_metrics", default=None)
+
+    def __init__(self) -> None:
+        self.seconds: DefaultDict[str, float] = defaultdict(float)
+        self.calls: DefaultDict[str, int] = defaultdict(int)
+        # Running totals kept outside the run, such as how often runs have been skipped
+        self.counters: Dict[str, int] = {}
+        self.started = time.time()
+        self.__started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @staticmethod
+    def current() -> Optional["RunMetrics"]:
+        return RunMetrics.__current.get()
+
+    @contextlib.contextmanager
+    def collect(self) -> Iterator["RunMetrics"]:
+        """Make these the metrics which measure records into"""
+        token = RunMetrics.__current.set(self)
+        try:
+            yield self
+        finally:
+            self.elapsed = time.perf_counter() - self.__started
+            RunMetrics.__current.reset(token)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def measure(name: str) -> Iterator[None]:
+        """Time the block against the current run, and trace it as a span, which costs next to nothing when neither is collecting"""
+        metrics = RunMetrics.__current.get()
+        tracer = Tracer.current()
+        if metrics is None and tracer is None:
+            yield
+            return
+
+        started = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            finished = time.perf_counter_ns()
+            if metrics is not None:
+                metrics.record(name, (finished - started) / 1e9)
+            if tracer is not None:
+                tracer.complete(name, started, finished)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.seconds[name] += seconds
+        self.calls[name] += 1
+
+    def as_dict(self) -> Dict:
+        return {
+            "run_seconds": round(self.elapsed, 6),
+            "stage_seconds": {name: round(seconds, 6) for name, seconds in self.seconds.items()},
+            "stage_calls": dict(self.calls),
+            "counters": self.counters,
+        }
+
+    def emit(self) -> None:
+        structlog.get_logger(self.__class__.__name__).info("Run metrics", **self.as_dict())
+
+    def write_prometheus(self, path: str) -> None:
+        """Write in the textfile collector format, replacing the file in one go so a scrape never sees half of it"""
+        lines = [
+            "# HELP act_run_seconds Wall time of the last run.",
+            "# TYPE act_run_seconds gauge",
+            f"act_run_seconds {self.elapsed:.6f}",
+            "# HELP act_run_timestamp_seconds When the last run started.",
+            "# TYPE act_run_timestamp_seconds gauge",
+            f"act_run_timestamp_seconds {self.started:.3f}",
+            "# HELP act_stage_seconds Wall time spent in each stage of the last run.",
+            "# TYPE act_stage_seconds gauge",
+        ]
+        lines.extend(f'act_stage_seconds{{stage="{name}"}} {seconds:.6f}' for name, seconds in sorted(self.seconds.items()))
+        lines.extend(
+            [
+                "# HELP act_stage_calls How many times each stage ran in the last run.",
+                "# TYPE act_stage_calls gauge",
+            ]
+        )
+        lines.extend(f'act_stage_calls{{stage="{name}"}} {calls}' for name, calls in sorted(self.calls.items()))
+        for name, total in sorted(self.counters.items()):
+            lines.extend([f"# TYPE act_{name}_total counter", f"act_{name}_total {total}"])
+
+        partial_path = f"{path}.{os.getpid()}.tmp"
+        with open(partial_path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write("\n".join(lines) + "\n")
+        os.replace(partial_path, path)
@@ -0,0 +1,142 @@
+import contextlib
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from types import FrameType
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import structlog
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class SamplingSettings:
+    interval_seconds: float = 0.01
+    flush_seconds: float = 60.0
+    # Only sample while something has said it's busy
+    only_while_busy: bool = False
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class CollapsedStacks:
+    """How often each stack was seen, as "frame;frame;frame" strings built from labels which are only formatted once per function"""
+
+    counts: Counter = field(default_factory=Counter)
+    labels: Dict[Tuple[str, str, int], str] = field(default_factory=dict)
+    samples: int = 0
+
+    def add(self, frame: Optional[FrameType]) -> None:
+        labels: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_filename, code.co_name, code.co_firstlineno)
+            label = self.labels.get(key)
+            if label is None:
+                label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                self.labels[key] = label
+            labels.append(label)
+            frame = frame.f_back
+        labels.reverse()
+        self.counts[";".join(labels)] += 1
+
+
+# --------------------------------------------------------------------------------
+class SamplingProfiler:
+    """Samples the stacks of the other threads at a steady rate and keeps a count of each distinct stack.
+
+    The counts are written as collapsed stacks, one "frame;frame;frame count" line per stack, which flamegraph.pl, speedscope and inferno read.
+    Nothing is added to the code being profiled so it's cheap enough to leave running in a resident process.
+
+    Threads waiting on a lock or an event aren't counted, and when only busy periods are wanted nothing is sampled outside the work marked with busy,
+    so a resident process's profile isn't dominated by it sleeping between runs.
+    """
+
+    # The innermost frames of a thread which is waiting rather than working
+    idle_frames = {("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock")}
+
+    __busy = 0
+    __busy_lock = threading.Lock()
+
+    def __init__(self, path: str, interval_seconds: float = 0.01, flush_seconds: float = 60.0, only_while_busy: bool = False) -> None:
+        self.path = path
+        self.settings = SamplingSettings(interval_seconds, flush_seconds, only_while_busy)
+        self.__stacks = CollapsedStacks()
+        self.__stopping = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    def start(self) -> "SamplingProfiler":
+        self.__stopping.clear()
+        self.__thread = threading.Thread(target=self.__sample_until_stopped, name="SamplingProfiler", daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__stopping.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        self.write()
+
+    def __enter__(self) -> "SamplingProfiler":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    @property
+    def samples(self) -> int:
+        return self.__stacks.samples
+
+    def __sample_until_stopped(self) -> None:
+        next_flush = time.monotonic() + self.settings.flush_seconds
+        while not self.__stopping.wait(self.settings.interval_seconds):
+            self.sample()
+            if time.monotonic() >= next_flush:
+                self.write()
+                next_flush = time.monotonic() + self.settings.flush_seconds
+
+    @staticmethod
+    @contextlib.contextmanager
+    def busy() -> Iterator[None]:
+        """Mark some work, such as a run, as worth sampling"""
+        with SamplingProfiler.__busy_lock:
+            SamplingProfiler.__busy += 1
+        try:
+            yield
+        finally:
+            with SamplingProfiler.__busy_lock:
+                SamplingProfiler.__busy -= 1
+
+    def sample(self) -> None:
+        if self.settings.only_while_busy and not SamplingProfiler.__busy:
+            return
+        own_thread = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():  # pylint: disable=protected-access
+            if thread_id != own_thread and not SamplingProfiler.is_idle(frame):
+                self.__stacks.add(frame)
+        self.__stacks.samples += 1
+
+    @staticmethod
+    def is_idle(frame: FrameType) -> bool:
+        return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in SamplingProfiler.idle_frames
+
+    def stacks(self) -> Dict[str, int]:
+        return dict(self.__stacks.counts)
+
+    def write(self) -> None:
+        """Replace the output in one go so a reader never sees half of it"""
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        partial_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(partial_path, "w", encoding="utf-8") as collapsed:
+            for stack, count in self.__stacks.counts.most_common():
+                collapsed.write(f"{stack} {count}\n")
+        os.replace(partial_path, self.path)
+        self.__logger.debug("Wrote collapsed stacks", path=self.path, samples=self.samples, stacks=len(self.__stacks.counts))
@@ -1,14 +1,19 @@
 import datetime
-from typing import Optional
+import functools
+from typing import Optional, Tuple
 
 import pytz
 from crontab import CronTab
 
 from .device_infos import DeviceInfos
+from .tracing import Tracer
 
 
 # --------------------------------------------------------------------------------
 class Schedule:
+    # The previous job only changes when another job runs, so remember the span the last answer holds for
+    __previous_job_span: Optional[Tuple[str, datetime.datetime, datetime.datetime, str]] = None
+
     @staticmethod
     def crontab() -> str:
         # Times in UTC
@@ -19,6 +24,12 @@ class Schedule:
 0 21 * * * Off
 """
 
+    @staticmethod
+    @functools.lru_cache(maxsize=4)
+    def parse(tab: str) -> CronTab:
+        """Parsing is slow so share the result, which must not be altered"""
+        return CronTab(tab=tab)
+
     @staticmethod
     def off_job_name():
         return "Off"
@@ -38,8 +49,9 @@ class Schedule:
         return None
 
     @staticmethod
+    @Tracer.traced
     def next_job_moment(moment: datetime.datetime, job_name: str) -> Optional[datetime.datetime]:
-        file_cron = CronTab(tab=Schedule.crontab())
+        file_cron = Schedule.parse(Schedule.crontab())
 
         jobs = file_cron.find_command(job_name)
         next_on_times = []
@@ -64,8 +76,9 @@ class Schedule:
         return None
 
     @staticmethod
+    @Tracer.traced
     def recent_job_moment(moment: datetime.datetime, job_name: str, time_window=300) -> Optional[datetime.datetime]:
-        file_cron = CronTab(tab=Schedule.crontab())
+        file_cron = Schedule.parse(Schedule.crontab())
 
         jobs = file_cron.find_command(job_name)
         for job in jobs:
@@ -78,13 +91,21 @@ class Schedule:
         return None
 
     @staticmethod
+    @Tracer.traced
     def previous_job(moment: datetime.datetime) -> str:
+        tab = Schedule.crontab()
+        if Schedule.__previous_job_span is not None:
+            span_tab, span_start, span_end, span_job_name = Schedule.__previous_job_span
+            if span_tab == tab and span_start < moment <= span_end:
+                return span_job_name
+
         old_moment = datetime.datetime.min
         utc = pytz.timezone("UTC")
         old_moment = utc.localize(old_moment)
+        next_moment = None
 
         old_job_name = None
-        file_cron = CronTab(tab=Schedule.crontab())
+        file_cron = Schedule.parse(tab)
         for job in file_cron.crons:
             schedule = job.schedule(date_from=moment)
             previous_run = schedule.get_prev()
@@ -92,7 +113,13 @@ class Schedule:
                 old_job_name = job.command
                 old_moment = previous_run
 
+            next_run = job.schedule(date_from=moment).get_next()
+            if next_moment is None or next_run < next_moment:
+                next_moment = next_run
+
         if old_job_name:
+            if next_moment:
+                Schedule.__previous_job_span = (tab, old_moment, next_moment, old_job_name)
             return old_job_name
 
         raise Exception(f"Unable to find a job scheduled before {moment}")
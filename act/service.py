@@ -0,0 +1,85 @@
+import contextlib
+import datetime
+import os
+import time
+from typing import Optional
+
+import structlog
+import typer
+
+from act.act import Act
+from act.command_queue import CommandSender
+from act.sampling_profiler import SamplingProfiler
+
+
+# --------------------------------------------------------------------------------
+class Service:
+    """Keeps Act resident, running it at the start of each interval instead of relying on cron to start a fresh process"""
+
+    def __init__(self, interval_seconds: int = 60, dry_run: bool = False, adaptive: bool = False) -> None:
+        self.interval_seconds = interval_seconds
+        self.dry_run = dry_run
+        self.adaptive = adaptive
+        self.runs = 0
+        self.failures = 0
+        # Commands are sent by the CommandSender so a slow MELCloud never delays the next decision
+        self.__act = Act(drain_commands=False)
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    def run(self, iterations: Optional[int] = None) -> None:
+        with CommandSender():
+            while iterations is None or self.runs < iterations:
+                if self.runs:
+                    self.__wait_for_next_interval()
+                self.run_once()
+
+    def run_once(self) -> None:
+        self.runs += 1
+        try:
+            with SamplingProfiler.busy():
+                self.__act.act(
+                    calculation_moment="now",
+                    dry_run=self.dry_run,
+                    metrics_file=os.environ.get("ACT_METRICS_FILE"),
+                    trace_file=None,
+                    profile=None,
+                    adaptive=self.adaptive,
+                )
+        except Exception:
+            # One bad minute shouldn't stop the next one from putting it right
+            self.failures += 1
+            self.__logger.exception("Run failed", runs=self.runs, failures=self.failures)
+
+    def __wait_for_next_interval(self) -> None:
+        now = time.time()
+        time.sleep(self.interval_seconds - now % self.interval_seconds)
+
+
+# --------------------------------------------------------------------------------
+def serve(
+    *,
+    interval_seconds: int = typer.Option(default=60, help="Seconds between runs, aligned to the clock."),
+    dry_run: bool = typer.Option(default=False, help="Run without sending commands."),
+    iterations: Optional[int] = typer.Option(default=None, help="Stop after this many runs."),
+    adaptive: bool = typer.Option(default=False, envvar="ACT_ADAPTIVE", help="Skip runs until the next moment anything could change, unless the device info changes first."),
+    sampling_profile: Optional[str] = typer.Option(
+        default=None,
+        envvar="ACT_SAMPLING_PROFILE",
+        help="Sample the stacks during runs and keep writing them to this collapsed stacks file for flamegraphs.",
+    ),
+    sampling_rate: float = typer.Option(default=100.0, help="Stack samples per second."),
+    sampling_flush_seconds: float = typer.Option(default=300.0, help="Seconds between writes of the collapsed stacks."),
+) -> None:
+    """
+    Keep instructing the heatpump, once per interval.
+    """
+    service = Service(interval_seconds, dry_run, adaptive)
+    with contextlib.ExitStack() as stack:
+        if sampling_profile:
+            stack.enter_context(SamplingProfiler(sampling_profile, 1.0 / sampling_rate, sampling_flush_seconds, only_while_busy=True))
+        structlog.get_logger("Service").info("Serving", interval_seconds=interval_seconds, started=datetime.datetime.utcnow().isoformat()[:19])
+        service.run(iterations)
+
+
+if __name__ == "__main__":
+    typer.run(serve)
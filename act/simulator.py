@@ -0,0 +1,547 @@
+import datetime
+import json
+import logging
+import math
+import os
+import random
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import pytz
+import structlog
+import typer
+
+from act.act import Act
+from act.action import Action
+from act.alter_setting import AlterSetting
+from act.deadlines import Deadlines
+from act.device_info_window import DeviceInfoWindow
+from act.device_infos import DeviceInfo
+from act.effective_temperature import EffectiveTemperature
+from act.emoncms import EmonCMS
+from act.profiling import Profiling
+
+# J/(kg K)
+WATER_SPECIFIC_HEAT = 4186.0
+
+
+# --------------------------------------------------------------------------------
+class SimulatedWeather:
+    """Repeatable winter weather with a wandering daily mean, a daily swing and some sunshine"""
+
+    def __init__(self, start: datetime.datetime, days: int, mean_outdoor_temperature: float, seed: int) -> None:
+        generator = random.Random(seed)
+        self.__start = start
+        self.__daily_means: List[float] = []
+        self.__daily_sunshine: List[float] = []
+        self.__daily_wind: List[float] = []
+
+        daily_mean = mean_outdoor_temperature
+        for _ in range(days + 2):
+            daily_mean = mean_outdoor_temperature + 0.7 * (daily_mean - mean_outdoor_temperature) + generator.gauss(0, 2.5)
+            self.__daily_means.append(daily_mean)
+            self.__daily_sunshine.append(generator.random())
+            self.__daily_wind.append(max(0.0, generator.gauss(3, 1.5)))
+
+    def __day(self, moment: datetime.datetime) -> float:
+        return (moment - self.__start).total_seconds() / 86400
+
+    def __swing(self, moment: datetime.datetime) -> float:
+        # Warmest mid-afternoon, coldest around dawn
+        hour = moment.hour + moment.minute / 60
+        return math.cos(2 * math.pi * (hour - 14) / 24)
+
+    def outdoor_temperature(self, moment: datetime.datetime) -> float:
+        day = self.__day(moment)
+        index = int(day)
+        fraction = day - index
+        # Blend the daily means so there isn't a jump at midnight
+        daily_mean = self.__daily_means[index] * (1 - fraction) + self.__daily_means[index + 1] * fraction
+        return daily_mean + 3 * self.__swing(moment)
+
+    def relative_humidity(self, moment: datetime.datetime) -> float:
+        return 85 - 8 * self.__swing(moment)
+
+    def wind(self, moment: datetime.datetime) -> float:
+        return self.__daily_wind[int(self.__day(moment))]
+
+    def solar_power(self, moment: datetime.datetime) -> float:
+        """Watts from the solar panels, with short winter days"""
+        hour = moment.hour + moment.minute / 60
+        if hour < 8 or hour > 16:
+            return 0.0
+        return 3500 * self.__daily_sunshine[int(self.__day(moment))] * math.sin(math.pi * (hour - 8) / 8)
+
+    def statistics(self, moment: datetime.datetime) -> Dict:
+        return {
+            "wind": self.wind(moment),
+            "outdoorTemperature": self.outdoor_temperature(moment),
+            "outdoorRelativeHumidity": self.relative_humidity(moment),
+            "moment": moment,
+        }
+
+    def feed_value(self, feed_id: int, moment: datetime.datetime) -> Dict:
+        return {"time": moment.timestamp() * 1000, "value": self.solar_power(moment)}
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class HouseTemperatures:
+    """Where the heat is, in °C. The sensors are the heat pump's flow and return thermistors."""
+
+    room: float = 19.5
+    circuit: float = 25.0
+    tank: float = 40.0
+    flow_sensor: float = 20.0
+    return_sensor: float = 20.0
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class HeatPumpSettings:
+    """What the providers can alter"""
+
+    power: bool = False
+    forced_hot_water: bool = False
+    target_flow_temperature: float = 35.0
+    set_tank_temperature: float = 40.0
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class Compressor:
+    """What the heat pump is doing, which the providers only see through the device info"""
+
+    on: bool = False
+    heating_water: bool = False
+    frequency: int = 0
+    operation_mode: int = 0
+    off_seconds: float = 0.0
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class Defrost:
+    """Ice builds up on the outdoor unit while the compressor runs in the cold"""
+
+    active: bool = False
+    run_seconds: float = 0.0
+    remaining: float = 0.0
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class HeatPumpOutput:
+    """Watts for one step, and what the flow and return sensors are heading towards"""
+
+    flow_target: float
+    return_target: float
+    circuit_heat: float = 0.0
+    tank_heat: float = 0.0
+    electricity: float = 0.0
+    hot_water_electricity: float = 0.0
+
+
+# --------------------------------------------------------------------------------
+class SimulatedHouse:
+    """A house with radiators, a hot water tank and an Ecodan-like monobloc heat pump.
+
+    The heat pump honours the settings the providers alter: Power, ForcedHotWaterMode, SetHeatFlowTemperatureZone1 and SetTankWaterTemperature.
+    """
+
+    # House
+    heat_loss_coefficient = 280.0  # W/K
+    house_heat_capacity = 25e6  # J/K
+    internal_gains = 300.0  # W
+    solar_gain_fraction = 0.25
+
+    # Emitter circuit
+    emitter_coefficient = 160.0  # W/K^1.3
+    circuit_heat_capacity = 300 * WATER_SPECIFIC_HEAT  # J/K
+    circuit_flow_rate = 0.4  # kg/s
+
+    # Hot water tank
+    tank_volume = 200.0  # litres
+    tank_loss_coefficient = 2.5  # W/K
+    cold_water_temperature = 10.0
+    hot_water_draws = {(7, 0): 40, (7, 30): 30, (19, 0): 20, (21, 0): 40}  # local time: litres
+
+    # Heat pump
+    minimum_output = 4500.0  # W
+    minimum_off_seconds = 600
+    defrost_seconds = 300
+
+    def __init__(self) -> None:
+        self.temperatures = HouseTemperatures()
+        self.settings = HeatPumpSettings()
+        self.compressor = Compressor(off_seconds=float(self.minimum_off_seconds))
+        self.defrost = Defrost()
+        # The last step's output, which the device info reports as the energy rates
+        self.output = HeatPumpOutput(self.temperatures.circuit, self.temperatures.circuit)
+        self.totals: Dict[str, float] = defaultdict(float)
+
+    @staticmethod
+    def coefficient_of_performance(hot_temperature: float, outdoor_temperature: float) -> float:
+        lift = max(5.0, hot_temperature - outdoor_temperature + 8)
+        return min(6.0, max(1.3, 0.45 * (hot_temperature + 273.15) / lift))
+
+    @staticmethod
+    def maximum_output(outdoor_temperature: float) -> float:
+        return min(16000.0, max(8000.0, 14000 * (0.75 + 0.012 * outdoor_temperature)))
+
+    def apply(self, action: Action) -> None:
+        value: Any = action.value
+        if value == "true":
+            value = True
+        if value == "false":
+            value = False
+
+        if action.name == "Power":
+            self.settings.power = bool(value)
+        elif action.name == "ForcedHotWaterMode":
+            self.settings.forced_hot_water = bool(value)
+        elif action.name == "SetHeatFlowTemperatureZone1":
+            self.settings.target_flow_temperature = float(value)
+        elif action.name == "SetTankWaterTemperature":
+            self.settings.set_tank_temperature = float(value)
+        else:
+            raise Exception(f"The simulated heat pump doesn't know how to alter {action.name}")
+
+    def device_info(self, moment: datetime.datetime, outdoor_temperature: float) -> DeviceInfo:
+        local_moment = moment.astimezone(pytz.timezone("Europe/London"))
+        temperatures = self.temperatures
+        settings = self.settings
+        return {
+            "LastTimeStamp": local_moment.strftime("%Y-%m-%dT%H:%M:%S"),
+            "Power": settings.power,
+            "Offline": False,
+            "HolidayMode": False,
+            "DefrostMode": 1 if self.defrost.active else 0,
+            "ForcedHotWaterMode": settings.forced_hot_water,
+            "OperationMode": self.compressor.operation_mode,
+            "HeatPumpFrequency": self.compressor.frequency,
+            "OutdoorTemperature": round(outdoor_temperature, 1),
+            "RoomTemperatureZone1": round(temperatures.room, 1),
+            "FlowTemperature": round(temperatures.flow_sensor * 2) / 2,
+            "ReturnTemperature": round(temperatures.return_sensor * 2) / 2,
+            "TankWaterTemperature": round(temperatures.tank * 2) / 2,
+            "SetTankWaterTemperature": settings.set_tank_temperature,
+            "SetHeatFlowTemperatureZone1": settings.target_flow_temperature,
+            "TargetHCTemperatureZone1": settings.target_flow_temperature,
+            "HeatingEnergyConsumedRate1": round((self.output.electricity - self.output.hot_water_electricity) / 1000, 2),
+            "HotWaterEnergyConsumedRate1": round(self.output.hot_water_electricity / 1000, 2),
+        }
+
+    def draw_hot_water(self, local_moment: datetime.datetime) -> None:
+        litres = self.hot_water_draws.get((local_moment.hour, local_moment.minute))
+        if litres:
+            self.totals["hot_water_draws"] += 1
+            if self.temperatures.tank < 38:
+                self.totals["cold_showers"] += 1
+            self.temperatures.tank = (self.temperatures.tank * (self.tank_volume - litres) + self.cold_water_temperature * litres) / self.tank_volume
+
+    def step(self, seconds: float, outdoor_temperature: float, solar_power: float) -> None:
+        output = self.__run_heat_pump(seconds, outdoor_temperature)
+        if not self.compressor.on:
+            self.compressor.off_seconds += seconds
+
+        self.__exchange_heat(seconds, outdoor_temperature, solar_power, output)
+        self.__move_sensors(seconds, outdoor_temperature, output)
+
+        self.output = output
+        self.totals["electricity_joules"] += output.electricity * seconds
+        self.totals["space_heat_joules"] += max(0.0, output.circuit_heat) * seconds
+        self.totals["hot_water_heat_joules"] += output.tank_heat * seconds
+
+    def __run_heat_pump(self, seconds: float, outdoor_temperature: float) -> HeatPumpOutput:
+        compressor = self.compressor
+        output = HeatPumpOutput(self.temperatures.circuit, self.temperatures.circuit)
+
+        if not self.settings.power:
+            self.__stop_compressor()
+            compressor.heating_water = False
+            self.defrost.active = False
+            compressor.operation_mode = 0
+            return output
+
+        if self.defrost.remaining > 0:
+            # Heat is taken back out of the circuit to melt the ice
+            self.defrost.remaining -= seconds
+            self.defrost.active = self.defrost.remaining > 0
+            output.circuit_heat = -4000.0
+            output.electricity = 1500.0
+            compressor.frequency = 60
+            compressor.operation_mode = 2
+            return output
+
+        if self.settings.forced_hot_water or self.temperatures.tank < self.settings.set_tank_temperature - 10:
+            compressor.heating_water = True
+
+        if compressor.heating_water and self.temperatures.tank >= self.settings.set_tank_temperature:
+            # The Ecodan clears forced hot water mode by itself once the tank is hot
+            compressor.heating_water = False
+            self.settings.forced_hot_water = False
+
+        if compressor.heating_water:
+            self.__heat_water(outdoor_temperature, output)
+        else:
+            self.__heat_space(outdoor_temperature, output)
+
+        self.__consider_defrosting(seconds, outdoor_temperature)
+        return output
+
+    def __heat_water(self, outdoor_temperature: float, output: HeatPumpOutput) -> None:
+        self.__start_compressor()
+        hot_temperature = self.temperatures.tank + 8
+        output.tank_heat = 0.8 * SimulatedHouse.maximum_output(outdoor_temperature)
+        output.electricity = output.tank_heat / SimulatedHouse.coefficient_of_performance(hot_temperature, outdoor_temperature)
+        output.hot_water_electricity = output.electricity
+        output.flow_target = hot_temperature
+        output.return_target = self.temperatures.tank + 3
+        self.compressor.frequency = 70
+        self.compressor.operation_mode = 1
+
+    def __heat_space(self, outdoor_temperature: float, output: HeatPumpOutput) -> None:
+        output.circuit_heat = self.__space_heating_output(outdoor_temperature)
+        if output.circuit_heat:
+            temperature_change = output.circuit_heat / (2 * self.circuit_flow_rate * WATER_SPECIFIC_HEAT)
+            hot_temperature = self.temperatures.circuit + temperature_change
+            output.electricity = output.circuit_heat / SimulatedHouse.coefficient_of_performance(hot_temperature, outdoor_temperature)
+            output.flow_target = hot_temperature
+            output.return_target = self.temperatures.circuit - temperature_change
+
+    def __exchange_heat(self, seconds: float, outdoor_temperature: float, solar_power: float, output: HeatPumpOutput) -> None:
+        temperatures = self.temperatures
+
+        # Radiators give out less without the circulation pump
+        emitter_output = self.emitter_coefficient * math.pow(max(0.0, temperatures.circuit - temperatures.room), 1.3)
+        if not self.settings.power:
+            emitter_output = emitter_output * 0.5
+
+        room_gains = emitter_output + self.internal_gains + self.solar_gain_fraction * solar_power
+        room_losses = self.heat_loss_coefficient * (temperatures.room - outdoor_temperature)
+        tank_losses = self.tank_loss_coefficient * (temperatures.tank - temperatures.room)
+
+        temperatures.circuit += seconds * (output.circuit_heat - emitter_output) / self.circuit_heat_capacity
+        temperatures.room += seconds * (room_gains + tank_losses - room_losses) / self.house_heat_capacity
+        temperatures.tank += seconds * (output.tank_heat - tank_losses) / (self.tank_volume * WATER_SPECIFIC_HEAT)
+
+    def __move_sensors(self, seconds: float, outdoor_temperature: float, output: HeatPumpOutput) -> None:
+        temperatures = self.temperatures
+        flow_target = output.flow_target
+        return_target = output.return_target
+
+        # The sensors are in the outdoor unit so they drift towards the outdoor temperature when the water isn't moving
+        if self.settings.power:
+            time_constant = 60.0
+        else:
+            time_constant = 2400.0
+            flow_target = outdoor_temperature + 0.3 * (temperatures.circuit - outdoor_temperature)
+            return_target = flow_target
+        blend = min(1.0, seconds / time_constant)
+        temperatures.flow_sensor += blend * (flow_target - temperatures.flow_sensor)
+        temperatures.return_sensor += blend * (return_target - temperatures.return_sensor)
+
+    def __space_heating_output(self, outdoor_temperature: float) -> float:
+        compressor = self.compressor
+        flow_temperature = self.temperatures.circuit
+        target = self.settings.target_flow_temperature
+
+        if compressor.on and flow_temperature > target + 2:
+            self.__stop_compressor()
+        elif not compressor.on and flow_temperature < target - 2 and compressor.off_seconds >= self.minimum_off_seconds:
+            self.__start_compressor()
+
+        if not compressor.on:
+            compressor.frequency = 0
+            compressor.operation_mode = 0
+            return 0.0
+
+        maximum = SimulatedHouse.maximum_output(outdoor_temperature)
+        output = min(maximum, self.minimum_output + max(0.0, target - flow_temperature) * 1200)
+        compressor.frequency = int(20 + 70 * (output - self.minimum_output) / (maximum - self.minimum_output))
+        compressor.operation_mode = 2
+        return output
+
+    def __consider_defrosting(self, seconds: float, outdoor_temperature: float) -> None:
+        defrost = self.defrost
+        if not self.compressor.on or outdoor_temperature >= 6:
+            return
+
+        defrost.run_seconds += seconds
+        run_limit = 2700 if outdoor_temperature < 2 else 5400
+        if defrost.run_seconds >= run_limit:
+            defrost.run_seconds = 0.0
+            defrost.remaining = float(self.defrost_seconds)
+            defrost.active = True
+            self.totals["defrosts"] += 1
+
+    def __start_compressor(self) -> None:
+        if not self.compressor.on:
+            self.compressor.on = True
+            self.totals["compressor_starts"] += 1
+
+    def __stop_compressor(self) -> None:
+        if self.compressor.on:
+            self.compressor.on = False
+            self.compressor.off_seconds = 0.0
+        self.compressor.frequency = 0
+
+
+# --------------------------------------------------------------------------------
+@dataclass
+class SimulationCounts:
+    """What happened to the commands and the comfort while the house was occupied"""
+
+    commands: Counter = field(default_factory=Counter)
+    evaluations: Counter = field(default_factory=Counter)
+    occupied_minutes: int = 0
+    occupied_temperature_total: float = 0.0
+    occupied_minutes_too_cold: int = 0
+    lowest_occupied_temperature: float = math.inf
+
+
+# --------------------------------------------------------------------------------
+class Simulator:
+    """Runs the Act providers in a closed loop against a simulated house.
+
+    Policy variants can be compared by altering TemperatureThresholds, Dwell or the providers before calling run.
+    """
+
+    def __init__(self, start: datetime.datetime, days: int, mean_outdoor_temperature: float = 4.0, seed: int = 1, step_seconds: int = 10) -> None:
+        self.__start = start
+        self.__days = days
+        self.__step_seconds = step_seconds
+        self.weather = SimulatedWeather(start, days, mean_outdoor_temperature, seed)
+        self.house = SimulatedHouse()
+        self.__logger = structlog.get_logger(self.__class__.__name__)
+
+    def run(self) -> Dict:
+        # The providers are chatty and a month has a lot of minutes
+        previous_logging = structlog.get_config()
+        # Act sets up logging as it's made, so it's only made once there is a configuration to go back to
+        act = Act()
+        structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+        EffectiveTemperature.statistics_source = self.weather.statistics
+        EmonCMS.feed_value_source = self.weather.feed_value
+        previous_solar_feed = os.environ.get("EMONCMS_SOLAR_FEED_ID")
+        if previous_solar_feed is None:
+            os.environ["EMONCMS_SOLAR_FEED_ID"] = "0"
+
+        try:
+            return self.__run(act)
+        finally:
+            EffectiveTemperature.statistics_source = None
+            EmonCMS.feed_value_source = None
+            if previous_solar_feed is None:
+                os.environ.pop("EMONCMS_SOLAR_FEED_ID", None)
+            structlog.configure(**previous_logging)
+
+    def __run(self, act: Act) -> Dict:
+        window = DeviceInfoWindow(maxlen=600)
+        counts = SimulationCounts(lowest_occupied_temperature=self.house.temperatures.room)
+
+        for minute in range(self.__days * 24 * 60):
+            self.__simulate_minute(act, self.__start + datetime.timedelta(minutes=minute), window, counts)
+
+        totals = self.house.totals
+        heat = totals["space_heat_joules"] + totals["hot_water_heat_joules"]
+        electricity = totals["electricity_joules"]
+        return {
+            "start": self.__start.isoformat(),
+            "days": self.__days,
+            "electricity_kwh": round(electricity / 3.6e6, 1),
+            "space_heat_kwh": round(totals["space_heat_joules"] / 3.6e6, 1),
+            "hot_water_heat_kwh": round(totals["hot_water_heat_joules"] / 3.6e6, 1),
+            "coefficient_of_performance": round(heat / electricity, 2) if electricity else None,
+            "compressor_starts": int(totals["compressor_starts"]),
+            "defrosts": int(totals["defrosts"]),
+            "mean_occupied_room_temperature": round(counts.occupied_temperature_total / counts.occupied_minutes, 2) if counts.occupied_minutes else None,
+            "lowest_occupied_room_temperature": round(counts.lowest_occupied_temperature, 2),
+            "occupied_minutes_below_18_5": counts.occupied_minutes_too_cold,
+            "cold_showers": int(totals["cold_showers"]),
+            "commands": dict(counts.commands),
+            "evaluations": dict(counts.evaluations),
+        }
+
+    def __simulate_minute(self, act: Act, moment: datetime.datetime, window: DeviceInfoWindow, counts: SimulationCounts) -> None:
+        outdoor_temperature = self.weather.outdoor_temperature(moment)
+        local_moment = moment.astimezone(pytz.timezone("Europe/London"))
+
+        window.append(self.house.device_info(moment, outdoor_temperature))
+        for action in self.__evaluate(act, moment, window, counts.evaluations):
+            self.__apply(action, counts.commands)
+
+        self.house.draw_hot_water(local_moment)
+        for _ in range(60 // self.__step_seconds):
+            self.house.step(self.__step_seconds, outdoor_temperature, self.weather.solar_power(moment))
+
+        if 7 <= local_moment.hour < 23:
+            room_temperature = self.house.temperatures.room
+            counts.occupied_minutes += 1
+            counts.occupied_temperature_total += room_temperature
+            counts.lowest_occupied_temperature = min(counts.lowest_occupied_temperature, room_temperature)
+            if room_temperature < 18.5:
+                counts.occupied_minutes_too_cold += 1
+
+    def __apply(self, action: Action, commands: Counter) -> None:
+        """Like MELCloud, settings which don't validate are rejected"""
+        settings = self.house.settings
+        try:
+            AlterSetting.validate_settings(
+                {
+                    "SetHeatFlowTemperatureZone1": action.value if action.name == "SetHeatFlowTemperatureZone1" else settings.target_flow_temperature,
+                    "SetTankWaterTemperature": action.value if action.name == "SetTankWaterTemperature" else settings.set_tank_temperature,
+                }
+            )
+        except Exception:
+            commands["rejected"] += 1
+            return
+        self.house.apply(action)
+        commands[action.name] += 1
+
+    def __evaluate(self, act: Act, moment: datetime.datetime, window: DeviceInfoWindow, evaluations: Counter) -> List[Action]:
+        if act.actions_should_be_blocked(window):
+            evaluations["blocked"] += 1
+            return []
+
+        try:
+            with Deadlines.for_run().collect():
+                actions = act.decide(moment, window)
+        except Exception as err:
+            # A real run would have died here so nothing gets sent this minute
+            self.__logger.warning("Providers failed", moment=moment.isoformat(), error=str(err))
+            evaluations["failed"] += 1
+            return []
+
+        evaluations["evaluated"] += 1
+        return actions
+
+
+# --------------------------------------------------------------------------------
+def simulate(
+    start: str = typer.Option(
+        default="2021-01-01T00:00:00",
+        help="UTC moment to start the simulation in ISO8601 format.",
+    ),
+    days: int = typer.Option(default=31, help="How many days to simulate."),
+    mean_outdoor_temperature: float = typer.Option(default=4.0, help="The average outdoor temperature in °C."),
+    seed: int = typer.Option(default=1, help="Seed for the simulated weather."),
+    profile: Optional[str] = typer.Option(
+        default=None,
+        help="Profile the simulation, writing pstats and allocations named after the start into this folder.",
+    ),
+) -> None:
+    """
+    Simulate how the heatpump and house respond to the actions.
+    """
+    start_moment = pytz.utc.localize(datetime.datetime.strptime(start, "%Y-%m-%dT%H:%M:%S"))
+    with Profiling.profile(profile, "simulate_{:%Y-%m-%dT%H%M%S}_{}d".format(start_moment, days)):
+        summary = Simulator(start_moment, days, mean_outdoor_temperature, seed).run()
+    print(json.dumps(summary, indent=4))
+
+
+if __name__ == "__main__":
+    typer.run(simulate)
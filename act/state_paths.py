@@ -0,0 +1,21 @@
+from dotenv import load_dotenv
+
+from .installation import Installation
+
+load_dotenv()
+
+
+# --------------------------------------------------------------------------------
+class StatePaths:
+    """Where the state and weather are found.
+
+    These are mounted at the root in the container but can be put elsewhere, for example by the generator or for each installation in a fleet.
+    """
+
+    @staticmethod
+    def state_root() -> str:
+        return Installation.setting("ACT_STATE_ROOT", "/state")
+
+    @staticmethod
+    def weather_root() -> str:
+        return Installation.setting("ACT_WEATHER_ROOT", "/weather")
@@ -8,6 +8,8 @@ from .midpoint_temp import MidPointTemp
 from .temperature_thresholds import TemperatureThresholds
 from .time_based_criteria import TimeBasedCriteria
 
+logger = structlog.get_logger()
+
 
 class TargetWaterTemperature:
     @staticmethod
@@ -23,7 +25,7 @@ class TargetWaterTemperature:
         # Go just because the flow is really hot
         if flow_temp >= desired_water_temperature:
             # Don't just keep coming on all the time, we'll keep doing 2 minutes of water heating
-            structlog.get_logger().debug("Let the tank drop a bit below the target")
+            logger.debug("Let the tank drop a bit below the target")
             return desired_water_temperature - 10
 
         midpoint_temp = MidPointTemp.midpoint_temp_for_month(calculation_moment, device_infos)
@@ -32,21 +34,19 @@ class TargetWaterTemperature:
         some_heating_required = midpoint_temp < TemperatureThresholds.no_heating_required(calculation_moment, device_infos)
         if is_not_really_cold and some_heating_required:
             # Always warm straight back up when someone has a shower
-            structlog.get_logger().debug(
-                "The outdoor temperature is warmer than the quiteColdOutdoorTemp. The hot water not likely to be heated by the space heating or solar diverter"
-            )
+            logger.debug("The outdoor temperature is warmer than the quiteColdOutdoorTemp. The hot water not likely to be heated by the space heating or solar diverter")
             # When it's hotter than this we usually have some solar diverter action
             return desired_water_temperature - 15
 
         if power_is_on and TimeBasedCriteria.warm_part_of_day(calculation_moment):
-            structlog.get_logger().debug("The power is on and it's a warm part of the day")
+            logger.debug("The power is on and it's a warm part of the day")
             return desired_water_temperature - 10
 
         if OctopusGo.power_will_be_cheap_for_next_fifteen_minutes(calculation_moment, device_infos):
-            structlog.get_logger().debug("Power will be cheap for a while")
+            logger.debug("Power will be cheap for a while")
             return desired_water_temperature - 10
 
-        structlog.get_logger().debug("Flow is colder than the desired water temp")
+        logger.debug("Flow is colder than the desired water temp")
         # If the flow is quite a bit warmer than the tank then still plough ahead
         # If the flow is cold, don't do anything even if the tank is way colder than we'd like
         # Eventually some space heating will lift the flow and then we'll do the hot water
@@ -1,18 +1,20 @@
 import datetime
 
+from .device_info_window import DeviceInfoWindow
 from .device_infos import DeviceInfos
 from .effective_temperature import EffectiveTemperature
+from .tracing import Tracer
 
 
 class TemperatureThresholds:
     @staticmethod
     def average_outdoor_temperature(device_infos: DeviceInfos) -> float:
-        recent_device_infos = device_infos[-10:]
+        recent_outdoor_temperatures = DeviceInfoWindow.of(device_infos).rolling("OutdoorTemperature", 10)
 
-        total = sum([float(deviceInfo["OutdoorTemperature"]) for deviceInfo in recent_device_infos])
-        return total / len(recent_device_infos)
+        return recent_outdoor_temperatures.total / recent_outdoor_temperatures.count
 
     @staticmethod
+    @Tracer.traced
     def max_flow_temp(calculation_moment: datetime.datetime, device_infos: DeviceInfos) -> float:
         effective_outdoor_temperature = device_infos[-1]["OutdoorTemperature"]
         try:
@@ -45,6 +47,7 @@ class TemperatureThresholds:
         return intended
 
     @staticmethod
+    @Tracer.traced
     def min_flow_temp(calculation_moment: datetime.datetime, device_infos: DeviceInfos) -> float:
         effective_outdoor_temperature = device_infos[-1]["OutdoorTemperature"]
         try:
@@ -66,6 +69,7 @@ class TemperatureThresholds:
         return ensure_not_too_low
 
     @staticmethod
+    @Tracer.traced
     def no_heating_required(calculation_moment: datetime.datetime, device_infos: DeviceInfos) -> float:
         """The sort of temperature that would prompt you to put on a jumper"""
         return 14
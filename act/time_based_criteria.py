@@ -1,10 +1,13 @@
 import datetime
 
+from .next_evaluation import NextEvaluation
+
 
 # --------------------------------------------------------------------------------
 class TimeBasedCriteria:
     @staticmethod
     def warm_part_of_day(calculation_moment: datetime.datetime) -> bool:
+        NextEvaluation.hint_time_of_day(calculation_moment, [datetime.time(10), datetime.time(17)], "The warm part of the day starts or ends")
         hour = calculation_moment.hour
         after_starts_getting_warm = hour >= 10
         before_starts_getting_cold = hour <= 16
@@ -0,0 +1,86 @@
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+Function = TypeVar("Function", bound=Callable[..., Any])
+
+
+# --------------------------------------------------------------------------------
+class Tracer:
+    """Nested spans for a run, written in the Chrome trace event format which chrome://tracing and Perfetto open offline"""
+
+    __current: "contextvars.ContextVar[Optional[Tracer]]" = contextvars.ContextVar("tracer", default=None)
+
+    def __init__(self) -> None:
+        self.events: List[Dict] = []
+        self.__origin = time.perf_counter_ns()
+        self.__pid = os.getpid()
+
+    @staticmethod
+    def current() -> Optional["Tracer"]:
+        return Tracer.__current.get()
+
+    @contextlib.contextmanager
+    def collect(self) -> Iterator["Tracer"]:
+        """Make this the tracer which spans are recorded into"""
+        token = Tracer.__current.set(self)
+        try:
+            yield self
+        finally:
+            Tracer.__current.reset(token)
+
+    def complete(self, name: str, started: int, finished: int, args: Optional[Dict] = None) -> None:
+        """Record a span from its perf_counter_ns start and finish"""
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": (started - self.__origin) / 1000,
+            "dur": (finished - started) / 1000,
+            "pid": self.__pid,
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def span(name: str, **args: Any) -> Iterator[None]:
+        tracer = Tracer.__current.get()
+        if tracer is None:
+            yield
+            return
+
+        started = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            tracer.complete(name, started, time.perf_counter_ns(), args)
+
+    @staticmethod
+    def traced(function: Function) -> Function:
+        """Record a span named after the function each time it's called while tracing"""
+        name = function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            tracer = Tracer.__current.get()
+            if tracer is None:
+                return function(*args, **kwargs)
+
+            started = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tracer.complete(name, started, time.perf_counter_ns())
+
+        return wrapper  # type: ignore
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as trace_file:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, trace_file)
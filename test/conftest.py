@@ -0,0 +1,21 @@
+import datetime
+
+import pytest
+import pytz
+from act.generate_state import StateTreeGenerator
+
+
+@pytest.fixture
+def state_tree(request, tmp_path):
+    """A generated state tree of a day of downloads every ten minutes from the start of 4 January 2021, without observations.
+
+    Parameterise it indirectly to change any of the generator's settings, or observations, for example {"days": 3, "interval_seconds": 300}.
+    """
+    settings = dict(getattr(request, "param", {}))
+    observations = settings.pop("observations", False)
+    start = settings.pop("start", pytz.utc.localize(datetime.datetime(2021, 1, 4)))
+    days = settings.pop("days", 1)
+    settings = {"interval_seconds": 600, "history_points": 12, **settings}
+    generator = StateTreeGenerator(str(tmp_path / "home"), start, days, **settings)
+    generator.generate(observations=observations)
+    return generator
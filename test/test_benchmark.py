@@ -0,0 +1,23 @@
+import datetime
+import json
+
+import pytz
+import urllib3
+from act.benchmark import stand_in_services
+from act.emoncms import EmonCMS
+
+
+def test_stand_ins_answer_like_the_services(tmp_path, monkeypatch):
+    monkeypatch.setenv("ACT_STATE_ROOT", str(tmp_path))
+    monkeypatch.setenv("EMONCMS_API_KEY", "test")
+
+    with stand_in_services() as base_url:
+        monkeypatch.setenv("EMONCMS_URL", f"{base_url}emoncms/")
+        values = EmonCMS.get_feed_values(1, pytz.utc.localize(datetime.datetime(2021, 1, 4, 12)), 300, 10)
+        assert len(values) == 30
+        assert values[-1]["value"] == 1500.0
+
+        response = urllib3.PoolManager().request("POST", f"{base_url}melcloud/Device/SetAtw", body=json.dumps({"DeviceID": "1"}).encode("utf-8"))
+        update_gram = json.loads(response.data.decode("utf-8"))
+        assert update_gram["DeviceID"] == "1"
+        assert update_gram["SetTankWaterTemperature"] == 48.0
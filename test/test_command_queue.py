@@ -0,0 +1,109 @@
+import datetime
+import socket
+import time
+
+import pytest
+from act.action import Action
+from act.alter_setting import AlterSetting
+from act.command_queue import CommandQueue
+from act.redundant_actions import RedundantActions
+
+
+def test_a_newer_command_supersedes_a_waiting_one(tmp_path):
+    queue = CommandQueue(str(tmp_path / "commands.json"))
+    queue.enqueue(Action("Power", "true", "Cold"))
+    queue.enqueue(Action("SetTankWaterTemperature", 48, "Warm the tank"))
+    queue.enqueue(Action("Power", "false", "Warm enough"))
+    queue.enqueue(Action("ForcedHotWaterMode", "false", "Hot enough"))
+
+    sent = []
+    assert queue.drain(lambda command: sent.append((command["name"], command["value"]))) == 3
+    assert sent == [("ForcedHotWaterMode", "false"), ("SetTankWaterTemperature", "48"), ("Power", "false")]
+    assert not queue.pending()
+
+
+def test_failures_are_retried_with_backoff(tmp_path):
+    queue = CommandQueue(str(tmp_path / "commands.json"), base_backoff_seconds=0.2)
+    queue.enqueue(Action("Power", "true", "Cold"))
+
+    def fail(command):
+        raise Exception("MELCloud is down")
+
+    assert queue.drain(fail) == 0
+    assert queue.drain(fail) == 0
+    [waiting] = queue.pending()
+    assert waiting["attempts"] == 1
+    assert waiting["last_error"] == "MELCloud is down"
+
+    time.sleep(0.25)
+    assert queue.drain(lambda command: None) == 1
+    assert not queue.pending()
+
+
+def test_a_command_superseded_while_sending_is_still_sent(tmp_path):
+    queue = CommandQueue(str(tmp_path / "commands.json"))
+    queue.enqueue(Action("Power", "true", "Cold"))
+
+    sent = []
+
+    def send(command):
+        if not sent:
+            queue.enqueue(Action("Power", "false", "Warm enough"))
+        sent.append(command["value"])
+
+    assert queue.drain(send) == 2
+    assert sent == ["true", "false"]
+
+
+def test_stale_commands_are_dropped(tmp_path):
+    queue = CommandQueue(str(tmp_path / "commands.json"), max_age_seconds=0)
+    queue.enqueue(Action("Power", "true", "Cold"))
+    time.sleep(0.01)
+
+    assert queue.drain(lambda command: None) == 0
+    assert not queue.pending()
+
+
+def test_a_queue_which_cant_be_read_starts_empty(tmp_path):
+    path = tmp_path / "commands.json"
+    path.write_text('{"Power": {"id": "1", "na', encoding="utf-8")
+    queue = CommandQueue(str(path))
+
+    assert not queue.pending()
+    queue.enqueue(Action("Power", "true", "Cold"))
+    assert [command["value"] for command in queue.pending()] == ["true"]
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == ["commands.json", "commands.json.lock"]
+
+
+def test_a_command_is_journalled_once_when_it_is_sent(tmp_path, monkeypatch):
+    monkeypatch.setenv("ACT_STATE_ROOT", str(tmp_path))
+    queue = CommandQueue(str(tmp_path / "commands.json"), base_backoff_seconds=0.05)
+    queue.enqueue(Action("SetTankWaterTemperature", 48, "Warm the tank"))
+
+    def fail(command):
+        raise Exception("MELCloud is down")
+
+    assert queue.drain(fail) == 0
+    assert not RedundantActions.recent_commands(180, datetime.datetime.utcnow())
+
+    time.sleep(0.1)
+    assert queue.drain(lambda command: None) == 1
+    assert RedundantActions.recent_commands(180, datetime.datetime.utcnow()) == {"SetTankWaterTemperature": "48"}
+    assert len(list((tmp_path / "actions").rglob("*.json"))) == 1
+
+
+def test_a_stalled_melcloud_request_is_given_up_on(tmp_path, monkeypatch):
+    monkeypatch.setenv("MITS_CONTEXT_KEY", "test")
+    monkeypatch.setenv("DEVICE_ID", "1")
+    monkeypatch.setenv("ACT_MELCLOUD_RATE_FILE", str(tmp_path / "rate.json"))
+    monkeypatch.setenv("ACT_MELCLOUD_TIMEOUT_SECONDS", "0.2")
+
+    # Accepts connections but never answers
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        monkeypatch.setenv("MELCLOUD_URL", f"http://127.0.0.1:{listener.getsockname()[1]}/")
+        started = time.monotonic()
+        with pytest.raises(Exception):
+            AlterSetting().post_update("SetTankWaterTemperature", "48", shoosh=True)
+        assert time.monotonic() - started < 5
@@ -0,0 +1,85 @@
+import datetime
+import random
+
+import pytest
+from act.device_info_window import DeviceInfoWindow
+from act.last_time_stamp import LastTimeStamp
+
+
+def make_device_infos(size: int, seed: int):
+    generator = random.Random(seed)
+    start = datetime.datetime(2021, 1, 10, 6, 0, 0)
+    device_infos = []
+    for minute in range(size):
+        device_infos.append(
+            {
+                "LastTimeStamp": (start + datetime.timedelta(minutes=minute)).isoformat(),
+                "FlowTemperature": generator.choice([28, 30.5, 33, 36, 39.5]),
+                "ReturnTemperature": generator.choice([24, 26.5, 29, 31, 33.5]),
+                "HeatPumpFrequency": generator.choice([0, 0, 0, 32]),
+                "DefrostMode": generator.choice([0, 0, 0, 0, 1]),
+            }
+        )
+    return device_infos
+
+
+def scan_has_been_cold_since(device_infos, moment, threshold):
+    interesting_infos = [device_info for device_info in device_infos if LastTimeStamp.last_time_stamp_in_utc(device_info) >= moment]
+    return all(float(device_info["ReturnTemperature"]) < threshold for device_info in interesting_infos)
+
+
+def scan_has_been_hot_since(device_infos, moment, threshold):
+    interesting_infos = [device_info for device_info in device_infos if LastTimeStamp.last_time_stamp_in_utc(device_info) >= moment]
+    return all(float(device_info["FlowTemperature"]) > threshold for device_info in interesting_infos)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_timers_agree_with_scanning(seed):
+    device_infos = make_device_infos(60, seed)
+    window = DeviceInfoWindow()
+    for device_info in device_infos:
+        window.append(device_info)
+        latest = LastTimeStamp.last_time_stamp_in_utc(device_info)
+        # Only the most recent readings can be at or after the moments being checked
+        for dwell_minutes in [0, 3, 10]:
+            moment = latest - datetime.timedelta(minutes=dwell_minutes)
+            for threshold in [25, 29, 30.5, 34]:
+                assert window.state.has_been_cold_since(moment, threshold) == scan_has_been_cold_since(window[-12:], moment, threshold)
+                assert window.state.has_been_hot_since(moment, threshold) == scan_has_been_hot_since(window[-12:], moment, threshold)
+
+
+def test_bounded_window_forgets_old_readings():
+    device_infos = make_device_infos(100, 1)
+    window = DeviceInfoWindow(device_infos, maxlen=10)
+    assert len(window) == 10
+    assert window.count_since(LastTimeStamp.last_time_stamp_in_utc(device_infos[0])) == 10
+
+    moment = LastTimeStamp.last_time_stamp_in_utc(device_infos[-10])
+    for threshold in [25, 29, 30.5, 34]:
+        assert window.state.has_been_cold_since(moment, threshold) == scan_has_been_cold_since(device_infos[-10:], moment, threshold)
+
+
+def test_last_heating_and_defrost():
+    device_infos = make_device_infos(30, 2)
+    window = DeviceInfoWindow(device_infos)
+    heating = [device_info for device_info in device_infos if device_info["HeatPumpFrequency"]]
+    defrosts = [device_info for device_info in device_infos if device_info["DefrostMode"]]
+    assert window.state.last_heating == LastTimeStamp.last_time_stamp_in_utc(heating[-1])
+    assert window.state.last_defrost == LastTimeStamp.last_time_stamp_in_utc(defrosts[-1])
+
+
+def test_last_heating_leaves_with_its_reading():
+    device_infos = make_device_infos(20, 3)
+    for device_info in device_infos:
+        device_info["HeatPumpFrequency"] = 0
+    device_infos[2]["HeatPumpFrequency"] = 32
+    device_infos[2]["OperationMode"] = 1
+    device_infos[2]["ReturnTemperature"] = 30
+
+    window = DeviceInfoWindow(device_infos[:10], maxlen=10)
+    assert window.state.last_heating == LastTimeStamp.last_time_stamp_in_utc(device_infos[2])
+
+    window.extend(device_infos[10:])
+    assert window.state.last_heating is None
+    assert window.state.last_operation is None
+    assert window.state.return_temperature_at_last_operation is None
@@ -0,0 +1,69 @@
+import datetime
+import threading
+import time
+
+from act.deadlines import Deadlines
+from act.emoncms import EmonCMS
+
+
+def test_a_hung_dependency_is_given_up_on_for_the_rest_of_the_run():
+    hung = threading.Event()
+    calls = []
+
+    def hang():
+        calls.append("hang")
+        hung.wait(5)
+        return "late"
+
+    deadlines = Deadlines(run_seconds=5, dependency_seconds={"weather": 0.1})
+    started = time.monotonic()
+    with deadlines.collect():
+        assert Deadlines.call("weather", hang, lambda: "fallback") == "fallback"
+        assert Deadlines.call("weather", hang, lambda: "fallback") == "fallback"
+    hung.set()
+
+    assert time.monotonic() - started < 1
+    assert calls == ["hang"]
+    assert "0.1 seconds" in deadlines.degraded["weather"]
+
+
+def test_failures_fall_back_but_are_tried_again():
+    def fail():
+        raise Exception("No results")
+
+    deadlines = Deadlines(run_seconds=5)
+    with deadlines.collect():
+        assert Deadlines.call("emoncms", fail, lambda: 0) == 0
+        assert Deadlines.call("emoncms", lambda: 1, lambda: 0) == 1
+    assert deadlines.degraded == {"emoncms": "No results"}
+
+    assert Deadlines.call("emoncms", lambda: 2, lambda: 0) == 2
+
+
+def test_emoncms_falls_back_to_its_last_answer(tmp_path, monkeypatch):
+    monkeypatch.setenv("ACT_STATE_ROOT", str(tmp_path))
+    monkeypatch.setenv("EMONCMS_URL", "http://127.0.0.1:9/")
+    monkeypatch.setenv("EMONCMS_API_KEY", "key")
+    moment = datetime.datetime(2021, 6, 1, 12)
+
+    with Deadlines(run_seconds=5, dependency_seconds={"emoncms": 1}).collect():
+        assert EmonCMS.get_feed_value(7, moment) == {"time": None, "value": 0.0}
+
+    reading = {"time": moment.timestamp() * 1000 - 10000, "value": 900.0}
+    monkeypatch.setattr(EmonCMS, "get_feed_values", lambda feed_id, moment, duration, interval: [reading])
+    with Deadlines().collect():
+        assert EmonCMS.get_feed_value(7, moment)["value"] == 900.0
+
+    assert EmonCMS.last_known_feed_value(7, moment + datetime.timedelta(minutes=5)) == reading
+
+
+def test_an_old_emoncms_answer_is_not_used(tmp_path, monkeypatch):
+    monkeypatch.setenv("ACT_STATE_ROOT", str(tmp_path))
+    moment = datetime.datetime(2021, 6, 1, 12)
+    monkeypatch.setattr(EmonCMS, "get_feed_values", lambda feed_id, moment, duration, interval: [{"time": moment.timestamp() * 1000, "value": 900.0}])
+    with Deadlines().collect():
+        EmonCMS.get_feed_value(7, moment)
+
+    monkeypatch.setattr(EmonCMS, "get_feed_values", lambda feed_id, moment, duration, interval: None)
+    with Deadlines().collect():
+        assert EmonCMS.get_feed_value(7, moment + datetime.timedelta(hours=6)) == {"time": None, "value": 0.0}
@@ -0,0 +1,34 @@
+import datetime
+
+import pytz
+from act.decision_latency import DecisionLatency
+
+
+def test_latency_is_journalled_and_summarised(tmp_path, monkeypatch):
+    monkeypatch.setenv("ACT_STATE_ROOT", str(tmp_path))
+    start = pytz.utc.localize(datetime.datetime(2021, 1, 4, 23, 50))
+
+    for minute in range(20):
+        moment = start + datetime.timedelta(minutes=minute)
+        DecisionLatency(moment.isoformat(), device_age_seconds=30.0 + minute, evaluation_seconds=0.5, send_seconds=0.25, actions=minute % 2).record()
+
+    assert (tmp_path / "actions" / "latency" / "2021" / "01" / "05.jsonl").exists()
+
+    records = DecisionLatency.load(str(tmp_path), start, start + datetime.timedelta(minutes=15))
+    assert len(records) == 16
+    assert records[0]["total_seconds"] == 30.75
+
+    summary = DecisionLatency.summarise([record for record in records if record["actions"]], [50, 90])
+    assert summary["runs"] == 8
+    assert summary["device_age_seconds"] == {"p50": 38.0, "p90": 43.6, "max": 45.0}
+    assert summary["send_seconds"]["p50"] == 0.25
+
+
+def test_queued_commands_leave_the_send_and_total_out():
+    queued = DecisionLatency("2021-01-04T23:50:00+00:00", device_age_seconds=30.0, evaluation_seconds=0.5, actions=1).as_dict()
+    assert queued["send_seconds"] is None
+    assert queued["total_seconds"] is None
+
+    quiet = DecisionLatency("2021-01-04T23:50:00+00:00", device_age_seconds=30.0, evaluation_seconds=0.5).as_dict()
+    assert quiet["total_seconds"] == 30.5
+    assert DecisionLatency.summarise([queued, quiet], [50])["send_seconds"] is None
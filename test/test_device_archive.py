@@ -0,0 +1,104 @@
+import datetime
+import os
+
+import pytest
+import pytz
+from act.device_archive import DeviceArchive
+from act.device_history import DeviceHistory
+from act.device_info_loader import DeviceInfoLoader
+from act.device_json import DeviceJson
+
+
+def folder_size(folder):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(folder) for name in names)
+
+
+def without_history(device_infos):
+    return [{name: value for name, value in device_info.items() if name != "ListHistory24Formatters"} for device_info in device_infos]
+
+
+@pytest.mark.parametrize("state_tree", [{"days": 3, "history_points": 144}], indirect=True)
+def test_packed_days_read_like_the_loose_files(state_tree):
+    start = pytz.utc.localize(datetime.datetime(2021, 1, 4))
+    devices_folder = os.path.join(state_tree.state_root, "downloads", "raw")
+
+    moment = start + datetime.timedelta(days=2, hours=12)
+    loose = without_history(DeviceInfoLoader(devices_folder, "", workers=0).latest_device_infos(moment, count=1000))
+    month_folder = os.path.join(devices_folder, "2021", "01")
+    loose_size = folder_size(os.path.join(month_folder, "04")) + folder_size(os.path.join(month_folder, "05"))
+
+    assert DeviceArchive(devices_folder).compact(datetime.date(2021, 1, 6)) == 2
+    assert sorted(os.listdir(month_folder)) == ["04.pack", "05.pack", "06"]
+    assert DeviceArchive(devices_folder).compact(datetime.date(2021, 1, 6)) == 0
+    assert (os.path.getsize(os.path.join(month_folder, "04.pack")) + os.path.getsize(os.path.join(month_folder, "05.pack"))) * 10 < loose_size
+
+    serial = list(DeviceInfoLoader(devices_folder, "", workers=0).latest_device_infos(moment, count=1000))
+    pooled = list(DeviceInfoLoader(devices_folder, "", workers=2).latest_device_infos(moment, count=1000))
+    assert without_history(serial) == loose
+    assert without_history(pooled) == loose
+
+    # Fields the records don't keep come from the archive when asked for
+    assert serial[-1]["WifiAdapterStatus"] == "NORMAL"
+    assert "ListHistory24Formatters" not in serial[-1]
+
+
+@pytest.mark.parametrize("state_tree", [{"interval_seconds": 1800}], indirect=True)
+def test_a_day_packed_while_keeping_its_files_is_only_read_once(state_tree):
+    start = pytz.utc.localize(datetime.datetime(2021, 1, 4))
+    devices_folder = os.path.join(state_tree.state_root, "downloads", "raw")
+
+    moment = start + datetime.timedelta(days=2)
+    before = len(list(DeviceInfoLoader(devices_folder, "", workers=0).latest_device_infos(moment, count=1000)))
+    DeviceArchive(devices_folder).compact(datetime.date(2021, 1, 6), keep_files=True)
+
+    assert os.path.exists(os.path.join(devices_folder, "2021", "01", "04"))
+    assert len(list(DeviceInfoLoader(devices_folder, "", workers=0).latest_device_infos(moment, count=1000))) == before
+
+
+@pytest.mark.parametrize("state_tree", [{"interval_seconds": 300}], indirect=True)
+def test_downloads_are_replayed_from_keyframes_and_deltas(state_tree):
+    start = pytz.utc.localize(datetime.datetime(2021, 1, 4))
+    devices_folder = os.path.join(state_tree.state_root, "downloads", "raw")
+    day_folder = os.path.join(devices_folder, "2021", "01", "04")
+
+    middle = DeviceArchive.file_name(start + datetime.timedelta(hours=7, minutes=5))
+    with open(os.path.join(day_folder, middle), "rb") as devices:
+        expected = DeviceArchive.project(DeviceJson.loads(devices.read()))
+    loose = DeviceInfoLoader(devices_folder, "", workers=0).latest_device_infos(start + datetime.timedelta(days=1), count=1000)
+    flow_temperatures = {device_info["LastTimeStamp"]: device_info["FlowTemperature"] for device_info in loose}
+
+    DeviceArchive(devices_folder).compact(datetime.date(2021, 1, 5))
+    archive_path = day_folder + DeviceArchive.suffix
+
+    assert DeviceArchive.read_buildings(archive_path, middle) == expected
+    assert len(list(DeviceArchive.snapshots(archive_path))) == 288
+
+    rows = DeviceArchive.columns(archive_path, ["FlowTemperature", "LastTimeStamp"], start=start + datetime.timedelta(hours=7), end=start + datetime.timedelta(hours=9))
+    assert len(rows) == 25
+    assert rows[0][0] == DeviceArchive.file_name(start + datetime.timedelta(hours=7))
+    assert all(values["FlowTemperature"] == flow_temperatures[values["LastTimeStamp"]] for _, values in rows)
+
+
+@pytest.mark.parametrize("state_tree", [{"interval_seconds": 1800}], indirect=True)
+def test_a_download_arriving_after_its_day_was_packed_is_still_read(tmp_path, state_tree):
+    start = pytz.utc.localize(datetime.datetime(2021, 1, 4))
+    devices_folder = os.path.join(state_tree.state_root, "downloads", "raw")
+    day_folder = os.path.join(devices_folder, "2021", "01", "04")
+
+    late_name = DeviceArchive.file_name(start + datetime.timedelta(hours=23, minutes=30))
+    os.rename(os.path.join(day_folder, late_name), os.path.join(tmp_path, late_name))
+    DeviceArchive(devices_folder).compact(datetime.date(2021, 1, 5))
+    with DeviceHistory(str(tmp_path / "history.sqlite")) as history:
+        assert DeviceInfoLoader(devices_folder, "").ingest(history) == 47
+
+    os.makedirs(day_folder)
+    os.rename(os.path.join(tmp_path, late_name), os.path.join(day_folder, late_name))
+    with DeviceHistory(str(tmp_path / "history.sqlite")) as history:
+        assert DeviceInfoLoader(devices_folder, "").ingest(history) == 1
+
+    moment = start + datetime.timedelta(days=1)
+    for workers in [0, 2]:
+        device_infos = list(DeviceInfoLoader(devices_folder, "", workers=workers).latest_device_infos(moment, count=1000))
+        assert len(device_infos) == 48
+        assert device_infos[0]["LastTimeStamp"] > device_infos[1]["LastTimeStamp"]
+        assert device_infos[0]["WifiAdapterStatus"] == "NORMAL"
@@ -0,0 +1,146 @@
+import datetime
+import os
+import sqlite3
+
+import pytest
+import pytz
+from act.act import Act
+from act.device_archive import DeviceArchive
+from act.device_history import DeviceHistory
+from act.device_info_loader import DeviceInfoLoader
+from act.device_info_window import DeviceInfoWindow
+from act.device_record import DeviceRecord
+from act.emoncms import EmonCMS
+from act.generate_state import StateTreeGenerator
+
+
+def projected(device_infos):
+    return [{name: device_info.get(name) for name in DeviceRecord.fields} for device_info in device_infos]
+
+
+@pytest.mark.parametrize("state_tree", [{"days": 2, "interval_seconds": 900}], indirect=True)
+def test_the_history_loads_what_the_files_do_and_keeps_up_with_new_downloads(tmp_path, state_tree):
+    start = pytz.utc.localize(datetime.datetime(2021, 1, 4))
+    devices_folder = os.path.join(state_tree.state_root, "downloads", "raw")
+    DeviceArchive(devices_folder).compact(datetime.date(2021, 1, 5))
+    database = str(tmp_path / "history.sqlite")
+
+    moment = start + datetime.timedelta(days=1, hours=6)
+    from_files = list(DeviceInfoLoader(devices_folder, "", workers=0, history_database="").latest_device_infos(moment, count=50))
+    from_history = list(DeviceInfoLoader(devices_folder, "", workers=0, history_database=database).latest_device_infos(moment, count=50))
+
+    assert len(from_history) == 50
+    assert projected(from_history) == projected(from_files)
+    # Fields the history doesn't keep come from the download, even from a packed day
+    assert from_history[-1]["WifiAdapterStatus"] == "NORMAL"
+
+    with DeviceHistory(database) as history:
+        assert DeviceInfoLoader(devices_folder, "", history_database=database).ingest(history) == 0
+
+    later = pytz.utc.localize(datetime.datetime(2021, 1, 6))
+    StateTreeGenerator(state_tree.root, later, days=1, interval_seconds=3600, history_points=12).generate(observations=False)
+    with DeviceHistory(database) as history:
+        assert DeviceInfoLoader(devices_folder, "", history_database=database).ingest(history) == 24
+        assert history.latest("", later + datetime.timedelta(days=1), count=1)[0][0] == DeviceArchive.file_name(later + datetime.timedelta(hours=23))
+
+    with sqlite3.connect(database) as connection:
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        plan = " ".join(
+            str(row)
+            for row in connection.execute(
+                "EXPLAIN QUERY PLAN SELECT file FROM readings WHERE device_id = ? AND moment <= ? ORDER BY moment DESC LIMIT 600", ("1", "2021-01-05T00:00:00")
+            )
+        )
+    assert "PRIMARY KEY" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.parametrize("state_tree", [{"interval_seconds": 300}], indirect=True)
+def test_the_providers_only_use_the_fields_the_history_keeps(tmp_path, monkeypatch, state_tree):
+    start = pytz.utc.localize(datetime.datetime(2021, 1, 4))
+    monkeypatch.setenv("ACT_STATE_ROOT", state_tree.state_root)
+    monkeypatch.setenv("ACT_WEATHER_ROOT", state_tree.weather_root)
+    monkeypatch.setenv("ACT_HISTORY_DATABASE", str(tmp_path / "history.sqlite"))
+    monkeypatch.setenv("EMONCMS_SOLAR_FEED_ID", "1")
+    monkeypatch.setattr(EmonCMS, "feed_value_source", lambda feed_id, moment: {"time": None, "value": 0.0})
+
+    fetched = []
+    original = DeviceRecord.original
+    monkeypatch.setattr(DeviceRecord, "original", lambda record: fetched.append(record["LastTimeStamp"]) or original(record))
+
+    for hour in range(0, 24, 3):
+        moment = start + datetime.timedelta(hours=hour, minutes=7)
+        Act().act(calculation_moment=moment.isoformat()[:19], dry_run=True, metrics_file=None, trace_file=None, profile=None, adaptive=False)
+
+    # A tank held at the legionella temperature is when the hot water energy gets looked at
+    readings = list(DeviceInfoLoader(workers=0).latest_device_infos(moment))
+    readings.reverse()
+    kept = [{name: reading[name] for name in DeviceRecord.fields if name in reading} for reading in readings]
+    hot_tank = DeviceInfoWindow([DeviceRecord(dict(fields, SetTankWaterTemperature=60.0), lambda: {}) for fields in kept])
+    list(Act().get_non_conflicting_actions(moment, hot_tank))
+
+    assert not fetched
+
+
+@pytest.mark.parametrize("state_tree", [{"interval_seconds": 3600}], indirect=True)
+def test_an_older_history_gets_the_new_fields_filled_in(tmp_path, state_tree):
+    start = pytz.utc.localize(datetime.datetime(2021, 1, 4))
+    devices_folder = os.path.join(state_tree.state_root, "downloads", "raw")
+    database = str(tmp_path / "history.sqlite")
+    with sqlite3.connect(database) as connection:
+        connection.execute("CREATE TABLE readings (device_id TEXT NOT NULL, moment TEXT NOT NULL, file TEXT NOT NULL, PRIMARY KEY (device_id, moment)) WITHOUT ROWID")
+        connection.execute("CREATE TABLE ingested (source TEXT PRIMARY KEY)")
+        connection.execute("INSERT INTO ingested (source) VALUES ('2021/01/04/devices_2021-01-04T230000Z.json')")
+
+    latest = next(DeviceInfoLoader(devices_folder, "", workers=0, history_database=database).latest_device_infos(start + datetime.timedelta(days=1)))
+
+    assert "HotWaterEnergyConsumedRate1" in latest
+    assert latest["FlowTemperature"] > 0
+
+
+@pytest.mark.parametrize("state_tree", [{"interval_seconds": 3600}], indirect=True)
+def test_a_download_which_cant_be_read_yet_is_tried_again(tmp_path, state_tree):
+    start = pytz.utc.localize(datetime.datetime(2021, 1, 4))
+    devices_folder = os.path.join(state_tree.state_root, "downloads", "raw")
+    day_folder = os.path.join(devices_folder, "2021", "01", "04")
+    being_written = os.path.join(day_folder, DeviceArchive.file_name(start + datetime.timedelta(hours=23, minutes=30)))
+    with open(being_written, "w", encoding="utf-8") as partial_file:
+        partial_file.write('[{"Structure": ')
+
+    with DeviceHistory(str(tmp_path / "history.sqlite")) as history:
+        loader = DeviceInfoLoader(devices_folder, "", history_database=history.path)
+        assert loader.ingest(history) == 24
+
+        # A newer download is added before the one which was being written is finished
+        StateTreeGenerator(state_tree.root, start + datetime.timedelta(days=1), days=1, interval_seconds=86400, history_points=12).generate(observations=False)
+        assert loader.ingest(history) == 1
+        with open(os.path.join(day_folder, DeviceArchive.file_name(start + datetime.timedelta(hours=23))), encoding="utf-8") as finished_file:
+            finished = finished_file.read()
+        with open(being_written, "w", encoding="utf-8") as partial_file:
+            partial_file.write(finished)
+        assert loader.ingest(history) == 1
+        assert not history.unreadable()
+
+        # One which never becomes readable is given up on
+        broken = os.path.join(devices_folder, "2021", "01", "05", DeviceArchive.file_name(start + datetime.timedelta(days=1, hours=12)))
+        with open(broken, "w", encoding="utf-8") as broken_file:
+            broken_file.write("[")
+        for _ in range(DeviceInfoLoader.unreadable_attempts):
+            assert loader.ingest(history) == 0
+        assert not history.unreadable()
+        assert history.is_ingested(os.path.relpath(broken, devices_folder))
+
+
+@pytest.mark.parametrize("state_tree", [{"interval_seconds": 3600}], indirect=True)
+def test_a_history_far_behind_catches_up_a_bit_each_run(tmp_path, monkeypatch, state_tree):
+    start = pytz.utc.localize(datetime.datetime(2021, 1, 4))
+    devices_folder = os.path.join(state_tree.state_root, "downloads", "raw")
+    database = str(tmp_path / "history.sqlite")
+    monkeypatch.setenv("ACT_HISTORY_INGEST_LIMIT", "10")
+    moment = start + datetime.timedelta(days=1)
+
+    from_files = projected(DeviceInfoLoader(devices_folder, "", workers=0, history_database="").latest_device_infos(moment, count=24))
+    for caught_up in [10, 20, 24]:
+        assert projected(DeviceInfoLoader(devices_folder, "", workers=0, history_database=database).latest_device_infos(moment, count=24)) == from_files
+        with DeviceHistory(database) as history:
+            assert len(history.latest("", moment, count=100)) == caught_up
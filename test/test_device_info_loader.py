@@ -0,0 +1,26 @@
+import datetime
+import os
+
+import pytz
+from act.device_info_loader import DeviceInfoLoader
+
+
+def test_parsing_in_a_pool_keeps_the_order_and_skips_bad_files(state_tree):
+    start = pytz.utc.localize(datetime.datetime(2021, 1, 4))
+    devices_folder = os.path.join(state_tree.state_root, "downloads", "raw")
+
+    newest_folder = sorted(os.path.join(root, name) for root, _, names in os.walk(devices_folder) for name in names)[-1]
+    with open(os.path.join(os.path.dirname(newest_folder), "devices_2099-01-01T000000Z.json"), "w", encoding="utf-8") as bad_file:
+        bad_file.write('[{"Structure": ')
+
+    moment = start + datetime.timedelta(hours=20)
+    serial = list(DeviceInfoLoader(devices_folder, "", workers=0).latest_device_infos(moment, count=50))
+    pooled = list(DeviceInfoLoader(devices_folder, "", workers=2).latest_device_infos(moment, count=50))
+
+    assert len(serial) == 50
+    assert [dict(device_info) for device_info in pooled] == [dict(device_info) for device_info in serial]
+    assert pooled[0]["LastTimeStamp"] > pooled[-1]["LastTimeStamp"]
+
+    everything = list(DeviceInfoLoader(devices_folder, "", workers=2).latest_device_infos(moment, count=1000))
+    assert [device_info["LastTimeStamp"] for device_info in everything] == sorted((device_info["LastTimeStamp"] for device_info in everything), reverse=True)
+    assert len(everything) == 121
@@ -0,0 +1,29 @@
+import json
+
+import act.device_json
+from act.device_json import DeviceJson
+
+
+def test_the_history_is_cut_out_before_decoding(monkeypatch):
+    device = {
+        "DeviceID": 1,
+        "Name": 'Tricky [name] with a \\" quote',
+        "ListHistory24Formatters": [{"Name": "Flow]Temperature[", "Period": 600, "Data": [20.0, None, 32.5]}, {"Name": "Return", "Data": [[1], []]}],
+        "Power": True,
+    }
+    document = json.dumps([{"Structure": {"Devices": [{"DeviceID": 1, "Device": device}, {"DeviceID": 2, "Device": dict(device, DeviceID=2)}]}}]).encode("utf-8")
+
+    expected = json.loads(document)
+    for entry in expected[0]["Structure"]["Devices"]:
+        entry["Device"]["ListHistory24Formatters"] = []
+
+    assert json.loads(DeviceJson.without_history(document)) == expected
+    assert DeviceJson.loads(document) == expected
+
+    monkeypatch.setattr(act.device_json, "orjson", None)
+    assert DeviceJson.loads(document) == expected
+
+
+def test_documents_which_are_not_well_formed_are_left_for_the_decoder():
+    document = b'[{"ListHistory24Formatters": [{"Data": [1, 2'
+    assert DeviceJson.without_history(document) == document
@@ -0,0 +1,33 @@
+import pytest
+from act.device_record import DeviceRecord
+
+
+def test_fields_are_converted_once_and_others_fetched_when_needed():
+    fetched = []
+
+    def fetch_original():
+        fetched.append(True)
+        return {"Power": 1, "FlowTemperature": "31.5", "LastTimeStamp": "2021-01-04T12:00:00", "Rarely": "used"}
+
+    record = DeviceRecord(fetch_original(), fetch_original)
+    fetched.clear()
+
+    assert record["FlowTemperature"] == 31.5
+    assert record["Power"] is True
+    assert "TankWaterTemperature" not in record
+    assert record.get("TankWaterTemperature", 45) == 45
+    assert not hasattr(record, "__dict__")
+    assert not fetched
+
+    assert record["Rarely"] == "used"
+    assert record.get("Missing") is None
+    assert fetched == [True]
+
+
+def test_a_missing_field_says_which_reading_it_was():
+    record = DeviceRecord({"LastTimeStamp": "2021-01-04T12:00:00"})
+
+    with pytest.raises(KeyError, match="2021-01-04T12:00:00 has no ReturnTemperature"):
+        record["ReturnTemperature"]  # pylint: disable=pointless-statement
+
+    assert dict(record) == {"LastTimeStamp": "2021-01-04T12:00:00"}
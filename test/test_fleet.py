@@ -0,0 +1,32 @@
+import json
+
+from act.fleet import Fleet
+from act.installation import Installation
+from act.state_paths import StatePaths
+
+
+def test_each_installation_uses_its_own_settings_and_failures_are_isolated(tmp_path, state_tree):
+    generator = state_tree
+
+    configuration = tmp_path / "fleet.json"
+    configuration.write_text(
+        json.dumps(
+            {
+                "installations": [
+                    {"name": "home", "environment": {"ACT_STATE_ROOT": generator.state_root, "ACT_WEATHER_ROOT": generator.weather_root}},
+                    {"name": "empty", "environment": {"ACT_STATE_ROOT": str(tmp_path / "missing")}},
+                ]
+            }
+        ),
+        encoding="utf-8",
+    )
+    installations = Fleet.load(str(configuration))
+
+    with installations[1].activate():
+        assert StatePaths.state_root() == str(tmp_path / "missing")
+    assert Installation.current() is None
+
+    outcomes = Fleet(installations, workers=2, dry_run=True).run_once("2021-01-04T23:55:00")
+
+    assert outcomes["home"] == "ok"
+    assert outcomes["empty"].startswith("failed")
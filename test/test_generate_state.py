@@ -0,0 +1,32 @@
+import datetime
+import glob
+import json
+import os
+import pathlib
+
+import pytest
+from act.effective_temperature import EffectiveTemperature
+
+
+@pytest.mark.parametrize("state_tree", [{"weather_interval_seconds": 600, "observations": True}], indirect=True)
+def test_trees_are_laid_out_like_production(state_tree):
+    generator = state_tree
+
+    weather_files = [path for path in pathlib.Path(generator.weather_root).rglob("*") if path.is_file()]
+    assert sum(len(path.read_text(encoding="utf-8").splitlines()) for path in weather_files) == 144
+
+    device_files = sorted(glob.glob(os.path.join(generator.state_root, "downloads", "raw", "2021", "01", "04", "devices_*.json")))
+    assert len(device_files) == 144
+    with open(device_files[-1], encoding="utf-8") as devices:
+        device_info = json.load(devices)[0]["Structure"]["Devices"][0]["Device"]
+    assert device_info["LastTimeStamp"] == "2021-01-04T23:50:00"
+    assert len(device_info["ListHistory24Formatters"][0]["Data"]) == 12
+
+    weather = EffectiveTemperature.walk_files(generator.weather_root, "2021-01-04 12:01:00", "2021-01-04 11:01:00")
+    assert weather is not None
+    assert weather["moment"] == datetime.datetime(2021, 1, 4, 12, 0, 0)
+
+    with open(os.path.join(generator.state_root, "observations", "values.txt"), encoding="utf-8") as observations:
+        lines = observations.readlines()
+    assert "OperationMode" in lines[0].split("\t")
+    assert len(lines) == 145
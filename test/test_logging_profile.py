@@ -0,0 +1,50 @@
+import io
+import json
+import logging
+
+import pytest
+import structlog
+from act.logging_profile import Lazy, LoggingProfile
+
+
+def test_lazy_values_are_only_worked_out_when_rendered():
+    calls = []
+
+    def describe():
+        calls.append(1)
+        return "for another 60 seconds"
+
+    output = io.StringIO()
+    logger = structlog.wrap_logger(
+        structlog.PrintLogger(output),
+        wrapper_class=structlog.make_filtering_bound_logger(logging.INFO),
+        processors=[structlog.processors.JSONRenderer()],
+    )
+
+    logger.debug("Filtered", wait=Lazy(describe))
+    assert not calls
+
+    logger.info("Shown", wait=Lazy(describe))
+    assert calls == [1]
+    assert json.loads(output.getvalue()) == {"event": "Shown", "wait": "for another 60 seconds"}
+
+
+def test_unknown_profiles_are_rejected():
+    with pytest.raises(Exception, match="no logging profile called 'verbose'"):
+        LoggingProfile.configure("verbose")
+
+
+def test_module_loggers_follow_a_later_profile(capsys):
+    previous = structlog.get_config()
+    logger = structlog.get_logger()
+    try:
+        LoggingProfile.configure("production")
+        logger.info("Production")
+        assert json.loads(capsys.readouterr().out)["event"] == "Production"
+
+        LoggingProfile.configure("console")
+        logger.info("Console")
+        output = capsys.readouterr().out
+        assert "Console" in output and not output.startswith("{")
+    finally:
+        structlog.configure(**previous)
@@ -0,0 +1,31 @@
+import datetime
+import os
+
+from act.mapped_lines import MappedLines
+from act.state_change import StateChange
+
+
+def test_lines_come_back_last_first_without_their_endings(tmp_path):
+    path = str(tmp_path / "lines.txt")
+    for text in ["a\nb\r\nc\n", "a\nb\r\nc"]:
+        with open(path, "w", encoding="utf-8", newline="") as text_file:
+            text_file.write(text)
+        assert list(MappedLines.backwards(path)) == ["c", "b", "a"]
+        assert MappedLines.first(path) == "a"
+
+    with open(path, "w", encoding="utf-8") as text_file:
+        text_file.write("")
+    assert not list(MappedLines.backwards(path))
+
+
+def test_the_last_state_change_is_found_from_the_end(tmp_path, monkeypatch):
+    monkeypatch.setenv("ACT_STATE_ROOT", str(tmp_path))
+    os.makedirs(tmp_path / "observations")
+    with open(tmp_path / "observations" / "values.txt", "w", encoding="utf-8") as observations:
+        observations.write("Moment\tPower\tOperationMode\n")
+        observations.write("2021-01-04T10:00:00Z\ttrue\t2\n")
+        observations.write("2021-01-04T10:01:00Z\ttrue\t1\n")
+        observations.write("2021-01-04T10:02:00Z\ttrue\t2\n")
+        observations.write("2021-01-04T10:03:00Z\tfalse\t2")
+
+    assert StateChange.last_state_change() == datetime.datetime(2021, 1, 4, 10, 1)
@@ -0,0 +1,88 @@
+import datetime
+import json
+
+import pytz
+from act.action_manage_tank_temperature import ManageTankTemperature
+from act.action_octopus_go import OctopusGo
+from act.action_stop_forcing_hot_water import StopForcingHotWater
+from act.device_info_loader import DeviceInfoLoader
+from act.installation import Installation
+from act.next_evaluation import EvaluationSchedule, NextEvaluation
+from act.time_based_criteria import TimeBasedCriteria
+
+
+def test_the_earliest_hint_wins():
+    moment = pytz.utc.localize(datetime.datetime(2021, 1, 4, 12))
+    NextEvaluation.hint(moment, "ignored when nothing is collecting")
+
+    next_evaluation = NextEvaluation(moment)
+    with next_evaluation.collect():
+        NextEvaluation.hint(moment + datetime.timedelta(minutes=15), "dwell")
+        NextEvaluation.hint(None, "no idea")
+        NextEvaluation.hint(moment + datetime.timedelta(minutes=5), "schedule")
+
+    assert next_evaluation.moment == moment + datetime.timedelta(minutes=5)
+    assert next_evaluation.reason == "schedule"
+
+
+def test_time_windows_hint_their_next_boundary():
+    london = pytz.timezone("Europe/London")
+    moment = london.localize(datetime.datetime(2021, 1, 4, 23, 50))
+
+    next_evaluation = NextEvaluation(moment)
+    with next_evaluation.collect():
+        TimeBasedCriteria.warm_part_of_day(moment)
+        OctopusGo.power_will_be_cheap_for_next_fifteen_minutes(moment, [])
+
+    assert next_evaluation.moment == london.localize(datetime.datetime(2021, 1, 5, 0, 31))
+    assert next_evaluation.reason == "The cheap Octopus Go window starts or ends"
+
+
+def test_runs_are_skipped_until_the_moment_unless_the_device_info_changes(tmp_path, state_tree):
+    moment = pytz.utc.localize(datetime.datetime(2021, 1, 4, 12))
+
+    with Installation("home", {"ACT_STATE_ROOT": state_tree.state_root}).activate():
+        schedule = EvaluationSchedule(str(tmp_path / "next_evaluation.json"), max_skip_seconds=900)
+        assert not schedule.should_skip(moment)
+
+        next_evaluation = NextEvaluation(moment)
+        with next_evaluation.collect():
+            NextEvaluation.hint(moment + datetime.timedelta(hours=2), "dwell")
+        schedule.save(next_evaluation)
+
+        # The skip is capped
+        assert schedule.should_skip(moment + datetime.timedelta(minutes=1))
+        assert not schedule.should_skip(moment + datetime.timedelta(minutes=15))
+
+        scheduled = json.loads((tmp_path / "next_evaluation.json").read_text(encoding="utf-8"))
+        scheduled["device_info"]["Power"] = not scheduled["device_info"]["Power"]
+        (tmp_path / "next_evaluation.json").write_text(json.dumps(scheduled), encoding="utf-8")
+        assert not schedule.should_skip(moment + datetime.timedelta(minutes=1))
+
+
+def test_small_temperature_changes_are_ignored():
+    before = {"Power": True, "OutdoorTemperature": 5.0, "TankWaterTemperature": 45.0}
+
+    assert not EvaluationSchedule.changed(before, dict(before, OutdoorTemperature=5.5))
+    assert EvaluationSchedule.changed(before, dict(before, TankWaterTemperature=42.0)) == {"TankWaterTemperature": [45.0, 42.0]}
+
+
+def test_forced_hot_water_near_its_target_is_never_deferred(tmp_path, state_tree):
+    moment = pytz.utc.localize(datetime.datetime(2021, 1, 4, 12))
+
+    with Installation("home", {"ACT_STATE_ROOT": state_tree.state_root}).activate():
+        device_infos = list(DeviceInfoLoader().window(moment))
+        forced = dict(device_infos[-1], ForcedHotWaterMode=True, TankWaterTemperature=47.0, SetTankWaterTemperature=48.0)
+        warming = dict(device_infos[-1], TankWaterTemperature=39.0, SetTankWaterTemperature=40.0)
+
+        for latest in [forced, warming]:
+            next_evaluation = NextEvaluation(moment)
+            with next_evaluation.collect():
+                NextEvaluation.hint(moment + datetime.timedelta(hours=2), "dwell")
+                list(StopForcingHotWater.stop_forcing_hot_water(moment, device_infos[:-1] + [latest]))
+                list(ManageTankTemperature.manage_tank_temperature(moment, device_infos[:-1] + [latest]))
+            assert next_evaluation.moment == moment
+
+            schedule = EvaluationSchedule(str(tmp_path / "next_evaluation.json"), max_skip_seconds=900)
+            schedule.save(next_evaluation)
+            assert not schedule.should_skip(moment + datetime.timedelta(minutes=1))
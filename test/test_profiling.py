@@ -0,0 +1,15 @@
+import pstats
+
+from act.profiling import Profiling
+
+
+def test_profile_writes_stats_and_allocations(tmp_path):
+    with Profiling.profile(None, "ignored"):
+        pass
+
+    with Profiling.profile(str(tmp_path), "act_2021-01-04T120000"):
+        readings = [list(range(100)) for _ in range(100)]
+
+    assert len(readings) == 100
+    assert pstats.Stats(str(tmp_path / "act_2021-01-04T120000.pstats")).total_calls > 0
+    assert (tmp_path / "act_2021-01-04T120000.allocations.txt").read_text(encoding="utf-8").startswith("Still allocated")
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+from act.alter_setting import AlterSetting
+from act.installation import Installation
+from act.rate_limiter import TokenBucket
+
+
+def test_reserved_tokens_are_kept_for_priority_requests(tmp_path):
+    path = str(tmp_path / "rate.json")
+    bucket = TokenBucket(path, rate_per_second=0.001, capacity=3, reserved=1)
+
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() > 0
+
+    # Another process sees the same bucket
+    assert TokenBucket(path, 0.001, 3, 1).try_acquire(priority=True) == 0
+    assert bucket.try_acquire(priority=True) > 0
+
+    with pytest.raises(TimeoutError, match="Gave up waiting"):
+        bucket.acquire(timeout=1)
+
+
+def test_a_waiting_priority_request_goes_first(tmp_path):
+    bucket = TokenBucket(str(tmp_path / "rate.json"), rate_per_second=0.001, capacity=2, reserved=1)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire(priority=True) == 0
+
+    checked = threading.Event()
+    waits = []
+
+    def send_priority():
+        waits.append(bucket.try_acquire(priority=True))
+        checked.wait()
+        waits.append(fast.try_acquire(priority=True))
+
+    # Refilling quickly, so only the waiting priority sender holds the others back
+    fast = TokenBucket(bucket.path, rate_per_second=1000, capacity=2, reserved=1)
+    sender = threading.Thread(target=send_priority)
+    sender.start()
+    while not waits:
+        pass
+    assert waits[0] > 0
+    assert fast.try_acquire() > 0
+
+    checked.set()
+    sender.join()
+    assert waits[1] == 0
+    fast.acquire(timeout=1)
+
+
+def test_stopping_forced_hot_water_is_safety_critical():
+    assert AlterSetting.is_safety_critical("ForcedHotWaterMode", False)
+    assert AlterSetting.is_safety_critical("ForcedHotWaterMode", "false")
+    assert not AlterSetting.is_safety_critical("ForcedHotWaterMode", "true")
+    assert not AlterSetting.is_safety_critical("Power", False)
+
+
+def test_a_state_file_cut_short_starts_the_bucket_again(tmp_path):
+    path = tmp_path / "rate.json"
+    path.write_bytes(b'{"tokens": 0.5, "upd\xff')
+    bucket = TokenBucket(str(path), rate_per_second=0.001, capacity=3, reserved=1)
+
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() > 0
+
+
+def test_each_account_has_its_own_bucket(monkeypatch):
+    monkeypatch.delenv("ACT_MELCLOUD_RATE_FILE", raising=False)
+    with Installation("home", {"MITS_CONTEXT_KEY": "home-key", "ACT_MELCLOUD_BURST": "3"}).activate():
+        home = TokenBucket.for_melcloud()
+    with Installation("office", {"MITS_CONTEXT_KEY": "office-key"}).activate():
+        office = TokenBucket.for_melcloud()
+    with Installation("flat", {"MITS_CONTEXT_KEY": "home-key"}).activate():
+        flat = TokenBucket.for_melcloud()
+
+    assert home.path != office.path
+    assert home.path == flat.path
+    assert "home-key" not in home.path
+    assert home.capacity == 3
@@ -0,0 +1,57 @@
+import datetime
+import os
+
+import pytest
+from act.action import Action
+from act.alter_setting import AlterSetting
+from act.benchmark import stand_in_services
+from act.command_queue import CommandQueue
+from act.redundant_actions import RedundantActions
+
+
+def test_actions_matching_the_device_or_a_recent_command_are_dropped(tmp_path, monkeypatch):
+    monkeypatch.setenv("ACT_STATE_ROOT", str(tmp_path))
+    device_info = {"Power": True, "SetHeatFlowTemperatureZone1": 40.0, "ForcedHotWaterMode": False, "SetTankWaterTemperature": 45.0}
+
+    AlterSetting().record_action("ForcedHotWaterMode", "true", "Boost", "Test")
+    AlterSetting().record_action("SetTankWaterTemperature", "48", "Warmer", "Test")
+
+    actions = [
+        Action("Power", "true", "Already on"),
+        Action("SetHeatFlowTemperatureZone1", "40", "Already set"),
+        # The device hasn't caught up with the boost yet
+        Action("ForcedHotWaterMode", "false", "Stop boosting"),
+        Action("SetTankWaterTemperature", 48, "Just sent"),
+    ]
+
+    assert [action.name for action in RedundantActions.remove(actions, device_info)] == ["ForcedHotWaterMode"]
+
+    monkeypatch.setenv("ACT_SETTLE_SECONDS", "0")
+    assert [action.name for action in RedundantActions.remove(actions, device_info)] == ["SetTankWaterTemperature"]
+
+
+def test_a_command_waiting_to_be_sent_is_what_the_setting_is_taken_to_be(tmp_path, monkeypatch):
+    monkeypatch.setenv("ACT_STATE_ROOT", str(tmp_path))
+    device_info = {"Power": False, "SetTankWaterTemperature": 45.0}
+    CommandQueue.for_state_root().enqueue(Action("Power", "true", "Cold"))
+
+    actions = [Action("Power", "true", "Still cold"), Action("SetTankWaterTemperature", 48, "Warmer")]
+    assert [action.name for action in RedundantActions.remove(actions, device_info)] == ["SetTankWaterTemperature"]
+
+
+def test_only_updates_melcloud_accepted_are_journalled(tmp_path, monkeypatch):
+    monkeypatch.setenv("ACT_STATE_ROOT", str(tmp_path))
+    monkeypatch.setenv("MITS_CONTEXT_KEY", "test")
+    monkeypatch.setenv("DEVICE_ID", "1")
+    monkeypatch.setenv("ACT_MELCLOUD_RATE_FILE", str(tmp_path / "rate.json"))
+
+    # Nothing is listening here
+    monkeypatch.setenv("MELCLOUD_URL", "http://127.0.0.1:1/melcloud/")
+    with pytest.raises(Exception):
+        AlterSetting().send_update_to_melcloud("SetTankWaterTemperature", "48", "Warmer", "Test", shoosh=True)
+    assert not os.path.exists(tmp_path / "actions")
+
+    with stand_in_services() as base_url:
+        monkeypatch.setenv("MELCLOUD_URL", f"{base_url}melcloud/")
+        AlterSetting().send_update_to_melcloud("SetTankWaterTemperature", "48", "Warmer", "Test", shoosh=True)
+    assert RedundantActions.recent_commands(180, datetime.datetime.utcnow()) == {"SetTankWaterTemperature": "48"}
@@ -0,0 +1,52 @@
+import random
+import statistics
+
+import pytest
+from act.action_turn_off_power import TurnOffPower
+from act.device_info_window import DeviceInfoWindow
+from act.rolling_aggregate import RollingAggregate
+
+
+@pytest.mark.parametrize(["size", "lag"], [(1, 0), (3, 0), (10, 0), (3, 3)])
+def test_matches_recomputing_from_scratch(size, lag):
+    generator = random.Random(size + lag)
+    aggregate = RollingAggregate(size, lag)
+    values = []
+    for _ in range(200):
+        value = generator.choice([0, 0, 20.5, 26, 31.5, 40])
+        values.append(value)
+        aggregate.append(value)
+
+        end = max(0, len(values) - lag)
+        batch = values[max(0, end - size) : end]
+        if not batch:
+            assert aggregate.count == 0
+            continue
+
+        assert aggregate.count == len(batch)
+        assert aggregate.total == pytest.approx(sum(batch))
+        assert aggregate.mean == pytest.approx(statistics.mean(batch))
+        assert aggregate.minimum == min(batch)
+        assert aggregate.maximum == max(batch)
+
+
+def test_total_is_exactly_zero_when_all_values_are_zero():
+    aggregate = RollingAggregate(3)
+    for value in [0.1, 0.2, 0.3, 0, 0, 0]:
+        aggregate.append(value)
+    assert aggregate.total == 0
+
+
+def test_mean_of_nothing_is_an_error():
+    with pytest.raises(statistics.StatisticsError):
+        _ = RollingAggregate(3).mean
+
+
+def test_a_reading_without_a_number_is_left_out_of_the_window_aggregates():
+    window = DeviceInfoWindow([{"HeatPumpFrequency": 30}, {"HeatPumpFrequency": None}])
+    frequencies = window.rolling("HeatPumpFrequency", 3)
+    window.append({"HeatPumpFrequency": None})
+    window.append({"HeatPumpFrequency": 0})
+
+    assert frequencies.count == 2
+    assert TurnOffPower.was_demand_in(frequencies) == TurnOffPower.was_demand([{"HeatPumpFrequency": 30}, {"HeatPumpFrequency": 0}])
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+from act.run_lock import RunLock
+from act.run_metrics import RunMetrics
+
+
+def test_an_overlapping_run_is_skipped_and_counted(tmp_path):
+    path = str(tmp_path / "run.lock")
+    metrics = RunMetrics()
+
+    with metrics.collect():
+        with RunLock(path).hold() as first:
+            assert first
+            with RunLock(path).hold() as second:
+                assert not second
+
+        with RunLock(path).hold() as third:
+            assert third
+
+    with open(f"{path}.totals", encoding="utf-8") as totals_file:
+        assert json.load(totals_file) == {"acquired": 2, "skipped": 1}
+    assert metrics.counters == {"run_lock_acquired": 2, "run_lock_skipped": 1}
+
+
+def test_a_run_in_the_same_process_is_never_stopped(tmp_path):
+    path = str(tmp_path / "run.lock")
+    with RunLock(path).hold():
+        with RunLock(path, "preempt", wait_seconds=0.2, stale_seconds=0).hold() as preempting:
+            assert not preempting
+
+
+def test_waiting_gives_up_at_the_deadline(tmp_path):
+    path = str(tmp_path / "run.lock")
+    with RunLock(path).hold():
+        with RunLock(path, "wait", wait_seconds=0.2).hold() as waiting:
+            assert not waiting
+
+
+def test_an_unknown_policy_is_rejected(tmp_path):
+    with pytest.raises(Exception, match="no run lock policy"):
+        RunLock(str(tmp_path / "run.lock"), "queue")
@@ -0,0 +1,25 @@
+from act.run_metrics import RunMetrics
+
+
+def test_stages_are_recorded_against_the_current_run(tmp_path):
+    with RunMetrics.measure("ignored"):
+        pass
+
+    metrics = RunMetrics()
+    with metrics.collect():
+        for _ in range(3):
+            with RunMetrics.measure("weather"):
+                pass
+        with RunMetrics.measure("load"):
+            pass
+
+    assert RunMetrics.current() is None
+    assert metrics.calls == {"weather": 3, "load": 1}
+    assert metrics.elapsed >= metrics.seconds["weather"] + metrics.seconds["load"]
+
+    path = tmp_path / "act.prom"
+    metrics.write_prometheus(str(path))
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert 'act_stage_calls{stage="weather"} 3' in lines
+    assert any(line.startswith('act_stage_seconds{stage="load"} ') for line in lines)
+    assert list(tmp_path.iterdir()) == [path]
@@ -0,0 +1,39 @@
+import threading
+import time
+
+from act.sampling_profiler import SamplingProfiler
+
+
+def spin(seconds):
+    finish = time.perf_counter() + seconds
+    while time.perf_counter() < finish:
+        pass
+
+
+def test_busy_code_shows_up_in_the_collapsed_stacks(tmp_path):
+    path = tmp_path / "act.folded"
+    with SamplingProfiler(str(path), interval_seconds=0.001) as profiler:
+        spin(0.2)
+
+    assert profiler.samples > 10
+    lines = path.read_text(encoding="utf-8").splitlines()
+    # The last sample or so can land while the main thread is waiting to join the sampler, which isn't counted
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) >= profiler.samples - 2
+    assert any(";spin (test_sampling_profiler.py:" in line for line in lines)
+
+
+def test_waiting_threads_and_quiet_periods_are_left_out(tmp_path):
+    stopping = threading.Event()
+    waiter = threading.Thread(target=stopping.wait, daemon=True)
+    waiter.start()
+
+    profiler = SamplingProfiler(str(tmp_path / "act.folded"), only_while_busy=True)
+    profiler.sample()
+    assert profiler.samples == 0
+
+    with SamplingProfiler.busy():
+        profiler.sample()
+    stopping.set()
+
+    assert profiler.samples == 1
+    assert not any("(threading.py:" in stack.rsplit(";", 1)[-1] for stack in profiler.stacks())
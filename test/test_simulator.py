@@ -0,0 +1,33 @@
+import datetime
+import os
+
+import pytz
+import structlog
+from act.effective_temperature import EffectiveTemperature
+from act.emoncms import EmonCMS
+from act.simulator import Simulator
+
+
+def test_a_day_keeps_the_house_warm():
+    start = pytz.utc.localize(datetime.datetime(2021, 1, 4))
+
+    summary = Simulator(start, days=1, mean_outdoor_temperature=4, seed=1).run()
+
+    assert summary["electricity_kwh"] > 0
+    assert 1 < summary["coefficient_of_performance"] < 6
+    assert summary["mean_occupied_room_temperature"] > 18
+    assert summary["commands"].get("Power", 0) > 0
+    assert summary["evaluations"].get("failed", 0) == 0
+
+
+def test_sources_logging_and_environment_are_restored(monkeypatch):
+    start = pytz.utc.localize(datetime.datetime(2021, 1, 4))
+    monkeypatch.delenv("EMONCMS_SOLAR_FEED_ID", raising=False)
+    logging_before = structlog.get_config()
+
+    Simulator(start, days=1).run()
+
+    assert EffectiveTemperature.statistics_source is None
+    assert EmonCMS.feed_value_source is None
+    assert "EMONCMS_SOLAR_FEED_ID" not in os.environ
+    assert structlog.get_config() == logging_before
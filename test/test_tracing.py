@@ -0,0 +1,29 @@
+import json
+
+from act.run_metrics import RunMetrics
+from act.tracing import Tracer
+
+
+@Tracer.traced
+def lookup(value):
+    with Tracer.span("inner", value=value):
+        return value * 2
+
+
+def test_spans_nest_and_are_written_as_trace_events(tmp_path):
+    assert lookup(1) == 2
+
+    tracer = Tracer()
+    with tracer.collect():
+        with RunMetrics.measure("outer"):
+            assert lookup(2) == 4
+
+    path = tmp_path / "trace.json"
+    tracer.write(str(path))
+    events = {event["name"]: event for event in json.loads(path.read_text(encoding="utf-8"))["traceEvents"]}
+
+    assert set(events) == {"outer", "lookup", "inner"}
+    assert events["inner"]["args"] == {"value": 2}
+    for parent, child in [("outer", "lookup"), ("lookup", "inner")]:
+        assert events[parent]["ts"] <= events[child]["ts"]
+        assert events[child]["ts"] + events[child]["dur"] <= events[parent]["ts"] + events[parent]["dur"]